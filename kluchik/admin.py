@@ -66,42 +66,21 @@ class AgencyAdmin(admin.ModelAdmin):
     list_display = (
         "name",
         "created_at",
-        "get_subscriber_count",
-        "get_agent_count",
-        "get_advertisement_count",
+        "subscriber_count",
+        "agent_count",
+        "active_ads_count",
     )
     search_fields = ("name",)
     ordering = ("created_at",)
+    # Счётчики — хранимые столбцы, поддерживаются сигналами
     readonly_fields = (
-        "get_agent_count",
-        "get_advertisement_count",
+        "subscriber_count",
+        "agent_count",
+        "active_ads_count",
         "slug",
         "external_url",
     )
 
-    # Аннотация
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(
-            subscriber_count=Count("subscribers", distinct=True),
-            ad_count=Count("advertisements", distinct=True),
-        )
-
-    # Пользовательское отображение количества агентов
-    @admin.display(description="Количество агентов")
-    def get_agent_count(self, obj):
-        return obj.agent_count
-
-    # Пользовательское отображение количества объявлений
-    @admin.display(description="Количество объявлений")
-    def get_advertisement_count(self, obj):
-        return obj.advertisement_count
-
-    # Пользовательское отображение количества подписчиков
-    @admin.display(description="Количество подписчиков", ordering="subscriber_count")
-    def get_subscriber_count(self, obj):
-        return getattr(obj, "subscriber_count", 0)
-
 
 # Админка для модели Agent
 @admin.register(Agent)
@@ -124,7 +103,7 @@ class PropertyTypeAdmin(admin.ModelAdmin):
 # Админка для модели Location (локации объектов)
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    list_display = ("city", "district", "street", "house")
+    list_display = ("city", "district", "street", "house", "latitude", "longitude")
     list_filter = ("city", "district")
     search_fields = ("city", "district", "street", "house")
 
@@ -240,6 +219,37 @@ class NotificationAdmin(admin.ModelAdmin):
     raw_id_fields = ("user", "advertisement")
 
 
+# Админка для сохранённых поисков (критерии заполняются из query)
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ("user", "name", "category", "property_type", "city", "is_active")
+    list_filter = ("is_active", "category", "property_type")
+    search_fields = ("user__email", "name", "city")
+    raw_id_fields = ("user",)
+    readonly_fields = (
+        "category",
+        "property_type",
+        "city",
+        "price_min",
+        "price_max",
+        "square_min",
+        "square_max",
+        "price_per_sqm_min",
+        "price_per_sqm_max",
+        "has_extra_filters",
+    )
+
+
+# Админка для загрузок фидов (отчёт заполняет задача импорта)
+@admin.register(FeedImport)
+class FeedImportAdmin(admin.ModelAdmin):
+    list_display = ("agency", "user", "format", "status", "created_at", "finished_at")
+    list_filter = ("status", "format")
+    search_fields = ("agency__name", "user__email")
+    raw_id_fields = ("agency", "user")
+    readonly_fields = ("status", "report", "finished_at")
+
+
 # Админка для модели статистики
 @admin.register(Statistics)
 class StatisticsAdmin(admin.ModelAdmin):
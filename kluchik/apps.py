@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class KluchikConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "kluchik"
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from . import signals  # noqa: F401
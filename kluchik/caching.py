@@ -0,0 +1,102 @@
+import hashlib
+import time
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+from django.core.cache import cache
+
+
+def normalize_params(params: Mapping, allowed: Optional[Iterable[str]] = None) -> str:
+    """
+    Нормализованная строка параметров запроса: только разрешённые ключи,
+    без пустых значений, ключи и значения отсортированы.
+    """
+    allowed = set(allowed) if allowed is not None else None
+    items = []
+    for key in sorted(params.keys()):
+        if allowed is not None and key not in allowed:
+            continue
+        values = params.getlist(key) if hasattr(params, "getlist") else [params[key]]
+        for value in sorted(str(value).strip() for value in values):
+            if value:
+                items.append(f"{key}={value}")
+    return "&".join(items)
+
+
+def query_cache_key(prefix: str, params: Mapping, allowed=None) -> str:
+    """Ключ кэша для набора параметров запроса"""
+    normalized = normalize_params(params, allowed)
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+# Глобальная версия каталога: входит в ключи кэша ленты и фасетов.
+# Любое изменение объявления или фото увеличивает её, и все старые
+# ключи становятся недостижимыми — без перебора и удаления ключей.
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def get_version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        # После вытеснения ключа начинаем с метки времени, чтобы не
+        # совпасть с версиями, под которыми ещё лежат старые ответы
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
+        cache.incr(key)
+
+
+def get_catalog_version() -> int:
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> None:
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_cache_key(prefix: str, params: Mapping, allowed=None) -> str:
+    """Ключ кэша, привязанный к текущей версии каталога"""
+    return query_cache_key(f"{prefix}:v{get_catalog_version()}", params, allowed)
+
+
+# Документ, который дорого собирать и читают все (например, главная страница)
+DOCUMENT_STORE_TIMEOUT = 24 * 60 * 60
+DOCUMENT_LOCK_TIMEOUT = 30
+
+
+def cached_document(key: str, build: Callable[[], Any], ttl: int, version=None) -> Any:
+    """
+    Готовый документ из кэша. Документ устаревает по ttl или при смене
+    version (например, версии каталога). Пересобирает его один процесс —
+    тот, кто взял блокировку cache.add; остальные в это время отдают
+    устаревшую копию, а не строят документ одновременно (защита от
+    «набега» на базу после истечения кэша). Собрать документ без
+    блокировки приходится только при пустом кэше.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry["version"] == version and entry["expires_at"] > now:
+        return entry["data"]
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, DOCUMENT_LOCK_TIMEOUT):
+        if entry is not None:
+            return entry["data"]
+        return build()
+    try:
+        data = build()
+        cache.set(
+            key,
+            {"version": version, "expires_at": time.time() + ttl, "data": data},
+            DOCUMENT_STORE_TIMEOUT,
+        )
+    finally:
+        cache.delete(lock_key)
+    return data
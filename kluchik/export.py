@@ -0,0 +1,148 @@
+import csv
+from typing import Callable, Iterable, Iterator, Optional
+
+import orjson
+from django.db.models import Prefetch, QuerySet
+
+from .models import Advertisement, Photo
+
+# Колонки выгрузки каталога (порядок колонок CSV)
+EXPORT_COLUMNS = [
+    "id",
+    "slug",
+    "title",
+    "description",
+    "price",
+    "square",
+    "date_posted",
+    "updated_at",
+    "city",
+    "district",
+    "street",
+    "house",
+    "latitude",
+    "longitude",
+    "category",
+    "property_type",
+    "agency",
+    "external_url",
+    "photos",
+]
+
+EXPORT_CHUNK_SIZE = 1000
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_queryset(after: Optional[int] = None) -> QuerySet:
+    """
+    Активные объявления в порядке id со связанными данными. after — id
+    последнего уже полученного объявления (продолжение выгрузки).
+    """
+    queryset = (
+        Advertisement.objects.filter(status="active")
+        .select_related("location", "category", "property_type", "agency")
+        .prefetch_related(
+            Prefetch(
+                "photos",
+                queryset=(
+                    Photo.objects.exclude(image="")
+                    .exclude(image__isnull=True)
+                    .order_by("display_order")
+                    .only("id", "advertisement", "image")
+                ),
+            )
+        )
+        .only(
+            "id",
+            "slug",
+            "title",
+            "description",
+            "price",
+            "square",
+            "date_posted",
+            "updated_at",
+            "external_url",
+            "location__city",
+            "location__district",
+            "location__street",
+            "location__house",
+            "location__latitude",
+            "location__longitude",
+            "category__name",
+            "property_type__name",
+            "agency__name",
+        )
+        .order_by("id")
+    )
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    return queryset
+
+
+def export_rows(
+    after: Optional[int] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    build_url: Optional[Callable[[str], str]] = None,
+) -> Iterator[dict]:
+    """
+    Плоские строки выгрузки. Объявления читаются iterator(chunk_size=...),
+    фото подгружаются одним запросом на пачку, поэтому память не растёт
+    с размером каталога.
+    """
+    build_url = build_url or (lambda url: url)
+    for ad in export_queryset(after).iterator(chunk_size=chunk_size):
+        location = ad.location
+        yield {
+            "id": ad.id,
+            "slug": ad.slug,
+            "title": ad.title,
+            "description": ad.description,
+            "price": str(ad.price),
+            "square": str(ad.square),
+            "date_posted": ad.date_posted.isoformat(),
+            "updated_at": ad.updated_at.isoformat(),
+            "city": location.city,
+            "district": location.district,
+            "street": location.street,
+            "house": location.house,
+            "latitude": location.latitude,
+            "longitude": location.longitude,
+            "category": ad.category.name,
+            "property_type": ad.property_type.name,
+            "agency": ad.agency.name if ad.agency else None,
+            "external_url": ad.external_url,
+            "photos": [build_url(photo.image.url) for photo in ad.photos.all()],
+        }
+
+
+def ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    """Одна JSON-строка на объявление"""
+    for row in rows:
+        yield orjson.dumps(row) + b"\n"
+
+
+# Буфер, который просто возвращает записанную строку (для csv.writer)
+class Echo:
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+    """CSV с заголовком; ссылки на фото разделены пробелом"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row["photos"] = " ".join(row["photos"])
+        yield writer.writerow(
+            "" if row[column] is None else row[column] for column in EXPORT_COLUMNS
+        )
+
+
+def export_lines(export_format: str, rows: Iterable[dict]) -> Iterator:
+    if export_format == "csv":
+        return csv_lines(rows)
+    return ndjson_lines(rows)
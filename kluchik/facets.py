@@ -0,0 +1,97 @@
+from typing import Any, Dict, List
+
+from django.db.models import Case, CharField, Count, F, IntegerField, Value, When
+from django.db.models.functions import Cast
+
+from .filters import AdvertisementFilter
+
+# Границы ценовых диапазонов для фасета "Цена"
+PRICE_BUCKETS = [1_000_000, 3_000_000, 5_000_000, 10_000_000, 20_000_000]
+
+# Фасет -> параметры фильтра, которые он не учитывает при подсчёте
+# (иначе выбор категории обнулил бы счётчики всех остальных категорий)
+FACET_PARAMS = {
+    "category": ["category"],
+    "property_type": ["property_type"],
+    "city": ["city"],
+    "price": ["price_min", "price_max"],
+}
+
+
+class FacetFilterError(Exception):
+    """Параметры фильтра не прошли валидацию"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def price_bucket_expression():
+    whens = [
+        When(price__lt=edge, then=Value(index))
+        for index, edge in enumerate(PRICE_BUCKETS)
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS)), output_field=IntegerField())
+
+
+def price_bucket_bounds(index: int) -> Dict[str, Any]:
+    lower = PRICE_BUCKETS[index - 1] if index > 0 else 0
+    upper = PRICE_BUCKETS[index] if index < len(PRICE_BUCKETS) else None
+    return {"min": lower, "max": upper}
+
+
+def filtered_queryset(queryset, params, excluded):
+    """queryset, отфильтрованный AdvertisementFilter без параметров фасета"""
+    data = params.copy()
+    for name in excluded:
+        data.pop(name, None)
+    filterset = AdvertisementFilter(data, queryset=queryset)
+    if not filterset.is_valid():
+        raise FacetFilterError(filterset.errors)
+    return filterset.qs.order_by()
+
+
+def facet_queryset(queryset, facet: str):
+    """Сгруппированный подсчёт одного фасета в общем формате (facet, key, label, count)"""
+    if facet == "category":
+        key, label = F("category_id"), F("category__name")
+    elif facet == "property_type":
+        key, label = F("property_type_id"), F("property_type__name")
+    elif facet == "city":
+        key, label = F("location__city"), F("location__city")
+    else:
+        key, label = price_bucket_expression(), Value("")
+    return queryset.values(
+        facet_name=Value(facet, output_field=CharField()),
+        key=Cast(key, CharField()),
+        label=Cast(label, CharField()),
+    ).annotate(count=Count("pk"))
+
+
+def compute_facets(queryset, params) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Счётчики по всем фасетам одним запросом (UNION ALL сгруппированных
+    подзапросов). Каждый фасет учитывает все фильтры, кроме своих.
+    """
+    parts = [
+        facet_queryset(filtered_queryset(queryset, params, excluded), facet)
+        for facet, excluded in FACET_PARAMS.items()
+    ]
+    combined = parts[0].union(*parts[1:], all=True)
+
+    result: Dict[str, List[Dict[str, Any]]] = {facet: [] for facet in FACET_PARAMS}
+    for row in combined:
+        facet = row["facet_name"]
+        if facet == "price":
+            item = price_bucket_bounds(int(row["key"]))
+        elif facet == "city":
+            item = {"name": row["label"]}
+        else:
+            item = {"id": int(row["key"]), "name": row["label"]}
+        item["count"] = row["count"]
+        result[facet].append(item)
+
+    result["price"].sort(key=lambda item: item["min"])
+    for facet in ("category", "property_type", "city"):
+        result[facet].sort(key=lambda item: (-item["count"], item["name"]))
+    return result
@@ -0,0 +1,67 @@
+from typing import FrozenSet, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import bump_version, get_version
+from .models import AgencySubscription, FavoriteAdvertisement
+
+# Множества id избранного пользователя. Ключ данных содержит версию
+# пользователя: изменение избранного увеличивает её после коммита,
+# и запрос, прочитавший базу до коммита, не может положить в кэш
+# устаревшее множество под новой версией.
+FAVORITES_CACHE_TIMEOUT = 24 * 60 * 60
+
+SOURCES = {
+    "advertisements": (FavoriteAdvertisement, "advertisement_id"),
+    "agencies": (AgencySubscription, "agency_id"),
+}
+
+
+def version_key(kind: str, user_id: int) -> str:
+    return f"favorites:{kind}:{user_id}:version"
+
+
+def version(kind: str, user_id: int) -> int:
+    """Версия множества пользователя: меняется при каждом изменении избранного"""
+    return get_version(version_key(kind, user_id))
+
+
+def load_ids(kind: str, user_id: int) -> FrozenSet[int]:
+    """Множество id из кэша; при промахе — один запрос к базе"""
+    key = f"favorites:{kind}:{user_id}:v{version(kind, user_id)}"
+    ids = cache.get(key)
+    if ids is None:
+        model, field = SOURCES[kind]
+        ids = frozenset(
+            model.objects.filter(user_id=user_id).values_list(field, flat=True)
+        )
+        cache.set(key, ids, FAVORITES_CACHE_TIMEOUT)
+    return ids
+
+
+def ids_for_request(request, kind: str) -> Optional[FrozenSet[int]]:
+    """
+    Множество id избранного текущего пользователя, загруженное один раз
+    на запрос; None для анонимного пользователя
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None
+    loaded = request.__dict__.setdefault("_favorite_ids", {})
+    if kind not in loaded:
+        loaded[kind] = load_ids(kind, user.pk)
+    return loaded[kind]
+
+
+def favorite_advertisement_ids(request) -> Optional[FrozenSet[int]]:
+    return ids_for_request(request, "advertisements")
+
+
+def subscribed_agency_ids(request) -> Optional[FrozenSet[int]]:
+    return ids_for_request(request, "agencies")
+
+
+def invalidate(kind: str, user_id: int) -> None:
+    """Сбрасывает множество пользователя после коммита транзакции"""
+    transaction.on_commit(lambda: bump_version(version_key(kind, user_id)))
@@ -0,0 +1,433 @@
+import csv
+import io
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+from defusedxml import DefusedXmlException, ElementTree
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from . import geo, search
+from .caching import bump_catalog_version
+from .models import (
+    Advertisement,
+    AdvertisementCard,
+    Agency,
+    Category,
+    FeedImport,
+    Location,
+    PropertyType,
+    custom_slugify,
+)
+from .notifications import notify_agency_subscribers_of_ads
+from .saved_searches import notify_saved_searches_of_ads
+
+FEED_FORMATS = ("csv", "json", "xml")
+
+# Поля строки фида, которые проверяются полями моделей
+ADVERTISEMENT_FIELDS = ["external_id", "title", "description", "price", "square"]
+LOCATION_FIELDS = ["city", "district", "street", "house"]
+COORDINATE_FIELDS = {"latitude": 90, "longitude": 180}
+
+# Поля, которые импорт перезаписывает у уже загруженных объявлений
+# (автор и дата размещения остаются прежними)
+UPDATE_FIELDS = [
+    "title",
+    "description",
+    "price",
+    "square",
+    "status",
+    "category",
+    "property_type",
+    "location",
+    "price_per_sqm",
+    "updated_at",
+]
+
+# Статус объявлений фида без колонки status
+DEFAULT_STATUS = "active"
+
+# Строк в одной транзакции (один upsert)
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько ошибок строк попадает в отчёт (общее число — в error_count)
+MAX_REPORTED_ERRORS = 1000
+
+# Ключ адреса в кэше импорта
+LocationKey = Tuple[str, str, str, str]
+
+
+class FeedFormatError(ValueError):
+    """Файл не разбирается как фид указанного формата"""
+
+
+def detect_format(name: str) -> Optional[str]:
+    """Формат фида по расширению файла"""
+    extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return extension if extension in FEED_FORMATS else None
+
+
+def read_csv(file) -> Iterator[Dict[str, Any]]:
+    """CSV с заголовком; разделитель (запятая, точка с запятой, табуляция) определяется"""
+    try:
+        text = file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise FeedFormatError("CSV должен быть в кодировке UTF-8.")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.DictReader(io.StringIO(text, newline=""), dialect=dialect)
+
+
+def read_json(file) -> Iterator[Dict[str, Any]]:
+    """Список объектов или объект с ключом advertisements"""
+    try:
+        data = orjson.loads(file.read())
+    except orjson.JSONDecodeError as error:
+        raise FeedFormatError(f"Неверный JSON: {error}")
+    if isinstance(data, dict):
+        data = data.get("advertisements")
+    if not isinstance(data, list):
+        raise FeedFormatError(
+            "Ожидается список объявлений или объект с ключом advertisements."
+        )
+    yield from data
+
+
+def read_xml(file) -> Iterator[Dict[str, Any]]:
+    """
+    <advertisements><advertisement>…</advertisement>…</advertisements>:
+    поля — дочерние элементы или атрибуты элемента объявления. Файл
+    читается потоком через defusedxml (без сущностей и внешних DTD).
+    """
+    depth = 0
+    try:
+        for event, element in ElementTree.iterparse(file, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                row = dict(element.attrib)
+                for child in element:
+                    row[child.tag] = child.text
+                element.clear()
+                yield row
+    except (ElementTree.ParseError, DefusedXmlException) as error:
+        raise FeedFormatError(f"Неверный XML: {error}")
+
+
+READERS = {"csv": read_csv, "json": read_json, "xml": read_xml}
+
+
+def parse_feed(file, feed_format: str) -> Iterator[Dict[str, Any]]:
+    """Строки фида из бинарного файла"""
+    if feed_format not in READERS:
+        raise FeedFormatError(f"Неизвестный формат фида: {feed_format}.")
+    return READERS[feed_format](file)
+
+
+def lookup_table(model) -> Dict[str, int]:
+    """Справочник по названию (без учёта регистра) и по id"""
+    table = {
+        name.strip().lower(): pk for pk, name in model.objects.values_list("pk", "name")
+    }
+    table.update({str(pk): pk for pk in table.values()})
+    return table
+
+
+def text_value(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def assign_slugs(advertisement_ids: List[int]) -> int:
+    """
+    Дописывает id к slug вставленных объявлений (основа slug задаётся
+    до вставки) и заполняет external_url — одним UPDATE на пачку
+    """
+    if not advertisement_ids:
+        return 0
+    slug = Concat("slug", Value("-"), Cast("id", CharField()))
+    return Advertisement.objects.filter(pk__in=advertisement_ids).update(
+        slug=slug,
+        external_url=Concat(
+            Value(f"{settings.SITE_NAME}/advertisement/"), slug, Value("/")
+        ),
+    )
+
+
+# Загрузка строк фида в объявления агентства
+class FeedImporter:
+    """
+    Строки проверяются полями моделей и копятся в пачки. Пачка
+    сохраняется в одной транзакции: новые адреса — bulk_create,
+    объявления — одним upsert по (agency, external_id), slug новых
+    объявлений — одним UPDATE.
+    Категории, типы и адреса берутся из словарей в памяти.
+
+    Сигналы save при массовых операциях не вызываются, поэтому карточки,
+    полнотекстовый и пространственный индексы обновляются пачкой,
+    а счётчики агентства и версия каталога — в конце импорта.
+    """
+
+    def __init__(self, agency: Agency, user, batch_size: int = IMPORT_BATCH_SIZE):
+        self.agency = agency
+        self.user = user
+        self.batch_size = batch_size
+        self.categories = lookup_table(Category)
+        self.property_types = lookup_table(PropertyType)
+        self.locations: Dict[LocationKey, int] = {}
+        self.seen = set()
+        self.total = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def import_rows(self, rows: Iterable[Any]) -> Dict[str, Any]:
+        batch = []
+        try:
+            for number, raw in enumerate(rows, start=1):
+                self.total += 1
+                values = self.clean_row(number, raw)
+                if values is not None:
+                    batch.append(values)
+                if len(batch) >= self.batch_size:
+                    self.save_batch(batch)
+                    batch = []
+            if batch:
+                self.save_batch(batch)
+        finally:
+            self.finish()
+        return self.report()
+
+    def add_error(self, number: int, raw: Any, errors: Dict[str, List[str]]) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            external_id = raw.get("external_id") if isinstance(raw, dict) else None
+            self.errors.append(
+                {"row": number, "external_id": text_value(external_id), "errors": errors}
+            )
+
+    def clean_row(self, number: int, raw: Any) -> Optional[Dict[str, Any]]:
+        """Проверенные значения строки; None, если в строке есть ошибки"""
+        if not isinstance(raw, dict):
+            self.add_error(number, raw, {"row": ["Ожидается объект с полями объявления."]})
+            return None
+        values: Dict[str, Any] = {}
+        errors: Dict[str, List[str]] = {}
+
+        for model, names in [
+            (Advertisement, ADVERTISEMENT_FIELDS),
+            (Location, LOCATION_FIELDS),
+        ]:
+            for name in names:
+                try:
+                    values[name] = model._meta.get_field(name).clean(
+                        text_value(raw.get(name)), None
+                    )
+                except ValidationError as error:
+                    errors[name] = error.messages
+
+        status = text_value(raw.get("status")) or DEFAULT_STATUS
+        if status in dict(Advertisement.STATUS_CHOICES):
+            values["status"] = status
+        else:
+            errors["status"] = [f"Неизвестный статус «{status}»."]
+
+        for name, limit in COORDINATE_FIELDS.items():
+            value = text_value(raw.get(name))
+            try:
+                values[name] = float(value) if value else None
+            except ValueError:
+                errors[name] = ["Ожидается число."]
+                continue
+            if values[name] is not None and not -limit <= values[name] <= limit:
+                errors[name] = [f"Ожидается число от {-limit} до {limit}."]
+
+        for name, table in [
+            ("category", self.categories),
+            ("property_type", self.property_types),
+        ]:
+            value = text_value(raw.get(name))
+            values[name] = table.get(value.lower())
+            if values[name] is None:
+                errors[name] = [f"Неизвестное значение «{value}»."]
+
+        external_id = values.get("external_id")
+        if "external_id" not in errors:
+            if not external_id:
+                errors["external_id"] = ["Обязательное поле."]
+            elif external_id in self.seen:
+                errors["external_id"] = ["Повторяется в фиде."]
+        if "price" not in errors and values["price"] < 0:
+            errors["price"] = ["Цена не может быть отрицательной."]
+        if "square" not in errors and values["square"] <= 0:
+            errors["square"] = ["Площадь должна быть больше нуля."]
+
+        if errors:
+            self.add_error(number, raw, errors)
+            return None
+        self.seen.add(external_id)
+        return values
+
+    def resolve_locations(self, batch: List[Dict[str, Any]]) -> None:
+        """Находит или создаёт (одним bulk_create) адреса строк пачки"""
+        missing = {}
+        for values in batch:
+            key = tuple(values[name] for name in LOCATION_FIELDS)
+            if key not in self.locations:
+                missing.setdefault(key, values)
+        if not missing:
+            return
+        existing = (
+            Location.objects.filter(
+                city__in={key[0] for key in missing},
+                street__in={key[2] for key in missing},
+            )
+            .order_by("pk")
+            .values_list("pk", *LOCATION_FIELDS)
+        )
+        for pk, *key in existing:
+            self.locations.setdefault(tuple(key), pk)
+
+        new = {}
+        for key, values in missing.items():
+            if key in self.locations:
+                continue
+            location = Location(
+                **dict(zip(LOCATION_FIELDS, key)),
+                latitude=values["latitude"],
+                longitude=values["longitude"],
+            )
+            if location.latitude is not None and location.longitude is not None:
+                location.geohash = geo.encode_geohash(location.latitude, location.longitude)
+            new[key] = location
+        Location.objects.bulk_create(new.values())
+        geo.index_locations(new.values())
+        self.locations.update({key: location.pk for key, location in new.items()})
+
+    def save_batch(self, batch: List[Dict[str, Any]]) -> None:
+        now = timezone.now()
+        with transaction.atomic():
+            self.resolve_locations(batch)
+            # Статус уже загруженных объявлений до обновления
+            existing = dict(
+                Advertisement.objects.filter(
+                    agency=self.agency,
+                    external_id__in=[values["external_id"] for values in batch],
+                ).values_list("external_id", "status")
+            )
+            advertisements = [
+                Advertisement(
+                    agency=self.agency,
+                    user=self.user,
+                    location_id=self.locations[
+                        tuple(values[name] for name in LOCATION_FIELDS)
+                    ],
+                    category_id=values["category"],
+                    property_type_id=values["property_type"],
+                    status=values["status"],
+                    updated_at=now,
+                    # Основа slug; id дописывает assign_slugs после вставки.
+                    # У загруженных ранее объявлений slug не перезаписывается
+                    slug=custom_slugify(values["title"]),
+                    **{name: values[name] for name in ADVERTISEMENT_FIELDS},
+                )
+                for values in batch
+            ]
+            # Новые и уже загруженные — одним INSERT ... ON CONFLICT DO UPDATE;
+            # id возвращаются для всех строк (RETURNING)
+            Advertisement.objects.bulk_create(
+                advertisements,
+                update_conflicts=True,
+                unique_fields=["agency", "external_id"],
+                update_fields=UPDATE_FIELDS,
+            )
+            created = [ad for ad in advertisements if ad.external_id not in existing]
+            assign_slugs([ad.pk for ad in created])
+
+            AdvertisementCard.refresh([ad.pk for ad in advertisements])
+            search.index_advertisements(
+                (ad.pk, ad.title, ad.description) for ad in advertisements
+            )
+        self.created += len(created)
+        self.updated += len(advertisements) - len(created)
+        # bulk_create не вызывает сигналы: об объявлениях пачки, которые
+        # стали активными, после коммита уведомляются владельцы сохранённых
+        # поисков, затем подписчики агентства (как в tasks.notify_about_publish)
+        published = [
+            ad.pk
+            for ad in advertisements
+            if ad.status == "active" and existing.get(ad.external_id) != "active"
+        ]
+        if published:
+            transaction.on_commit(lambda: self.notify_published(published))
+
+    @staticmethod
+    def notify_published(advertisement_ids: List[int]) -> None:
+        notify_saved_searches_of_ads(advertisement_ids)
+        notify_agency_subscribers_of_ads(advertisement_ids)
+
+    def finish(self) -> None:
+        if not self.created and not self.updated:
+            return
+        Agency.rebuild_counters([self.agency.pk])
+        Agency.objects.filter(pk=self.agency.pk).update(updated_at=timezone.now())
+        bump_catalog_version()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "created": self.created,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def import_feed(
+    file, feed_format: str, agency: Agency, user, batch_size: int = IMPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Импортирует фид и возвращает отчёт. Ошибка формата посреди файла
+    не откатывает уже сохранённые пачки: отчёт дополняется ключом error.
+    """
+    importer = FeedImporter(agency, user, batch_size)
+    try:
+        importer.import_rows(parse_feed(file, feed_format))
+    except FeedFormatError as error:
+        return {**importer.report(), "error": str(error)}
+    return importer.report()
+
+
+def process_feed_import(feed_import_id: int) -> Optional[Dict[str, Any]]:
+    """Обрабатывает загруженный фид; повторная доставка задачи ничего не делает"""
+    started = FeedImport.objects.filter(pk=feed_import_id, status="pending").update(
+        status="processing"
+    )
+    if not started:
+        return None
+    feed_import = FeedImport.objects.select_related("agency", "user").get(
+        pk=feed_import_id
+    )
+    report = {"error": "Импорт прерван внутренней ошибкой."}
+    try:
+        with feed_import.file.open("rb") as file:
+            report = import_feed(
+                file, feed_import.format, feed_import.agency, feed_import.user
+            )
+    finally:
+        FeedImport.objects.filter(pk=feed_import_id).update(
+            status="failed" if "error" in report else "done",
+            report=report,
+            finished_at=timezone.now(),
+        )
+    return report
@@ -1,5 +1,13 @@
+import math
+
 import django_filters
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
 from django_filters.rest_framework import FilterSet
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from . import geo, search
 from .models import Advertisement, PropertyType, Category
 
 
@@ -21,6 +29,31 @@ class AdvertisementFilter(FilterSet):
     price_max = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     square_min = django_filters.NumberFilter(field_name="square", lookup_expr="gte")
     square_max = django_filters.NumberFilter(field_name="square", lookup_expr="lte")
+    price_per_sqm_min = django_filters.NumberFilter(
+        field_name="price_per_sqm", lookup_expr="gte", label="Цена за м² от"
+    )
+    price_per_sqm_max = django_filters.NumberFilter(
+        field_name="price_per_sqm", lookup_expr="lte", label="Цена за м² до"
+    )
+    city = django_filters.CharFilter(field_name="location__city", label="Город")
+    bbox = django_filters.CharFilter(
+        method="filter_bbox", label="Область карты (min_lon,min_lat,max_lon,max_lat)"
+    )
+    lat = django_filters.NumberFilter(method="filter_radius", label="Широта центра")
+    lon = django_filters.NumberFilter(method="filter_radius", label="Долгота центра")
+    radius = django_filters.NumberFilter(
+        method="filter_radius", label="Радиус, км", min_value=0
+    )
+    # Сортировка ленты; каждая из них поддерживается keyset-пагинацией
+    # (к полю всегда добавляется id) и индексом (status, поле)
+    ordering = django_filters.OrderingFilter(
+        fields=(
+            ("price", "price"),
+            ("price_per_sqm", "price_per_sqm"),
+            ("date_posted", "date_posted"),
+        ),
+        label="Сортировка",
+    )
 
     class Meta:
         model = Advertisement
@@ -30,5 +63,101 @@ class AdvertisementFilter(FilterSet):
             "price_max",
             "square_min",
             "square_max",
+            "price_per_sqm_min",
+            "price_per_sqm_max",
             "category",
+            "city",
+            "bbox",
+            "lat",
+            "lon",
+            "radius",
         ]
+
+    def filter_bbox(self, queryset, name, value):
+        bbox = geo.parse_bbox(value)
+        if bbox is None:
+            raise ValidationError(
+                {"bbox": ["Ожидается min_lon,min_lat,max_lon,max_lat в градусах."]}
+            )
+        return filter_by_bbox(queryset, bbox)
+
+    def filter_radius(self, queryset, name, value):
+        # lat, lon и radius применяются вместе один раз — на параметре radius
+        if name != "radius":
+            return queryset
+        latitude = self.form.cleaned_data.get("lat")
+        longitude = self.form.cleaned_data.get("lon")
+        if latitude is None or longitude is None:
+            raise ValidationError({"radius": ["Для радиуса нужны параметры lat и lon."]})
+        return filter_by_radius(queryset, float(latitude), float(longitude), float(value))
+
+
+def filter_by_bbox(queryset, bbox):
+    """
+    Объявления, адрес которых попадает в прямоугольник. В SQLite кандидаты
+    выбираются по R*Tree, точная проверка — по координатам адреса.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if geo.is_available():
+        queryset = queryset.filter(
+            location_id__in=RawSQL(geo.bbox_sql(), [min_lat, max_lat, min_lon, max_lon])
+        )
+    return queryset.filter(
+        location__latitude__range=(min_lat, max_lat),
+        location__longitude__range=(min_lon, max_lon),
+    )
+
+
+def filter_by_radius(queryset, latitude, longitude, radius_km):
+    """Объявления не дальше radius_km от точки (bbox-предфильтр + гаверсинус)"""
+    queryset = filter_by_bbox(queryset, geo.bbox_for_radius(latitude, longitude, radius_km))
+    lat0 = math.radians(latitude)
+    lon0 = math.radians(longitude)
+    lat = Radians("location__latitude")
+    lon = Radians("location__longitude")
+    haversine = Power(Sin((lat - lat0) / 2), 2) + math.cos(lat0) * Cos(lat) * Power(
+        Sin((lon - lon0) / 2), 2
+    )
+    distance = 2 * geo.EARTH_RADIUS_KM * ASin(Sqrt(haversine))
+    return queryset.alias(distance_km=distance).filter(distance_km__lte=radius_km)
+
+
+# Поиск по объявлениям через полнотекстовый индекс FTS5
+class AdvertisementFullTextSearchFilter(SearchFilter):
+    """
+    Ищет по заголовку и описанию через индекс FTS5 вместо LIKE '%...%'.
+    Результаты сортируются по релевантности (bm25), если клиент не задал
+    сортировку явно. На других СУБД используется обычный SearchFilter.
+    """
+
+    rank_annotation = "search_rank"
+
+    def filter_queryset(self, request, queryset, view):
+        if not search.is_available():
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        match = search.build_match_query(terms)
+        if not match:
+            return queryset
+
+        if request.query_params.get("ordering"):
+            return queryset.filter(pk__in=RawSQL(search.match_sql(), [match]))
+        # Индекс присоединяется к запросу: MATCH выполняется один раз,
+        # релевантность берётся из найденных строк индекса
+        table = queryset.model._meta.db_table
+        return (
+            queryset.extra(
+                tables=[search.FTS_TABLE],
+                where=search.join_where(f'"{table}"."id"'),
+                params=[match],
+            )
+            .annotate(
+                **{
+                    self.rank_annotation: RawSQL(
+                        search.rank_sql(), [], output_field=FloatField()
+                    )
+                }
+            )
+            .order_by(self.rank_annotation, "id")
+        )
@@ -0,0 +1,255 @@
+import math
+from typing import Iterable, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+
+# Пространственный индекс адресов (SQLite R*Tree): id = id адреса
+RTREE_TABLE = "kluchik_location_rtree"
+
+EARTH_RADIUS_KM = 6371.0
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+
+# Длина префикса geohash, по которому группируются точки на карте,
+# для масштабов (zoom) до указанного включительно
+ZOOM_PRECISION = [
+    (2, 1),
+    (4, 2),
+    (6, 3),
+    (8, 4),
+    (11, 5),
+    (13, 6),
+    (16, 7),
+]
+MAX_ZOOM_PRECISION = 8
+MAX_ZOOM = 20
+
+# Больше кластеров в одном ответе карта всё равно не отрисует
+MAX_CLUSTERS = 500
+
+# Ограничивающий прямоугольник: (min_lat, min_lon, max_lat, max_lon)
+BBox = Tuple[float, float, float, float]
+
+
+def is_available() -> bool:
+    """Индекс R*Tree есть только в SQLite"""
+    return connection.vendor == "sqlite"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash точки: соседние точки имеют общий префикс"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= middle:
+                bits = bits * 2 + 1
+                lon_range[0] = middle
+            else:
+                bits = bits * 2
+                lon_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                bits = bits * 2 + 1
+                lat_range[0] = middle
+            else:
+                bits = bits * 2
+                lat_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Длина префикса geohash для кластеров на заданном масштабе карты"""
+    for max_zoom, precision in ZOOM_PRECISION:
+        if zoom <= max_zoom:
+            return precision
+    return MAX_ZOOM_PRECISION
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли (формула гаверсинусов)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bbox_for_radius(latitude: float, longitude: float, radius_km: float) -> BBox:
+    """Прямоугольник, гарантированно содержащий круг заданного радиуса"""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6:
+        d_lon = 180.0
+    else:
+        d_lon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (
+        max(-90.0, latitude - d_lat),
+        max(-180.0, longitude - d_lon),
+        min(90.0, latitude + d_lat),
+        min(180.0, longitude + d_lon),
+    )
+
+
+def parse_bbox(value: str) -> Optional[BBox]:
+    """
+    Разбирает параметр bbox в формате "min_lon,min_lat,max_lon,max_lat"
+    (порядок, принятый в картографических API). None — если формат неверен.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        return None
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def index_location(location) -> None:
+    """Добавляет, обновляет или удаляет адрес в пространственном индексе"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RTREE_TABLE} WHERE id = %s", [location.pk])
+        if location.latitude is None or location.longitude is None:
+            return
+        cursor.execute(
+            f"INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lon, max_lon) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                location.pk,
+                location.latitude,
+                location.latitude,
+                location.longitude,
+                location.longitude,
+            ],
+        )
+
+
+def index_locations(locations: Iterable) -> int:
+    """Добавляет или обновляет пачку адресов (адреса без координат удаляются)"""
+    if not is_available():
+        return 0
+    locations = list(locations)
+    if not locations:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {RTREE_TABLE} WHERE id = %s",
+            [[location.pk] for location in locations],
+        )
+        return _insert_rows(
+            cursor,
+            [
+                [
+                    location.pk,
+                    location.latitude,
+                    location.latitude,
+                    location.longitude,
+                    location.longitude,
+                ]
+                for location in locations
+                if location.latitude is not None and location.longitude is not None
+            ],
+        )
+
+
+def unindex_location(location_id: int) -> None:
+    """Удаляет адрес из пространственного индекса"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RTREE_TABLE} WHERE id = %s", [location_id])
+
+
+def rebuild_index(rows: Iterable[Tuple[int, float, float]], chunk_size: int = 1000) -> int:
+    """Полностью пересобирает индекс по строкам (id, latitude, longitude)"""
+    if not is_available():
+        return 0
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RTREE_TABLE}")
+        for pk, latitude, longitude in rows:
+            batch.append([pk, latitude, latitude, longitude, longitude])
+            if len(batch) >= chunk_size:
+                total += _insert_rows(cursor, batch)
+                batch = []
+        if batch:
+            total += _insert_rows(cursor, batch)
+    return total
+
+
+def _insert_rows(cursor, rows) -> int:
+    cursor.executemany(
+        f"INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lon, max_lon) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        rows,
+    )
+    return len(rows)
+
+
+def bbox_sql() -> str:
+    """
+    Подзапрос с id адресов внутри прямоугольника.
+    Параметры: min_lat, max_lat, min_lon, max_lon.
+    """
+    return (
+        f"SELECT id FROM {RTREE_TABLE} "
+        "WHERE max_lat >= %s AND min_lat <= %s AND max_lon >= %s AND min_lon <= %s"
+    )
+
+
+def compute_clusters(queryset, zoom: int) -> dict:
+    """
+    Кластеры объявлений для карты: группировка по префиксу geohash
+    адреса одним запросом, с количеством, центром и диапазоном цен.
+    queryset должен быть уже ограничен областью карты.
+    """
+    precision = precision_for_zoom(zoom)
+    rows = (
+        queryset.order_by()
+        .exclude(location__geohash="")
+        .values(cell=Substr("location__geohash", 1, precision))
+        .annotate(
+            count=Count("pk"),
+            latitude=Avg("location__latitude"),
+            longitude=Avg("location__longitude"),
+            price_min=Min("price"),
+            price_max=Max("price"),
+        )
+        .order_by("-count", "cell")[:MAX_CLUSTERS]
+    )
+    return {
+        "zoom": zoom,
+        "precision": precision,
+        "clusters": [
+            {
+                "geohash": row["cell"],
+                "count": row["count"],
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+                "price_min": row["price_min"],
+                "price_max": row["price_max"],
+            }
+            for row in rows
+        ],
+    }
@@ -0,0 +1,109 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from kluchik.management.commands.benchmark_serializers import (
+    build_cards,
+    build_notifications,
+)
+from kluchik.renderers import MessagePackRenderer, ORJSONRenderer
+from kluchik.serializers import AdvertisementListSerializer, NotificationSerializer
+
+
+def feed_payload(size, context):
+    """Ответ ленты объявлений (keyset-пагинация)"""
+    results = AdvertisementListSerializer(
+        build_cards(size), many=True, context=context
+    ).data
+    return {
+        "next": "http://testserver/api/advertisements/?cursor=abc",
+        "previous": None,
+        "results": results,
+    }
+
+
+def notifications_payload(size, context):
+    """Ответ списка уведомлений"""
+    return NotificationSerializer(
+        build_notifications(size), many=True, context=context
+    ).data
+
+
+def raw_rows_payload(size, context):
+    """Строки values() с Decimal и datetime без сериализатора"""
+    return [
+        {
+            "id": card.advertisement_id,
+            "title": card.title,
+            "price": card.price,
+            "square": card.square,
+            "date_posted": notification.created_at,
+        }
+        for card, notification in zip(build_cards(size), build_notifications(size))
+    ]
+
+
+PAYLOADS = [
+    ("feed", feed_payload),
+    ("notifications", notifications_payload),
+    ("raw values()", raw_rows_payload),
+]
+
+
+# Сравнение рендереров ответа API
+class Command(BaseCommand):
+    help = (
+        "Сравнивает JSONRenderer DRF, ORJSONRenderer и MessagePackRenderer "
+        "на ответах ленты и уведомлений и проверяет совпадение JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Количество строк в ответе",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Число повторов (берётся лучшее время)"
+        )
+
+    def handle(self, *args, **options):
+        context = {"request": Request(APIRequestFactory().get("/api/"))}
+        renderers = [
+            ("drf json", JSONRenderer()),
+            ("orjson", ORJSONRenderer()),
+            ("msgpack", MessagePackRenderer()),
+        ]
+
+        header = f"{'payload':<14} {'rows':>6} " + " ".join(
+            f"{name + ', ms':>13} {'KiB':>7}" for name, _ in renderers
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for payload_name, build in PAYLOADS:
+            for size in options["sizes"]:
+                data = build(size, context)
+                if renderers[0][1].render(data) != renderers[1][1].render(data):
+                    raise CommandError(f"{payload_name}: JSON рендереров различается")
+
+                columns = []
+                for _, renderer in renderers:
+                    elapsed = self.measure(lambda: renderer.render(data), options["repeat"])
+                    size_kib = len(renderer.render(data)) / 1024
+                    columns.append(f"{elapsed * 1000:>13.1f} {size_kib:>7.0f}")
+                self.stdout.write(f"{payload_name:<14} {size:>6} " + " ".join(columns))
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,120 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kluchik.models import Advertisement, Location
+from kluchik.saved_searches import Criteria, SavedSearchMatcher
+
+CITIES = [f"Город {index}" for index in range(20)]
+
+
+def random_range(rng, low, high, digits):
+    """Случайный диапазон; каждая из границ может отсутствовать"""
+    start = rng.uniform(low, high)
+    end = start * rng.uniform(1.2, 3)
+    minimum = Decimal(str(round(start, digits))) if rng.random() < 0.8 else None
+    maximum = Decimal(str(round(end, digits))) if rng.random() < 0.8 else None
+    return minimum, maximum
+
+
+def build_searches(count, rng):
+    searches = []
+    for index in range(1, count + 1):
+        price = random_range(rng, 1_000_000, 30_000_000, 2)
+        square = random_range(rng, 20, 150, 1)
+        searches.append(
+            Criteria(
+                id=index,
+                category_id=rng.choice([1, 2, None]),
+                property_type_id=rng.choice([1, 2, 3, 4, None]),
+                city=rng.choice(CITIES + [""]),
+                price_min=price[0],
+                price_max=price[1],
+                square_min=square[0],
+                square_max=square[1],
+                price_per_sqm_min=None,
+                price_per_sqm_max=None,
+                has_extra_filters=False,
+            )
+        )
+    return searches
+
+
+def build_advertisements(count, rng):
+    advertisements = []
+    for index in range(1, count + 1):
+        price = Decimal(rng.randrange(1_000_000, 50_000_000))
+        square = Decimal(rng.randrange(200, 2000)) / 10
+        advertisement = Advertisement(
+            id=index,
+            category_id=rng.choice([1, 2]),
+            property_type_id=rng.choice([1, 2, 3, 4]),
+            price=price,
+            square=square,
+            price_per_sqm=(price / square).quantize(Decimal("0.01")),
+        )
+        advertisement.location = Location(city=rng.choice(CITIES))
+        advertisements.append(advertisement)
+    return advertisements
+
+
+# Сравнение инвертированного индекса сохранённых поисков с полным перебором
+class Command(BaseCommand):
+    help = (
+        "Сопоставляет объявления с сохранёнными поисками (в памяти) через "
+        "SavedSearchMatcher и полным перебором и проверяет совпадение результатов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--searches", type=int, default=100_000, help="Количество поисков"
+        )
+        parser.add_argument(
+            "--advertisements", type=int, default=200, help="Количество объявлений"
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        searches = build_searches(options["searches"], rng)
+        advertisements = build_advertisements(options["advertisements"], rng)
+
+        matcher = SavedSearchMatcher()
+        started = time.perf_counter()
+        for criteria in searches:
+            matcher.add(criteria)
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed = [matcher.match(advertisement) for advertisement in advertisements]
+        indexed_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = [
+            [
+                criteria.id
+                for criteria in searches
+                if matcher.matches(advertisement, criteria)
+            ]
+            for advertisement in advertisements
+        ]
+        scan_time = time.perf_counter() - started
+
+        if indexed != scanned:
+            raise CommandError("Результаты индекса и перебора различаются")
+
+        count = len(advertisements)
+        candidates = sum(len(matcher.candidates(ad)) for ad in advertisements) / count
+        matches = sum(len(ids) for ids in indexed) / count
+        self.stdout.write(f"Поисков: {len(searches)}, объявлений: {count}")
+        self.stdout.write(f"Построение индекса: {build_time * 1000:.0f} мс")
+        self.stdout.write(
+            f"Кандидатов на объявление: {candidates:.0f}, совпадений: {matches:.1f}"
+        )
+        self.stdout.write(
+            f"Индекс:  {indexed_time / count * 1000:.3f} мс на объявление"
+        )
+        self.stdout.write(f"Перебор: {scan_time / count * 1000:.3f} мс на объявление")
+        self.stdout.write(f"Ускорение: {scan_time / indexed_time:.1f}x")
@@ -0,0 +1,138 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIRequestFactory
+
+from kluchik.models import Advertisement, AdvertisementCard, Agency, Notification
+from kluchik.serializers import (
+    AdvertisementListSerializer,
+    AgencyListSerializer,
+    NotificationSerializer,
+)
+
+
+def build_cards(count):
+    return [
+        AdvertisementCard(
+            advertisement_id=index,
+            title=f"Квартира {index}",
+            price=Decimal("1000000.00") + index,
+            square=Decimal("45.50"),
+            location="Москва, ЦАО, Тверская, 1",
+            category_id=1,
+            category_name="Продажа",
+            property_type_name="Квартира",
+            status="active",
+            external_url=f"https://example.com/advertisement/kvartira-{index}/",
+            image="/media/photos/cover.jpg" if index % 2 else "",
+        )
+        for index in range(1, count + 1)
+    ]
+
+
+def build_agencies(count):
+    agencies = []
+    for index in range(1, count + 1):
+        agency = Agency(
+            id=index,
+            name=f"Агентство {index}",
+            external_url=f"https://example.com/agency/agentstvo-{index}/",
+            subscriber_count=index % 50,
+            agent_count=index % 7,
+            active_ads_count=index % 30,
+        )
+        agencies.append(agency)
+    return agencies
+
+
+def build_notifications(count):
+    created_at = timezone.now()
+    notifications = []
+    for index in range(1, count + 1):
+        notification = Notification(
+            id=index,
+            notification_type="new_ad",
+            status="sent",
+            created_at=created_at,
+            message=f"Новое объявление {index}",
+        )
+        notification.advertisement = Advertisement(
+            id=index,
+            title=f"Квартира {index}",
+            external_url=f"https://example.com/advertisement/kvartira-{index}/",
+        )
+        notifications.append(notification)
+    return notifications
+
+
+# (название, сериализатор, построитель объектов в памяти)
+CASES = [
+    ("AdvertisementListSerializer", AdvertisementListSerializer, build_cards),
+    ("AgencyListSerializer", AgencyListSerializer, build_agencies),
+    ("NotificationSerializer", NotificationSerializer, build_notifications),
+]
+
+
+# Сравнение обычной и быстрой сериализации списков
+class Command(BaseCommand):
+    help = (
+        "Сравнивает обычный ListSerializer и FastListSerializer на списках "
+        "объектов в памяти (без запросов к базе) и проверяет совпадение JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Размеры списков",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Число повторов (берётся лучшее время)"
+        )
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get("/api/"))
+        context = {"request": request}
+        renderer = JSONRenderer()
+
+        header = f"{'serializer':<30} {'rows':>6} {'drf, ms':>10} {'fast, ms':>10} {'x':>6}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, serializer_class, build in CASES:
+            for size in options["sizes"]:
+                objects = build(size)
+
+                def regular():
+                    return ListSerializer(
+                        objects, child=serializer_class(), context=context
+                    ).data
+
+                def fast():
+                    return serializer_class(objects, many=True, context=context).data
+
+                if renderer.render(regular()) != renderer.render(fast()):
+                    raise CommandError(f"{name}: результаты сериализации различаются")
+
+                regular_time = self.measure(regular, options["repeat"])
+                fast_time = self.measure(fast, options["repeat"])
+                self.stdout.write(
+                    f"{name:<30} {size:>6} {regular_time * 1000:>10.1f} "
+                    f"{fast_time * 1000:>10.1f} {regular_time / fast_time:>6.1f}"
+                )
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
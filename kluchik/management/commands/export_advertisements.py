@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from kluchik.export import EXPORT_CHUNK_SIZE, export_lines, export_rows
+
+
+# Выгрузка активного каталога в файл или stdout (NDJSON / CSV)
+class Command(BaseCommand):
+    help = "Выгружает активные объявления потоком в формате NDJSON или CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=["ndjson", "csv"], default="ndjson", dest="export_format"
+        )
+        parser.add_argument(
+            "--output", help="Путь к файлу (по умолчанию — стандартный вывод)"
+        )
+        parser.add_argument(
+            "--after",
+            type=int,
+            help="Продолжить выгрузку после объявления с этим id",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Количество объявлений, читаемых из базы за раз",
+        )
+        parser.add_argument(
+            "--base-url",
+            default="",
+            help="Префикс для ссылок на фото, например https://kluchik.ru",
+        )
+
+    def handle(self, *args, **options):
+        base_url = options["base_url"].rstrip("/")
+        rows = export_rows(
+            after=options["after"],
+            chunk_size=options["chunk_size"],
+            build_url=lambda url: f"{base_url}{url}",
+        )
+        lines = export_lines(options["export_format"], rows)
+
+        binary = options["export_format"] == "ndjson"
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line.decode("utf-8") if binary else line, ending="")
+            return
+
+        mode = "wb" if binary else "w"
+        extra = {} if binary else {"encoding": "utf-8", "newline": ""}
+        total = 0
+        with open(options["output"], mode, **extra) as output:
+            for line in lines:
+                output.write(line)
+                total += 1
+        if not binary:
+            total -= 1  # строка заголовка CSV
+        self.stderr.write(self.style.SUCCESS(f"Выгружено объявлений: {total}"))
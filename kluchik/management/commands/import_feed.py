@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kluchik.feed_import import (
+    FEED_FORMATS,
+    IMPORT_BATCH_SIZE,
+    detect_format,
+    import_feed,
+)
+from kluchik.models import Agency, User
+
+# Сколько ошибок строк выводится
+SHOWN_ERRORS = 20
+
+
+# Импорт фида объявлений агентства из файла
+class Command(BaseCommand):
+    help = (
+        "Импортирует фид объявлений агентства (CSV / JSON / XML): новые "
+        "объявления создаются, уже загруженные обновляются по external_id"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу фида")
+        parser.add_argument("--agency", required=True, help="Slug агентства")
+        parser.add_argument(
+            "--user", required=True, help="Email автора новых объявлений"
+        )
+        parser.add_argument(
+            "--format", choices=FEED_FORMATS, help="Формат (по умолчанию — по расширению)"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Количество объявлений в одной транзакции",
+        )
+
+    def handle(self, *args, **options):
+        agency = Agency.objects.filter(slug=options["agency"]).first()
+        if agency is None:
+            raise CommandError(f"Агентство {options['agency']} не найдено.")
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(f"Пользователь {options['user']} не найден.")
+        feed_format = options["format"] or detect_format(options["path"])
+        if feed_format is None:
+            raise CommandError("Не удалось определить формат, укажите --format.")
+
+        started = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as file:
+                report = import_feed(
+                    file, feed_format, agency, user, options["batch_size"]
+                )
+        except OSError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - started
+
+        for error in report["errors"][:SHOWN_ERRORS]:
+            fields = "; ".join(
+                f"{name}: {' '.join(messages)}"
+                for name, messages in error["errors"].items()
+            )
+            self.stderr.write(f"Строка {error['row']}: {fields}")
+        self.stdout.write(
+            f"Строк: {report['total']}, создано: {report['created']}, "
+            f"обновлено: {report['updated']}, с ошибками: {report['error_count']} "
+            f"({elapsed:.1f} с)"
+        )
+        if "error" in report:
+            raise CommandError(report["error"])
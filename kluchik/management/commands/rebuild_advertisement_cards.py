@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from kluchik.caching import bump_catalog_version
+from kluchik.models import Advertisement, AdvertisementCard
+
+
+# Полная пересборка денормализованных карточек объявлений
+class Command(BaseCommand):
+    help = "Пересобирает карточки всех объявлений"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Количество объявлений, обрабатываемых за раз",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        ids = Advertisement.objects.order_by("pk").values_list("pk", flat=True)
+        total = 0
+        chunk = []
+        for pk in ids.iterator(chunk_size=chunk_size):
+            chunk.append(pk)
+            if len(chunk) >= chunk_size:
+                total += len(AdvertisementCard.refresh(chunk))
+                chunk = []
+        if chunk:
+            total += len(AdvertisementCard.refresh(chunk))
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Обновлено карточек: {total}"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from kluchik.models import Agency
+
+
+# Сверка хранимых счётчиков агентств с фактическими данными
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает число активных объявлений, подписчиков и агентов "
+        "у агентств, где хранимые счётчики разошлись с данными"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество агентств, обрабатываемых за раз",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        ids = Agency.objects.order_by("pk").values_list("pk", flat=True)
+        total = 0
+        chunk = []
+        for pk in ids.iterator(chunk_size=chunk_size):
+            chunk.append(pk)
+            if len(chunk) >= chunk_size:
+                total += Agency.rebuild_counters(chunk)
+                chunk = []
+        if chunk:
+            total += Agency.rebuild_counters(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено агентств: {total}"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kluchik import geo
+from kluchik.caching import bump_catalog_version
+from kluchik.models import Location
+
+
+# Полная пересборка пространственного индекса адресов
+class Command(BaseCommand):
+    help = "Пересчитывает geohash адресов и пересобирает индекс R*Tree"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество адресов, обрабатываемых за раз",
+        )
+
+    def handle(self, *args, **options):
+        if not geo.is_available():
+            raise CommandError("Индекс R*Tree поддерживается только для SQLite.")
+        chunk_size = options["chunk_size"]
+        locations = Location.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).order_by("pk")
+
+        # geohash мог устареть, если координаты меняли запросом UPDATE
+        batch = []
+        for location in locations.only("pk", "latitude", "longitude", "geohash").iterator(
+            chunk_size=chunk_size
+        ):
+            geohash = geo.encode_geohash(location.latitude, location.longitude)
+            if location.geohash != geohash:
+                location.geohash = geohash
+                batch.append(location)
+            if len(batch) >= chunk_size:
+                Location.objects.bulk_update(batch, ["geohash"])
+                batch = []
+        if batch:
+            Location.objects.bulk_update(batch, ["geohash"])
+
+        total = geo.rebuild_index(
+            locations.values_list("pk", "latitude", "longitude").iterator(
+                chunk_size=chunk_size
+            ),
+            chunk_size=chunk_size,
+        )
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано адресов: {total}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kluchik import search
+from kluchik.caching import bump_catalog_version
+from kluchik.models import Advertisement
+
+
+# Полная пересборка полнотекстового индекса объявлений
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс объявлений с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество объявлений, читаемых и вставляемых за раз",
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Полнотекстовый индекс поддерживается только для SQLite.")
+        total = search.rebuild_index(
+            Advertisement.objects.order_by("pk"), chunk_size=options["chunk_size"]
+        )
+        # Результаты поиска в кэше ленты могли устареть
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано объявлений: {total}"))
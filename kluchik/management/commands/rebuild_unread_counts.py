@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from kluchik.models import User
+
+
+# Сверка счётчиков непрочитанных уведомлений с таблицей уведомлений
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает число непрочитанных уведомлений у пользователей, "
+        "где хранимый счётчик разошёлся с данными"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество пользователей, обрабатываемых за раз",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        ids = User.objects.order_by("pk").values_list("pk", flat=True)
+        total = 0
+        chunk = []
+        for pk in ids.iterator(chunk_size=chunk_size):
+            chunk.append(pk)
+            if len(chunk) >= chunk_size:
+                total += User.rebuild_unread_counts(chunk)
+                chunk = []
+        if chunk:
+            total += User.rebuild_unread_counts(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено пользователей: {total}"))
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+# Полнотекстовый индекс объявлений (SQLite FTS5).
+# В индексе хранятся уже нормализованные основы слов, поэтому
+# достаточно токенизатора unicode61 без собственной морфологии.
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS kluchik_advertisement_fts "
+        "USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS kluchik_advertisement_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("kluchik", "0016_alter_advertisement_description"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
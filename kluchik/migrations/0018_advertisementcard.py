@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 07:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0017_advertisement_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertisementCard',
+            fields=[
+                ('advertisement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='kluchik.advertisement', verbose_name='Объявление')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=20, verbose_name='Цена')),
+                ('square', models.DecimalField(decimal_places=1, max_digits=4, verbose_name='Площадь')),
+                ('location', models.CharField(max_length=430, verbose_name='Адрес')),
+                ('category_name', models.CharField(max_length=100, verbose_name='Название категории')),
+                ('property_type_name', models.CharField(max_length=100, verbose_name='Тип недвижимости')),
+                ('status', models.CharField(max_length=10, verbose_name='Статус')),
+                ('external_url', models.URLField(blank=True, max_length=500, null=True, verbose_name='Внешняя ссылка')),
+                ('image', models.CharField(blank=True, max_length=500, null=True, verbose_name='Обложка')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='kluchik.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Карточка объявления',
+                'verbose_name_plural': 'Карточки объявлений',
+            },
+        ),
+    ]
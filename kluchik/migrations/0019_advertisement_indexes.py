@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0018_advertisementcard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'date_posted'], name='adv_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'price'], name='adv_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'category', 'property_type'], name='adv_status_cat_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['category', 'property_type', 'date_posted'], name='adv_active_cat_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['user', 'status'], name='adv_user_status_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-17 07:42
+
+from django.db import migrations, models
+
+
+# Пространственный индекс адресов (SQLite R*Tree).
+# Каждая точка хранится как вырожденный прямоугольник.
+def create_rtree_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS kluchik_location_rtree "
+        "USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+    )
+
+
+def drop_rtree_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS kluchik_location_rtree")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0020_advertisement_updated_at_agency_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='Geohash'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Широта'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Долгота'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['geohash'], name='location_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'location'], name='adv_status_location_idx'),
+        ),
+        migrations.RunPython(create_rtree_table, drop_rtree_table),
+    ]
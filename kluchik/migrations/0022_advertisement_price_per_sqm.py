@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-17 07:56
+
+from django.db import migrations, models
+from django.db.models import Case, ExpressionWrapper, F, When
+from django.db.models.functions import Round
+
+
+# Заполняем цену за м² у существующих объявлений одним UPDATE
+def fill_price_per_sqm(apps, schema_editor):
+    Advertisement = apps.get_model("kluchik", "Advertisement")
+    Advertisement.objects.filter(square__gt=0).update(
+        price_per_sqm=Case(
+            When(
+                square__gt=0,
+                then=Round(
+                    ExpressionWrapper(
+                        F("price") / F("square"), output_field=models.DecimalField()
+                    ),
+                    2,
+                ),
+            ),
+            default=None,
+            output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0021_location_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='price_per_sqm',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=20, null=True, verbose_name='Цена за м²'),
+        ),
+        migrations.RunPython(fill_price_per_sqm, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'price_per_sqm'], name='adv_status_price_sqm_idx'),
+        ),
+    ]
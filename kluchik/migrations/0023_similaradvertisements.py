@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 07:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0022_advertisement_price_per_sqm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarAdvertisements',
+            fields=[
+                ('advertisement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similar_listings', serialize=False, to='kluchik.advertisement', verbose_name='Объявление')),
+                ('similar_ids', models.JSONField(default=list, verbose_name='Похожие объявления')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчёта')),
+            ],
+            options={
+                'verbose_name': 'Похожие объявления',
+                'verbose_name_plural': 'Похожие объявления',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-17 08:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0023_similaradvertisements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='Название')),
+                ('query', models.JSONField(default=dict, verbose_name='Параметры поиска')),
+                ('city', models.CharField(blank=True, max_length=100, verbose_name='Город')),
+                ('price_min', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Цена от')),
+                ('price_max', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Цена до')),
+                ('square_min', models.DecimalField(blank=True, decimal_places=1, max_digits=10, null=True, verbose_name='Площадь от')),
+                ('square_max', models.DecimalField(blank=True, decimal_places=1, max_digits=10, null=True, verbose_name='Площадь до')),
+                ('price_per_sqm_min', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Цена за м² от')),
+                ('price_per_sqm_max', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Цена за м² до')),
+                ('has_extra_filters', models.BooleanField(default=False, verbose_name='Есть сложные условия')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Уведомлять')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='kluchik.category', verbose_name='Категория')),
+                ('property_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='kluchik.propertytype', verbose_name='Тип недвижимости')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сохранённый поиск',
+                'verbose_name_plural': 'Сохранённые поиски',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='saved_search_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 08:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Считаем избранное у существующих объявлений одним UPDATE
+def fill_favorite_count(apps, schema_editor):
+    Advertisement = apps.get_model("kluchik", "Advertisement")
+    FavoriteAdvertisement = apps.get_model("kluchik", "FavoriteAdvertisement")
+    favorites = (
+        FavoriteAdvertisement.objects.filter(advertisement=OuterRef("pk"))
+        .order_by()
+        .values("advertisement")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Advertisement.objects.update(favorite_count=Coalesce(Subquery(favorites), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0024_savedsearch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_favorite_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'favorite_count', 'date_posted'], name='adv_status_fav_date_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 08:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Заполняем счётчики существующих агентств одним UPDATE
+def fill_agency_counters(apps, schema_editor):
+    Agency = apps.get_model("kluchik", "Agency")
+    Advertisement = apps.get_model("kluchik", "Advertisement")
+    AgencySubscription = apps.get_model("kluchik", "AgencySubscription")
+    Agent = apps.get_model("kluchik", "Agent")
+
+    def count(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(agency=OuterRef("pk"))
+                .order_by()
+                .values("agency")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    Agency.objects.update(
+        active_ads_count=count(Advertisement.objects.filter(status="active")),
+        subscriber_count=count(AgencySubscription.objects.all()),
+        agent_count=count(Agent.objects.all()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0025_advertisement_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agency',
+            name='active_ads_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных объявлений'),
+        ),
+        migrations.AddField(
+            model_name='agency',
+            name='agent_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Агентов'),
+        ),
+        migrations.AddField(
+            model_name='agency',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.RunPython(fill_agency_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0026_agency_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['agency', 'status', 'date_posted'], name='adv_agency_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-17 08:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0027_advertisement_agency_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='feed_imports/', verbose_name='Файл фида')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('xml', 'XML')], max_length=4, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('report', models.JSONField(blank=True, default=dict, verbose_name='Отчёт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Импорт фида',
+                'verbose_name_plural': 'Импорты фидов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='advertisement',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Id в фиде агентства'),
+        ),
+        migrations.AddConstraint(
+            model_name='advertisement',
+            constraint=models.UniqueConstraint(fields=('agency', 'external_id'), name='adv_agency_external_id_uniq'),
+        ),
+        migrations.AddField(
+            model_name='feedimport',
+            name='agency',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_imports', to='kluchik.agency', verbose_name='Агентство'),
+        ),
+        migrations.AddField(
+            model_name='feedimport',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_imports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-17 08:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Заполняем счётчик непрочитанных одним UPDATE (после создания индекса)
+def fill_unread_counts(apps, schema_editor):
+    User = apps.get_model("kluchik", "User")
+    Notification = apps.get_model("kluchik", "Notification")
+    User.objects.update(
+        unread_notification_count=Coalesce(
+            Subquery(
+                Notification.objects.filter(user=OuterRef("pk"), status="sent")
+                .order_by()
+                .values("user")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0028_feed_import'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Непрочитанных уведомлений'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'status'], name='notification_user_status_idx'),
+        ),
+        migrations.RunPython(fill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from kluchik import search
+
+
+# Заполняет полнотекстовый индекс объявлениями, созданными до появления
+# индекса (0017 создаёт пустую таблицу). В индекс пишется тот же
+# нормализованный текст, что и при сохранении объявления.
+def fill_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Advertisement = apps.get_model("kluchik", "Advertisement")
+    search.rebuild_index(Advertisement.objects.using(schema_editor.connection.alias))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("kluchik", "0029_unread_notification_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_fts_table, migrations.RunPython.noop),
+    ]
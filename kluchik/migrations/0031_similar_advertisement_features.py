@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kluchik', '0030_fill_advertisement_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similaradvertisements',
+            name='category_id',
+            field=models.IntegerField(null=True, verbose_name='Категория при расчёте'),
+        ),
+        migrations.AddField(
+            model_name='similaradvertisements',
+            name='location_id',
+            field=models.IntegerField(null=True, verbose_name='Локация при расчёте'),
+        ),
+        migrations.AddField(
+            model_name='similaradvertisements',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=20, null=True, verbose_name='Цена при расчёте'),
+        ),
+        migrations.AddField(
+            model_name='similaradvertisements',
+            name='property_type_id',
+            field=models.IntegerField(null=True, verbose_name='Тип недвижимости при расчёте'),
+        ),
+        migrations.AddField(
+            model_name='similaradvertisements',
+            name='square',
+            field=models.DecimalField(decimal_places=1, max_digits=4, null=True, verbose_name='Площадь при расчёте'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
 from django.urls import reverse
@@ -9,9 +10,51 @@ from django.contrib.auth.models import (
     BaseUserManager,
     PermissionsMixin,
 )
-from django.db.models import Count, Avg, Sum
+from django.db.models import (
+    Count,
+    Avg,
+    Sum,
+    OuterRef,
+    Subquery,
+    Case,
+    When,
+    F,
+    Value,
+    ExpressionWrapper,
+)
+from django.db.models.functions import Coalesce, Round
+from django.db.models.lookups import GreaterThan
+from decimal import Decimal, ROUND_HALF_UP
 from project.settings import SITE_NAME
 from unidecode import unidecode
+from . import search
+from .geo import encode_geohash
+
+
+# Хранимые счётчики агентства
+COUNTER_FIELDS = ("active_ads_count", "subscriber_count", "agent_count")
+
+
+# Агентство на момент загрузки из базы или последнего сохранения:
+# по нему сигналы переносят счётчики при смене агентства
+class LoadedAgencyMixin:
+    _loaded_agency_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "agency_id" in field_names:
+            instance._loaded_agency_id = values[field_names.index("agency_id")]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Запись и счётчики агентств, которые меняют сигналы, —
+        # в одной транзакции
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"agency", "agency_id"} & set(update_fields):
+            self._loaded_agency_id = self.agency_id
 
 
 # Модель агентства недвижимости
@@ -25,6 +68,20 @@ class Agency(models.Model):
     slug = models.SlugField(
         max_length=255, unique=True, blank=True, null=True, verbose_name="Слаг"
     )
+    # Меняется и при изменении агентов, подписок и объявлений агентства
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    # Счётчики меняются только атомарными UPDATE с F() (см. signals),
+    # пересчитываются командой rebuild_agency_counters
+    active_ads_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Активных объявлений"
+    )
+    subscriber_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Подписчиков"
+    )
+    agent_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Агентов"
+    )
 
     class Meta:
         verbose_name = "Агентство"
@@ -35,7 +92,8 @@ class Agency(models.Model):
 
     def save(self, *args, **kwargs):
         # Первый вызов — сохраняем без slug, чтобы получить id
-        if not self.id:
+        is_new = not self.id
+        if is_new:
             super().save(*args, **kwargs)
 
         if not self.slug:
@@ -45,31 +103,74 @@ class Agency(models.Model):
         if not self.external_url:
             self.external_url = f"{SITE_NAME}/agency/{self.slug}/"
 
-        super().save(*args, **kwargs)
+        if is_new:
+            # Повторная вставка (force_insert из create) упала бы —
+            # дописываем только slug и external_url
+            super().save(
+                using=kwargs.get("using"), update_fields=["slug", "external_url"]
+            )
+        else:
+            if kwargs.get("update_fields") is None:
+                # Полное сохранение не должно затирать счётчики значениями,
+                # прочитанными до чужих изменений
+                kwargs["update_fields"] = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in COUNTER_FIELDS
+                ]
+            super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse("agency-detail", kwargs={"slug": self.slug})
 
-    @property
-    def agent_count(self):
-        """Количество агентов, связанных с агентством"""
-        return self.agents.count()
-
     @property
     def advertisement_count(self):
         """Количество объявлений, связанных с агентством"""
         return self.advertisements.count()
 
     @staticmethod
-    def with_count():
-        return Agency.objects.annotate(
-            subscriber_count=Count("subscribers", distinct=True),
-            annotated_agent_count=Count("agents", distinct=True),
+    def counter_subqueries():
+        """Точные значения счётчиков (коррелированные подзапросы)"""
+
+        def count(queryset):
+            return Coalesce(
+                Subquery(
+                    queryset.filter(agency=OuterRef("pk"))
+                    .order_by()
+                    .values("agency")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0,
+            )
+
+        return {
+            "active_ads_count": count(Advertisement.objects.filter(status="active")),
+            "subscriber_count": count(AgencySubscription.objects.all()),
+            "agent_count": count(Agent.objects.all()),
+        }
+
+    @staticmethod
+    def rebuild_counters(agency_ids=None):
+        """
+        Пересчитывает счётчики (всех агентств или agency_ids) одним UPDATE;
+        строки с верными значениями не трогаются, у исправленных меняется
+        дата изменения. Возвращает число исправленных агентств.
+        """
+        subqueries = Agency.counter_subqueries()
+        queryset = Agency.objects.all()
+        if agency_ids is not None:
+            queryset = queryset.filter(pk__in=agency_ids)
+        drifted = models.Q()
+        for name, subquery in subqueries.items():
+            drifted |= ~models.Q(**{name: subquery})
+        return queryset.filter(drifted).update(
+            **subqueries, updated_at=timezone.now()
         )
 
 
 # Связь между агентом и агентством
-class Agent(models.Model):
+class Agent(LoadedAgencyMixin, models.Model):
     agency = models.ForeignKey(
         Agency,
         on_delete=models.CASCADE,
@@ -131,6 +232,13 @@ class User(AbstractBaseUser, PermissionsMixin):
         related_name="subscribers",
         verbose_name="Подписки на агентства",
     )
+    # Уведомления со статусом «Отправлено». Меняется только атомарными
+    # UPDATE в транзакции изменения уведомлений (см. signals и
+    # notifications.create_notifications), пересчитывается командой
+    # rebuild_unread_counts
+    unread_notification_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Непрочитанных уведомлений"
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -144,9 +252,44 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.name} {self.surname}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Полное сохранение (профиль, пароль) не должно затирать
+            # счётчик значением, прочитанным до новых уведомлений
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "unread_notification_count"
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def rebuild_unread_counts(user_ids=None):
+        """
+        Пересчитывает unread_notification_count (всех пользователей или
+        user_ids) одним UPDATE только у строк с неверным значением.
+        Возвращает число исправленных пользователей.
+        """
+        unread = Coalesce(
+            Subquery(
+                Notification.objects.filter(user=OuterRef("pk"), status="sent")
+                .order_by()
+                .values("user")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+        queryset = User.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(pk__in=user_ids)
+        return queryset.exclude(unread_notification_count=unread).update(
+            unread_notification_count=unread
+        )
+
 
 # Связь между агенством и подписчиками агенства
-class AgencySubscription(models.Model):
+class AgencySubscription(LoadedAgencyMixin, models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="Пользователь"
     )
@@ -185,14 +328,35 @@ class Location(models.Model):
     district = models.CharField(max_length=150, verbose_name="Район")
     street = models.CharField(max_length=150, verbose_name="Улица")
     house = models.CharField(max_length=15, verbose_name="Дом")
+    latitude = models.FloatField(null=True, blank=True, verbose_name="Широта")
+    longitude = models.FloatField(null=True, blank=True, verbose_name="Долгота")
+    # Заполняется автоматически по координатам, используется для кластеров на карте
+    geohash = models.CharField(
+        max_length=12, blank=True, editable=False, verbose_name="Geohash"
+    )
 
     class Meta:
         verbose_name = "Адрес"
         verbose_name_plural = "Адреса"
+        indexes = [
+            models.Index(fields=["geohash"], name="location_geohash_idx"),
+            # Для СУБД без R*Tree (поиск по прямоугольнику)
+            models.Index(fields=["latitude", "longitude"], name="location_lat_lon_idx"),
+        ]
 
     def __str__(self):
         return f"{self.city}, {self.district}, {self.street}, {self.house}"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
 
 # Категория недвижимости (аренда, продажа)
 class Category(models.Model):
@@ -209,8 +373,76 @@ class Category(models.Model):
         return self.name
 
 
+# Цена за м² — хранимая колонка, пересчитываемая при изменении цены или площади
+PRICE_PER_SQM_PLACES = Decimal("0.01")
+
+
+def compute_price_per_sqm(price, square):
+    """Цена за м², округлённая до копеек; None, если площадь не задана"""
+    if price is None or not square or square <= 0:
+        return None
+    return (Decimal(price) / Decimal(square)).quantize(
+        PRICE_PER_SQM_PLACES, rounding=ROUND_HALF_UP
+    )
+
+
+def price_per_sqm_expression(price=None, square=None):
+    """SQL-выражение цены за м² (для UPDATE и миграций)"""
+    price = F("price") if price is None else price
+    square = F("square") if square is None else square
+    if not hasattr(price, "resolve_expression"):
+        price = Value(price)
+    if not hasattr(square, "resolve_expression"):
+        square = Value(square)
+    return Case(
+        When(
+            GreaterThan(square, 0),
+            then=Round(
+                ExpressionWrapper(price / square, output_field=models.DecimalField()),
+                2,
+            ),
+        ),
+        default=None,
+        output_field=models.DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+# QuerySet объявлений, поддерживающий price_per_sqm при массовых операциях
+class AdvertisementQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if ("price" in kwargs or "square" in kwargs) and "price_per_sqm" not in kwargs:
+            # В UPDATE правая часть видит старые значения столбцов,
+            # поэтому подставляем новые цену/площадь прямо в выражение
+            kwargs["price_per_sqm"] = price_per_sqm_expression(
+                kwargs.get("price"), kwargs.get("square")
+            )
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.price_per_sqm = compute_price_per_sqm(obj.price, obj.square)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    bulk_create.alters_data = True
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if {"price", "square"} & set(fields):
+            objs = list(objs)
+            for obj in objs:
+                obj.price_per_sqm = compute_price_per_sqm(obj.price, obj.square)
+            if "price_per_sqm" not in fields:
+                fields.append("price_per_sqm")
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    bulk_update.alters_data = True
+
+
 # Объявление о продаже или аренде недвижимости
-class Advertisement(models.Model):
+class Advertisement(LoadedAgencyMixin, models.Model):
     STATUS_CHOICES = [
         ("draft", "Черновик"),
         ("active", "Актуально"),
@@ -260,16 +492,119 @@ class Advertisement(models.Model):
         related_name="advertisements",
         verbose_name="Агентство",
     )
+    # Меняется и при изменении фото, адреса и избранного
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+    # Хранится, чтобы сортировка и фильтр по цене за м² шли по индексу
+    price_per_sqm = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Цена за м²",
+    )
+
+    # Меняется только атомарными UPDATE с F() (см. signals)
+    favorite_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном"
+    )
+    # Идентификатор объявления в фиде агентства: по нему импорт обновляет
+    # уже загруженные объявления (см. feed_import). NULL, а не пустая
+    # строка: уникальность (agency, external_id) без условия нужна для
+    # INSERT ... ON CONFLICT, а NULL между собой не конфликтуют
+    external_id = models.CharField(
+        max_length=100, null=True, blank=True, verbose_name="Id в фиде агентства"
+    )
+
+    objects = AdvertisementQuerySet.as_manager()
+
+    # Статус на момент загрузки из базы или последнего сохранения: по нему
+    # сигналы отличают публикацию (переход в active) от прочих сохранений
+    _loaded_status = None
 
     class Meta:
         verbose_name = "Объявление"
         verbose_name_plural = "Объявления"
         ordering = ["-date_posted"]
+        indexes = [
+            # Публичная лента: status="active" + сортировка по дате.
+            # Индекс по возрастанию: обратный проход даёт (date_posted, id) DESC
+            # без временного B-дерева, т.к. id (rowid) хранится в конце ключа
+            models.Index(fields=["status", "date_posted"], name="adv_status_date_idx"),
+            # Диапазоны цены в AdvertisementFilter
+            models.Index(fields=["status", "price"], name="adv_status_price_idx"),
+            # Фильтр по категории и типу недвижимости
+            models.Index(
+                fields=["status", "category", "property_type"],
+                name="adv_status_cat_type_idx",
+            ),
+            # Категория и тип с сортировкой по дате — только активные объявления
+            models.Index(
+                fields=["category", "property_type", "date_posted"],
+                condition=models.Q(status="active"),
+                name="adv_active_cat_type_date_idx",
+            ),
+            # Объявления пользователя (MyAdvertisementListView)
+            models.Index(fields=["user", "status"], name="adv_user_status_idx"),
+            # Поиск по карте: адреса из R*Tree -> объявления
+            models.Index(fields=["status", "location"], name="adv_status_location_idx"),
+            # Сортировка и диапазоны цены за м²
+            models.Index(
+                fields=["status", "price_per_sqm"], name="adv_status_price_sqm_idx"
+            ),
+            # Популярные объявления: по числу добавлений в избранное и дате
+            models.Index(
+                fields=["status", "favorite_count", "date_posted"],
+                name="adv_status_fav_date_idx",
+            ),
+            # Объявления агентства (/api/agencies/<slug>/advertisements/)
+            models.Index(
+                fields=["agency", "status", "date_posted"],
+                name="adv_agency_status_date_idx",
+            ),
+        ]
+        constraints = [
+            # Одно объявление на id фида в агентстве (ключ upsert при импорте)
+            models.UniqueConstraint(
+                fields=["agency", "external_id"], name="adv_agency_external_id_uniq"
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        super().save(*args, **kwargs) 
-
+        self.price_per_sqm = compute_price_per_sqm(self.price, self.square)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"price", "square"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "price_per_sqm"}
+        elif update_fields is None and not self._state.adding:
+            # Полное сохранение не должно затирать счётчик избранного
+            # значением, прочитанным до чужих добавлений
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "favorite_count"
+            ]
+        # Вставка, slug, карточка и поисковый индекс — одна транзакция:
+        # объявление не появится в ленте без карточки или без slug
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            self.assign_slug()
+
+            if is_new:
+                # Только если объект был новым — апдейт slug и external_url.
+                # UPDATE не вызывает post_save повторно, поэтому карточка и
+                # поисковый индекс нового объявления строятся здесь, один раз
+                # (обработчики post_save пропускают создание)
+                Advertisement.objects.filter(pk=self.pk).update(
+                    slug=self.slug, external_url=self.external_url
+                )
+                AdvertisementCard.refresh([self.pk])
+                search.index_advertisement(self)
+        if update_fields is None or "status" in update_fields:
+            self._loaded_status = self.status
+
+    def assign_slug(self):
+        """Заполняет slug и external_url сохранённого объявления (нужен id)"""
         if not self.slug:
             base_slug = custom_slugify(self.title)
             self.slug = f"{base_slug}-{self.pk}"
@@ -277,11 +612,12 @@ class Advertisement(models.Model):
         if not self.external_url:
             self.external_url = f"{SITE_NAME}/advertisement/{self.slug}/"
 
-        if is_new:
-            # Только если объект был новым — апдейт slug и external_url
-            Advertisement.objects.filter(pk=self.pk).update(
-                slug=self.slug, external_url=self.external_url
-            )
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            instance._loaded_status = values[field_names.index("status")]
+        return instance
 
     def __str__(self):
         return f"{self.title} - {self.formatted_price()}"
@@ -304,6 +640,304 @@ class Advertisement(models.Model):
         return f"{self.price:.2f} руб."
 
 
+# Денормализованная карточка объявления для списков
+class AdvertisementCard(models.Model):
+    """
+    Плоская копия данных, нужных спискам объявлений: строки локации,
+    категории и типа, обложка. Поддерживается сигналами, поэтому списки
+    читают одну таблицу вместо трёх join и запроса фото на каждую строку.
+    """
+
+    advertisement = models.OneToOneField(
+        Advertisement,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="card",
+        verbose_name="Объявление",
+    )
+    title = models.CharField(max_length=200, verbose_name="Заголовок")
+    price = models.DecimalField(max_digits=20, decimal_places=2, verbose_name="Цена")
+    square = models.DecimalField(max_digits=4, decimal_places=1, verbose_name="Площадь")
+    location = models.CharField(max_length=430, verbose_name="Адрес")
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="+", verbose_name="Категория"
+    )
+    category_name = models.CharField(max_length=100, verbose_name="Название категории")
+    property_type_name = models.CharField(
+        max_length=100, verbose_name="Тип недвижимости"
+    )
+    status = models.CharField(max_length=10, verbose_name="Статус")
+    external_url = models.URLField(
+        max_length=500, null=True, blank=True, verbose_name="Внешняя ссылка"
+    )
+    image = models.CharField(
+        max_length=500, null=True, blank=True, verbose_name="Обложка"
+    )
+
+    class Meta:
+        verbose_name = "Карточка объявления"
+        verbose_name_plural = "Карточки объявлений"
+
+    def __str__(self):
+        return self.title
+
+    @staticmethod
+    def cover_urls(advertisement_ids):
+        """URL обложки (первое фото по display_order) для каждого объявления"""
+        covers = {}
+        photos = (
+            Photo.objects.filter(advertisement_id__in=advertisement_ids)
+            .order_by("advertisement_id", "display_order", "id")
+            .only("advertisement_id", "image")
+        )
+        for photo in photos:
+            if photo.advertisement_id in covers:
+                continue
+            covers[photo.advertisement_id] = photo.image.url if photo.image else None
+        return covers
+
+    @classmethod
+    def build(cls, advertisement, image=None):
+        return cls(
+            advertisement=advertisement,
+            title=advertisement.title,
+            price=advertisement.price,
+            square=advertisement.square,
+            location=str(advertisement.location),
+            category_id=advertisement.category_id,
+            category_name=advertisement.category.name,
+            property_type_name=advertisement.property_type.name,
+            status=advertisement.status,
+            external_url=advertisement.external_url,
+            image=image,
+        )
+
+    @classmethod
+    def refresh(cls, advertisement_ids):
+        """Пересобирает карточки указанных объявлений"""
+        advertisement_ids = list(advertisement_ids)
+        advertisements = Advertisement.objects.filter(
+            pk__in=advertisement_ids
+        ).select_related("location", "category", "property_type")
+        covers = cls.cover_urls(advertisement_ids)
+        cards = [cls.build(ad, covers.get(ad.pk)) for ad in advertisements]
+        # Один INSERT ... ON CONFLICT DO UPDATE вместо bulk_update, который
+        # строит CASE по каждой строке для каждого поля
+        cls.objects.bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=["advertisement"],
+            update_fields=[
+                field.name
+                for field in cls._meta.concrete_fields
+                if not field.primary_key
+            ],
+        )
+        return {card.pk: card for card in cards}
+
+    @classmethod
+    def refresh_cover(cls, advertisement_id):
+        """Обновляет обложку существующей карточки (новую не создаёт)"""
+        image = cls.cover_urls([advertisement_id]).get(advertisement_id)
+        cls.objects.filter(pk=advertisement_id).update(image=image)
+
+    @classmethod
+    def for_advertisements(cls, advertisements):
+        """
+        Карточки для объявлений в том же порядке. Ожидает queryset
+        с select_related("card"); недостающие карточки собирает на лету.
+        """
+        advertisements = list(advertisements)
+        cards = {}
+        missing = []
+        for ad in advertisements:
+            try:
+                cards[ad.pk] = ad.card
+            except cls.DoesNotExist:
+                missing.append(ad.pk)
+        if missing:
+            cards.update(cls.refresh(missing))
+        result = []
+        for ad in advertisements:
+            card = cards.get(ad.pk)
+            if card is None:
+                continue
+            # Сохраняем аннотации объявления (например, количество избранных)
+            card.advertisement = ad
+            result.append(card)
+        return result
+
+
+# Сохранённый поиск пользователя (уведомления о новых объявлениях)
+class SavedSearch(models.Model):
+    """
+    query — параметры AdvertisementFilter, как в запросе ленты.
+    Простые критерии из query продублированы в столбцах: по ним
+    сопоставитель строит индекс и проверяет объявления без запросов к базе.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="saved_searches",
+        verbose_name="Пользователь",
+    )
+    name = models.CharField(max_length=100, blank=True, verbose_name="Название")
+    query = models.JSONField(default=dict, verbose_name="Параметры поиска")
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Категория",
+    )
+    property_type = models.ForeignKey(
+        PropertyType,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Тип недвижимости",
+    )
+    city = models.CharField(max_length=100, blank=True, verbose_name="Город")
+    price_min = models.DecimalField(
+        max_digits=20, decimal_places=2, null=True, blank=True, verbose_name="Цена от"
+    )
+    price_max = models.DecimalField(
+        max_digits=20, decimal_places=2, null=True, blank=True, verbose_name="Цена до"
+    )
+    square_min = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, blank=True, verbose_name="Площадь от"
+    )
+    square_max = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, blank=True, verbose_name="Площадь до"
+    )
+    price_per_sqm_min = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Цена за м² от",
+    )
+    price_per_sqm_max = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Цена за м² до",
+    )
+    # В query есть условия, которые проверяются запросом к базе
+    # (полнотекстовый поиск, область карты, радиус)
+    has_extra_filters = models.BooleanField(
+        default=False, verbose_name="Есть сложные условия"
+    )
+    is_active = models.BooleanField(default=True, verbose_name="Уведомлять")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    class Meta:
+        verbose_name = "Сохранённый поиск"
+        verbose_name_plural = "Сохранённые поиски"
+        ordering = ["-created_at"]
+        indexes = [
+            # Догрузка изменённых поисков в индекс сопоставителя
+            models.Index(fields=["updated_at"], name="saved_search_updated_idx"),
+        ]
+
+    def __str__(self):
+        return self.name or f"Поиск {self.pk}"
+
+
+# Загрузка фида объявлений агентства (CSV / JSON / XML)
+class FeedImport(models.Model):
+    """
+    Файл фида обрабатывается задачей import_advertisement_feed;
+    в report — число созданных и обновлённых объявлений и ошибки
+    по строкам.
+    """
+
+    FORMAT_CHOICES = [("csv", "CSV"), ("json", "JSON"), ("xml", "XML")]
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("processing", "Обрабатывается"),
+        ("done", "Готово"),
+        ("failed", "Ошибка"),
+    ]
+
+    agency = models.ForeignKey(
+        Agency,
+        on_delete=models.CASCADE,
+        related_name="feed_imports",
+        verbose_name="Агентство",
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_imports",
+        verbose_name="Пользователь",
+    )
+    file = models.FileField(upload_to="feed_imports/", verbose_name="Файл фида")
+    format = models.CharField(
+        max_length=4, choices=FORMAT_CHOICES, verbose_name="Формат"
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    report = models.JSONField(default=dict, blank=True, verbose_name="Отчёт")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата обработки"
+    )
+
+    class Meta:
+        verbose_name = "Импорт фида"
+        verbose_name_plural = "Импорты фидов"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.agency} — {self.file.name} ({self.get_status_display()})"
+
+
+# Похожие объявления, заранее посчитанные фоновой задачей
+class SimilarAdvertisements(models.Model):
+    """
+    Одна строка на активное объявление: id соседей по возрастанию
+    расстояния. Пересчитывается задачей refresh_similar_advertisements,
+    страница объявления только читает готовый список.
+    """
+
+    advertisement = models.OneToOneField(
+        Advertisement,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="similar_listings",
+        verbose_name="Объявление",
+    )
+    similar_ids = models.JSONField(default=list, verbose_name="Похожие объявления")
+    computed_at = models.DateTimeField(verbose_name="Дата расчёта")
+    # Признаки объявления на момент расчёта: пересчёт нужен, только если
+    # они изменились (избранное и правки текста список не меняют)
+    price = models.DecimalField(
+        max_digits=20, decimal_places=2, null=True, verbose_name="Цена при расчёте"
+    )
+    square = models.DecimalField(
+        max_digits=4, decimal_places=1, null=True, verbose_name="Площадь при расчёте"
+    )
+    category_id = models.IntegerField(null=True, verbose_name="Категория при расчёте")
+    property_type_id = models.IntegerField(
+        null=True, verbose_name="Тип недвижимости при расчёте"
+    )
+    location_id = models.IntegerField(null=True, verbose_name="Локация при расчёте")
+
+    class Meta:
+        verbose_name = "Похожие объявления"
+        verbose_name_plural = "Похожие объявления"
+
+    def __str__(self):
+        return f"Похожие для {self.advertisement_id}"
+
+
 # Файл к объявлению (планировка или договор)
 class AdvertisementFile(models.Model):
     advertisement = models.ForeignKey(
@@ -430,15 +1064,38 @@ class Notification(models.Model):
     )
     message = models.TextField(verbose_name="Сообщение")
 
+    # Статус на момент чтения из базы: по нему сигналы меняют
+    # счётчик непрочитанных пользователя
+    _loaded_status = None
+
     class Meta:
         verbose_name = "Уведомление"
         verbose_name_plural = "Уведомления"
+        indexes = [
+            # Счётчик непрочитанных и списки уведомлений пользователя
+            models.Index(fields=["user", "status"], name="notification_user_status_idx"),
+        ]
 
     def __str__(self):
         return (
             f"Уведомление для {self.user.name}: {self.get_notification_type_display()}"
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            instance._loaded_status = values[field_names.index("status")]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Уведомление и счётчик непрочитанных — в одной транзакции
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "status" in update_fields:
+            self._loaded_status = self.status
+
 
 # Модель статистики пользователей и объявлений
 class Statistics(models.Model):
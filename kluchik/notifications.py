@@ -0,0 +1,190 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Iterator, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    Advertisement,
+    AgencySubscription,
+    FavoriteAdvertisement,
+    Notification,
+    User,
+)
+
+# Сколько получателей читается одним запросом (избранное, подписки)
+FAN_OUT_CHUNK_SIZE = 2000
+
+# Уведомлений в одном INSERT
+NOTIFICATION_BATCH_SIZE = 500
+
+
+def create_notifications(notifications: List[Notification]) -> int:
+    """
+    Сохраняет уведомления пачками и в той же транзакции увеличивает
+    счётчики непрочитанных получателей (bulk_create не вызывает сигналы):
+    один UPDATE на каждое различное число новых уведомлений у пользователя
+    """
+    unread = Counter(
+        notification.user_id
+        for notification in notifications
+        if notification.status == "sent"
+    )
+    user_ids_by_increment = defaultdict(list)
+    for user_id, increment in unread.items():
+        user_ids_by_increment[increment].append(user_id)
+    with transaction.atomic():
+        Notification.objects.bulk_create(
+            notifications, batch_size=NOTIFICATION_BATCH_SIZE
+        )
+        for increment, user_ids in user_ids_by_increment.items():
+            User.objects.filter(pk__in=user_ids).update(
+                unread_notification_count=F("unread_notification_count") + increment
+            )
+    return len(notifications)
+
+
+def ad_update_pending_key(advertisement_id: int) -> str:
+    return f"notifications:ad_update:{advertisement_id}:pending"
+
+
+def claim_ad_update(advertisement_id: int) -> bool:
+    """
+    True для первой правки объявления в окне объединения: она ставит
+    рассылку с задержкой на окно, остальные правки в окне попадут в ту же
+    рассылку
+    """
+    return cache.add(
+        ad_update_pending_key(advertisement_id),
+        True,
+        settings.AD_UPDATE_NOTIFICATION_WINDOW,
+    )
+
+
+def user_id_chunks(queryset, chunk_size: int) -> Iterator[List[int]]:
+    """
+    user_id строк queryset пачками: keyset по pk, каждый запрос читает
+    следующую пачку по индексу без OFFSET
+    """
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "user_id")[:chunk_size]
+        )
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield [user_id for _, user_id in rows]
+
+
+def notify_ad_update(advertisement_id: int, chunk_size: int = FAN_OUT_CHUNK_SIZE) -> int:
+    """
+    Создаёт уведомления ad_update всем, у кого объявление в избранном.
+    Пользователи, уже получившие ad_update по объявлению за окно
+    объединения, пропускаются: так правки не размножаются, даже если
+    кэш с отметкой рассылки общий не для всех процессов.
+    """
+    # Правки после этого момента ставят следующую рассылку
+    cache.delete(ad_update_pending_key(advertisement_id))
+    if not Advertisement.objects.filter(pk=advertisement_id).exists():
+        return 0
+
+    since = timezone.now() - timedelta(seconds=settings.AD_UPDATE_NOTIFICATION_WINDOW)
+    created = 0
+    favorites = FavoriteAdvertisement.objects.filter(advertisement_id=advertisement_id)
+    for user_ids in user_id_chunks(favorites, chunk_size):
+        notified = set(
+            Notification.objects.filter(
+                advertisement_id=advertisement_id,
+                notification_type="ad_update",
+                created_at__gte=since,
+                user_id__in=user_ids,
+            ).values_list("user_id", flat=True)
+        )
+        notifications = [
+            Notification(
+                user_id=user_id,
+                advertisement_id=advertisement_id,
+                notification_type="ad_update",
+                status="sent",
+                message="Объявление было обновлено.",
+            )
+            for user_id in user_ids
+            if user_id not in notified
+        ]
+        created += create_notifications(notifications)
+    return created
+
+
+def notify_agency_subscribers(
+    advertisement_id: int, chunk_size: int = FAN_OUT_CHUNK_SIZE
+) -> int:
+    """
+    Создаёт уведомления new_ad подписчикам агентства опубликованного
+    объявления. Каждая пачка подписчиков сохраняется в своей короткой
+    транзакции, поэтому запись в SQLite не блокируется на всю рассылку.
+    Автор объявления и уже получившие new_ad по нему (например, по
+    сохранённому поиску или при повторной публикации) пропускаются.
+    """
+    return notify_agency_subscribers_of_ads([advertisement_id], chunk_size)
+
+
+def notify_agency_subscribers_of_ads(
+    advertisement_ids: List[int], chunk_size: int = FAN_OUT_CHUNK_SIZE
+) -> int:
+    """
+    То же для пачки объявлений (например, опубликованных импортом фида):
+    подписчики агентства читаются один раз на всю пачку, а размер пачки
+    подписчиков уменьшается так, чтобы транзакция сохраняла не больше
+    chunk_size уведомлений
+    """
+    advertisements = (
+        Advertisement.objects.filter(
+            pk__in=advertisement_ids, status="active", agency__isnull=False
+        )
+        .select_related("agency")
+        .only("id", "title", "user_id", "agency__name")
+        .order_by("pk")
+    )
+    by_agency = defaultdict(list)
+    for advertisement in advertisements:
+        by_agency[advertisement.agency_id].append(advertisement)
+
+    created = 0
+    for agency_id, ads in by_agency.items():
+        ad_ids = [advertisement.pk for advertisement in ads]
+        subscriptions = AgencySubscription.objects.filter(agency_id=agency_id)
+        users_per_chunk = max(1, chunk_size // len(ads))
+        for user_ids in user_id_chunks(subscriptions, users_per_chunk):
+            with transaction.atomic():
+                notified = set(
+                    Notification.objects.filter(
+                        advertisement_id__in=ad_ids,
+                        notification_type="new_ad",
+                        user_id__in=user_ids,
+                    ).values_list("user_id", "advertisement_id")
+                )
+                notifications = [
+                    Notification(
+                        user_id=user_id,
+                        advertisement_id=advertisement.pk,
+                        notification_type="new_ad",
+                        status="sent",
+                        message=(
+                            f"Новое объявление агентства «{advertisement.agency.name}»: "
+                            f"{advertisement.title}"
+                        ),
+                    )
+                    for advertisement in ads
+                    for user_id in user_ids
+                    if user_id != advertisement.user_id
+                    and (user_id, advertisement.pk) not in notified
+                ]
+                created += create_notifications(notifications)
+    return created
@@ -0,0 +1,299 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Any, List, Optional, Set, Tuple
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import F, Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset-пагинация (курсор по значениям полей сортировки + id)
+class KeysetCursorPagination(BasePagination):
+    """
+    Пагинация по курсору, в котором хранятся значения полей сортировки
+    последней (или первой) записи страницы. Следующая страница выбирается
+    условием вида (date_posted, id) < (:date_posted, :id), поэтому
+    стоимость запроса не зависит от глубины страницы.
+
+    Порядок берётся из queryset (order_by или Meta.ordering), к нему всегда
+    добавляется id для однозначности. Поддерживаются поля модели (в том
+    числе допускающие NULL — NULL считается наименьшим значением на любой
+    СУБД) и аннотации, не допускающие NULL.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    count_query_param = "with_count"
+    # Больше этого числа записей точно не считаем — отдаём оценку снизу
+    count_limit = 1000
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view: Any = None
+    ) -> Optional[List[Any]]:
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.nullable = self.get_nullable_fields(queryset)
+        self.total = None
+
+        if self.count_query_param in request.query_params:
+            self.total = self.get_bounded_count(queryset)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            values, reverse = cursor
+            cursor = self.clean_cursor_values(queryset, values), reverse
+        return self.fetch_page(queryset, cursor)
+
+    def paginate_first_page(
+        self, queryset: QuerySet, request: Request, base_url: str
+    ) -> List[Any]:
+        """
+        Первая страница queryset для вложения в другой ответ (размер по
+        умолчанию, параметры запроса не читаются). Ссылка next ведёт на
+        base_url — ресурс, который отдаёт этот список целиком.
+        """
+        self.request = request
+        self.base_url = base_url
+        self.ordering = self.get_ordering(queryset)
+        self.nullable = self.get_nullable_fields(queryset)
+        self.total = None
+        return self.fetch_page(queryset, None)
+
+    def fetch_page(
+        self, queryset: QuerySet, cursor: Optional[Tuple[List[Any], bool]]
+    ) -> List[Any]:
+        """Страница после (или перед) cursor; без курсора — первая"""
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            if len(values) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self.get_keyset_filter(values, reverse))
+
+        order_by = [
+            self.order_expression(self.reverse_field(field) if reverse else field)
+            for field in self.ordering
+        ]
+        results = list(queryset.order_by(*order_by)[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data: List[Any]) -> Response:
+        payload = OrderedDict(
+            [
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+            ]
+        )
+        if self.total is not None:
+            count, exact = self.total
+            payload["count"] = count
+            payload["count_is_exact"] = exact
+        payload["results"] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "count": {"type": "integer"},
+                "count_is_exact": {"type": "boolean"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset: QuerySet) -> List[str]:
+        """Поля сортировки queryset с добавленным в конец id"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering or [])
+        for field in ordering:
+            if not isinstance(field, str):
+                raise TypeError("Keyset-пагинация поддерживает только строковые поля сортировки.")
+        names = [field.lstrip("-") for field in ordering]
+        if "id" not in names and "pk" not in names:
+            descending = ordering[0].startswith("-") if ordering else True
+            ordering.append("-id" if descending else "id")
+        return ordering
+
+    def get_bounded_count(self, queryset: QuerySet) -> Tuple[int, bool]:
+        """
+        Количество записей, посчитанное не дальше count_limit + 1 строки.
+        Для больших выборок возвращает count_limit и признак неточности.
+        """
+        count = queryset.order_by().values("pk")[: self.count_limit + 1].count()
+        if count > self.count_limit:
+            return self.count_limit, False
+        return count, True
+
+    def get_nullable_fields(self, queryset: QuerySet) -> Set[str]:
+        """Поля сортировки, которые могут содержать NULL"""
+        nullable = set()
+        for field in self.ordering:
+            name = field.lstrip("-")
+            try:
+                model_field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue  # аннотация
+            if model_field.null:
+                nullable.add(name)
+        return nullable
+
+    def clean_cursor_values(self, queryset: QuerySet, values: List[Any]) -> List[Any]:
+        """
+        Значения курсора, приведённые полями сортировки (to_python поля
+        модели или output_field аннотации). Курсор приходит от клиента:
+        любое несоответствие — 404, а не ошибка в запросе к базе.
+        """
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            if value is None:
+                cleaned.append(None)
+                continue
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+            name = field.lstrip("-")
+            try:
+                if name == "pk":
+                    model_field = queryset.model._meta.pk
+                elif name in queryset.query.annotations:
+                    model_field = queryset.query.annotations[name].output_field
+                else:
+                    model_field = queryset.model._meta.get_field(name)
+                cleaned.append(model_field.to_python(value))
+            except (FieldDoesNotExist, FieldError, ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def order_expression(self, field: str) -> Any:
+        """Поле сортировки; для допускающих NULL — с явным положением NULL"""
+        name = field.lstrip("-")
+        if name not in self.nullable:
+            return field
+        if field.startswith("-"):
+            return F(name).desc(nulls_last=True)
+        return F(name).asc(nulls_first=True)
+
+    @staticmethod
+    def reverse_field(field: str) -> str:
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def get_keyset_filter(self, values: List[Any], reverse: bool) -> Q:
+        """
+        Условие "строго после курсора" для составного ключа сортировки:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            condition = self.get_after_condition(name, values[index], descending)
+            if condition is None:
+                continue
+            for prev_field, prev_value in zip(self.ordering[:index], values[:index]):
+                # Q(field=None) превращается в IS NULL
+                condition &= Q(**{prev_field.lstrip("-"): prev_value})
+            conditions.append(condition)
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(or_, conditions)
+
+    def get_after_condition(self, name: str, value: Any, descending: bool) -> Optional[Q]:
+        """Условие "значение поля строго после value"; None — таких значений нет"""
+        if value is None:
+            # NULL — наименьшее значение: по возрастанию после него идут
+            # все непустые, по убыванию — ничего
+            return None if descending else Q(**{f"{name}__isnull": False})
+        lookup = "lt" if descending else "gt"
+        condition = Q(**{f"{name}__{lookup}": value})
+        if descending and name in self.nullable:
+            condition |= Q(**{f"{name}__isnull": True})
+        return condition
+
+    def get_position(self, instance: Any) -> List[Any]:
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip("-"))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+        return position
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, values: List[Any], reverse: bool) -> str:
+        payload = {"v": values}
+        if reverse:
+            payload["r"] = 1
+        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        encoded = b64encode(data).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request: Request) -> Optional[Tuple[List[Any], bool]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            values = payload["v"]
+            reverse = bool(payload.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+
+# Пагинация ленты объявлений
+class AdvertisementCursorPagination(KeysetCursorPagination):
+    page_size = 20
+    max_page_size = 100
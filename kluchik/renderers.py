@@ -0,0 +1,66 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Символы-разделители строк, которые JSONRenderer DRF экранирует
+# (они допустимы в JSON, но ломают JavaScript)
+LINE_SEPARATOR = "\u2028".encode("utf-8")
+PARAGRAPH_SEPARATOR = "\u2029".encode("utf-8")
+
+
+# JSON-рендерер на orjson
+class ORJSONRenderer(JSONRenderer):
+    """
+    Компактный JSON без ensure_ascii, как у JSONRenderer DRF, но
+    кодирование выполняет orjson. Типы, которых orjson не знает или
+    кодирует иначе (Decimal, datetime, ленивые строки), передаются в
+    JSONEncoder DRF и выглядят так же, как у DRF. Отличаются числа
+    с плавающей точкой: экспонента пишется короче (1e16, 1.5e-7 вместо
+    1e+16, 1.5e-07 — значение то же), а NaN и бесконечность становятся
+    null, тогда как DRF (STRICT_JSON) бросает ValueError.
+    Запросы с отступами (indent) и то, что orjson не может закодировать,
+    обрабатываются стандартным рендерером.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) or not (
+            self.compact and not self.ensure_ascii
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028").replace(
+                PARAGRAPH_SEPARATOR, b"\\u2029"
+            )
+        return ret
+
+
+# Рендерер MessagePack для мобильных клиентов (Accept: application/msgpack)
+class MessagePackRenderer(BaseRenderer):
+    """
+    Те же данные, что и в JSON, в двоичном формате MessagePack.
+    Decimal, datetime и прочие типы приводятся так же, как в JSON-ответе.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(
+            data, default=JSONEncoder().default, use_bin_type=True, datetime=False
+        )
@@ -0,0 +1,326 @@
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from itertools import product
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import search
+from .filters import AdvertisementFilter
+from .models import Advertisement, Notification, SavedSearch
+from .notifications import create_notifications
+
+# Параметры ленты, которые сохраняются в поиске
+SAVED_SEARCH_PARAMS = [
+    name for name in [*AdvertisementFilter.base_filters, "search"] if name != "ordering"
+]
+
+# Параметры, которые переносятся в столбцы SavedSearch и проверяются в памяти
+SIMPLE_PARAMS = [
+    "category",
+    "property_type",
+    "city",
+    "price_min",
+    "price_max",
+    "square_min",
+    "square_max",
+    "price_per_sqm_min",
+    "price_per_sqm_max",
+]
+
+# Корзины индекса: номер корзины — число двоичных разрядов целой части
+# значения (корзина k содержит [2^(k-1), 2^k)), ограниченное диапазоном
+PRICE_BUCKETS = (14, 34)  # от ~16 тыс. до ~17 млрд
+SQUARE_BUCKETS = (2, 11)  # от 4 до 2047 м²
+
+# Поиски, изменённые незадолго до прошлой синхронизации, перечитываются
+# ещё раз: транзакция могла закоммититься уже после неё
+SYNC_OVERLAP = timedelta(minutes=1)
+
+# Раз в столько секунд индекс строится заново (удалённые поиски)
+REBUILD_INTERVAL = 3600
+
+Criteria = namedtuple(
+    "Criteria",
+    [
+        "id",
+        "category_id",
+        "property_type_id",
+        "city",
+        "price_min",
+        "price_max",
+        "square_min",
+        "square_max",
+        "price_per_sqm_min",
+        "price_per_sqm_max",
+        "has_extra_filters",
+    ],
+)
+
+
+def clean_query(query: Mapping) -> Tuple[Dict[str, str], Dict]:
+    """
+    Проверяет параметры так же, как лента, и возвращает нормализованный
+    query (только известные непустые параметры) и cleaned_data фильтра.
+    """
+    if not isinstance(query, Mapping):
+        raise ValidationError(["Ожидается объект с параметрами поиска."])
+    normalized = {
+        key: str(value).strip()
+        for key, value in query.items()
+        if key in SAVED_SEARCH_PARAMS and value is not None and str(value).strip()
+    }
+    filterset = AdvertisementFilter(
+        data=normalized, queryset=Advertisement.objects.none()
+    )
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    # Методы фильтров (bbox, radius) проверяют свои параметры при сборке queryset
+    filterset.qs
+    return normalized, filterset.form.cleaned_data
+
+
+def apply_query(saved_search: SavedSearch, query: Mapping) -> SavedSearch:
+    """Записывает query и столбцы критериев (объект не сохраняется)"""
+    normalized, cleaned = clean_query(query)
+    saved_search.query = normalized
+    saved_search.category = cleaned.get("category")
+    saved_search.property_type = cleaned.get("property_type")
+    saved_search.city = cleaned.get("city") or ""
+    for name in SIMPLE_PARAMS[3:]:
+        setattr(saved_search, name, cleaned.get(name))
+    saved_search.has_extra_filters = any(
+        name not in SIMPLE_PARAMS for name in normalized
+    )
+    return saved_search
+
+
+def bucket(value, bounds: Tuple[int, int]) -> int:
+    low, high = bounds
+    return min(max(int(value).bit_length(), low), high) - low
+
+
+def bucket_range(minimum, maximum, bounds: Tuple[int, int]) -> range:
+    """Корзины, которые пересекает диапазон [minimum, maximum]"""
+    first = bucket(minimum, bounds) if minimum is not None and minimum > 0 else 0
+    last = bucket(maximum, bounds) if maximum is not None else bounds[1] - bounds[0]
+    return range(first, max(first, last) + 1)
+
+
+def in_range(value, minimum, maximum) -> bool:
+    if minimum is None and maximum is None:
+        return True
+    if value is None:
+        return False
+    return (minimum is None or value >= minimum) and (maximum is None or value <= maximum)
+
+
+# Инвертированный индекс сохранённых поисков
+class SavedSearchMatcher:
+    """
+    Поиски раскладываются по ключу (категория, тип, город) — None или
+    пустой город означают «любой» — и по корзинам цены и площади.
+    Для объявления берутся 8 ключей (точный и с подстановками),
+    пересечение множеств корзин его цены и площади даёт кандидатов,
+    которые затем проверяются точно.
+    Число просмотренных поисков не зависит от общего числа поисков,
+    только от числа похожих на объявление.
+
+    Индекс живёт в процессе воркера и догружает изменённые поиски
+    по updated_at перед каждым сопоставлением.
+    """
+
+    def __init__(self):
+        self.searches: Dict[int, Criteria] = {}
+        self.price_index = defaultdict(lambda: defaultdict(set))
+        self.square_index = defaultdict(lambda: defaultdict(set))
+        self.synced_at = None
+        self.built_at = time.monotonic()
+
+    def add(self, criteria: Criteria) -> None:
+        key = (criteria.category_id, criteria.property_type_id, criteria.city)
+        self.searches[criteria.id] = criteria
+        for number in bucket_range(criteria.price_min, criteria.price_max, PRICE_BUCKETS):
+            self.price_index[key][number].add(criteria.id)
+        for number in bucket_range(
+            criteria.square_min, criteria.square_max, SQUARE_BUCKETS
+        ):
+            self.square_index[key][number].add(criteria.id)
+
+    def remove(self, search_id: int) -> None:
+        criteria = self.searches.pop(search_id, None)
+        if criteria is None:
+            return
+        key = (criteria.category_id, criteria.property_type_id, criteria.city)
+        for number in bucket_range(criteria.price_min, criteria.price_max, PRICE_BUCKETS):
+            self.price_index[key][number].discard(search_id)
+        for number in bucket_range(
+            criteria.square_min, criteria.square_max, SQUARE_BUCKETS
+        ):
+            self.square_index[key][number].discard(search_id)
+
+    def load(self, rows: Iterable[tuple]) -> None:
+        """Строки values_list("is_active", *Criteria._fields)"""
+        for is_active, *values in rows:
+            criteria = Criteria(*values)
+            self.remove(criteria.id)
+            if is_active:
+                self.add(criteria)
+
+    def sync(self) -> int:
+        """Догружает поиски, изменённые с прошлой синхронизации"""
+        started = timezone.now()
+        queryset = SavedSearch.objects.all()
+        if self.synced_at is not None:
+            queryset = queryset.filter(updated_at__gte=self.synced_at)
+        rows = list(queryset.values_list("is_active", *Criteria._fields))
+        self.load(rows)
+        self.synced_at = started - SYNC_OVERLAP
+        return len(rows)
+
+    def candidates(self, advertisement: Advertisement) -> Set[int]:
+        price_bucket = bucket(advertisement.price, PRICE_BUCKETS)
+        square_bucket = bucket(advertisement.square, SQUARE_BUCKETS)
+        found = set()
+        # Точный ключ и ключи с подстановкой «любой» (None / пустой город)
+        for key in product(
+            {advertisement.category_id, None},
+            {advertisement.property_type_id, None},
+            {advertisement.location.city, ""},
+        ):
+            if key not in self.price_index:
+                continue
+            by_price = self.price_index[key].get(price_bucket)
+            by_square = self.square_index[key].get(square_bucket)
+            if by_price and by_square:
+                found |= by_price & by_square
+        return found
+
+    def matches(self, advertisement: Advertisement, criteria: Criteria) -> bool:
+        return (
+            (criteria.category_id is None or criteria.category_id == advertisement.category_id)
+            and (
+                criteria.property_type_id is None
+                or criteria.property_type_id == advertisement.property_type_id
+            )
+            and (not criteria.city or criteria.city == advertisement.location.city)
+            and in_range(advertisement.price, criteria.price_min, criteria.price_max)
+            and in_range(advertisement.square, criteria.square_min, criteria.square_max)
+            and in_range(
+                advertisement.price_per_sqm,
+                criteria.price_per_sqm_min,
+                criteria.price_per_sqm_max,
+            )
+        )
+
+    def match(self, advertisement: Advertisement) -> List[int]:
+        """id поисков, простые условия которых выполняются для объявления"""
+        return sorted(
+            search_id
+            for search_id in self.candidates(advertisement)
+            if self.matches(advertisement, self.searches[search_id])
+        )
+
+
+_matcher: Optional[SavedSearchMatcher] = None
+
+
+def get_matcher() -> SavedSearchMatcher:
+    """Индекс процесса, синхронизированный с базой"""
+    global _matcher
+    if _matcher is None or time.monotonic() - _matcher.built_at > REBUILD_INTERVAL:
+        _matcher = SavedSearchMatcher()
+    _matcher.sync()
+    return _matcher
+
+
+def reset_matcher() -> None:
+    global _matcher
+    _matcher = None
+
+
+def matches_extra_filters(advertisement: Advertisement, query: Mapping) -> bool:
+    """Проверка поиска с полнотекстовым запросом или картой через базу"""
+    queryset = AdvertisementFilter(
+        data=query, queryset=Advertisement.objects.filter(pk=advertisement.pk)
+    ).qs
+    text = query.get("search")
+    if text:
+        # Те же термины, что и у SearchFilter ленты
+        terms = text.replace(",", " ").split()
+        if search.is_available():
+            match = search.build_match_query(terms)
+            if match:
+                queryset = queryset.filter(pk__in=RawSQL(search.match_sql(), [match]))
+        else:
+            for term in terms:
+                queryset = queryset.filter(
+                    Q(title__icontains=term) | Q(description__icontains=term)
+                )
+    return queryset.exists()
+
+
+def notify_saved_searches(advertisement_id: int) -> int:
+    """
+    Создаёт уведомления new_ad владельцам сохранённых поисков, которым
+    подходит объявление. Одно уведомление на пользователя; владелец
+    объявления и уже уведомлённые пользователи пропускаются.
+    """
+    return notify_saved_searches_of_ads([advertisement_id])
+
+
+def notify_saved_searches_of_ads(advertisement_ids: List[int]) -> int:
+    """
+    То же для пачки объявлений (например, опубликованных импортом фида):
+    объявления читаются одним запросом, сопоставитель — в памяти
+    """
+    advertisements = (
+        Advertisement.objects.filter(pk__in=advertisement_ids, status="active")
+        .select_related("location")
+        .order_by("pk")
+    )
+    return sum(
+        notify_matching_searches(advertisement) for advertisement in advertisements
+    )
+
+
+def notify_matching_searches(advertisement: Advertisement) -> int:
+    """Уведомления new_ad по сохранённым поискам для загруженного объявления"""
+    matched = get_matcher().match(advertisement)
+    if not matched:
+        return 0
+
+    # Перепроверяем по базе: поиск мог быть удалён или выключен
+    searches = (
+        SavedSearch.objects.filter(pk__in=matched, is_active=True)
+        .exclude(user_id=advertisement.user_id)
+        .order_by("id")
+        .values_list("id", "user_id", "name", "query", "has_extra_filters")
+    )
+    notified = set(
+        Notification.objects.filter(
+            advertisement=advertisement, notification_type="new_ad"
+        ).values_list("user_id", flat=True)
+    )
+    notifications = []
+    for _, user_id, name, query, has_extra_filters in searches:
+        if user_id in notified:
+            continue
+        if has_extra_filters and not matches_extra_filters(advertisement, query):
+            continue
+        notified.add(user_id)
+        title = f"поиску «{name}»" if name else "сохранённому поиску"
+        notifications.append(
+            Notification(
+                user_id=user_id,
+                advertisement=advertisement,
+                notification_type="new_ad",
+                status="sent",
+                message=f"Новое объявление по {title}: {advertisement.title}",
+            )
+        )
+    return create_notifications(notifications)
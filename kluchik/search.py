@@ -0,0 +1,158 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Таблица полнотекстового индекса (FTS5) для объявлений
+FTS_TABLE = "kluchik_advertisement_fts"
+
+# Вес заголовка и описания при ранжировании bm25
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Окончания русских слов, отсекаемые лёгким стеммером (от длинных к коротким)
+RUSSIAN_ENDINGS = sorted(
+    [
+        "иями", "ями", "ами", "иях", "ях", "ах", "ией", "ей", "ой", "ий",
+        "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ого", "его", "ому", "ему",
+        "ыми", "ими", "ых", "их", "ую", "юю", "ом", "ем", "ам", "ям", "ов",
+        "ев", "ью", "ия", "ии", "ию", "а", "я", "о", "е", "ы", "и",
+        "у", "ю", "ь", "й",
+    ],
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+
+
+def is_available(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """FTS5-индекс есть только в SQLite (using — алиас базы)"""
+    return connections[using].vendor == "sqlite"
+
+
+def stem(word: str) -> str:
+    """Отсекает типичное окончание, чтобы «квартира» и «квартиру» совпали"""
+    word = word.lower().replace("ё", "е")
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[: -len(ending)]
+    return word
+
+
+def normalize(text: Optional[str]) -> str:
+    """Текст, приведённый к основам слов, — именно он хранится в индексе"""
+    if not text:
+        return ""
+    return " ".join(stem(word) for word in WORD_RE.findall(text))
+
+
+def build_match_query(terms: Iterable[str]) -> str:
+    """
+    Запрос MATCH: каждое слово — префиксный поиск по основе,
+    все слова обязательны.
+    """
+    stems = []
+    for term in terms:
+        for word in WORD_RE.findall(term):
+            stems.append(f'"{stem(word)}"*')
+    return " AND ".join(stems)
+
+
+def index_advertisement(advertisement) -> None:
+    """Добавляет или обновляет объявление в индексе той базы, где оно сохранено"""
+    using = advertisement._state.db or DEFAULT_DB_ALIAS
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [advertisement.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)",
+            [
+                advertisement.pk,
+                normalize(advertisement.title),
+                normalize(advertisement.description),
+            ],
+        )
+
+
+def index_advertisements(
+    rows: Iterable[Tuple[int, str, str]], using: str = DEFAULT_DB_ALIAS
+) -> int:
+    """Добавляет или обновляет пачку объявлений (id, title, description)"""
+    if not is_available(using):
+        return 0
+    rows = [
+        [pk, normalize(title), normalize(description)]
+        for pk, title, description in rows
+    ]
+    if not rows:
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[row[0]] for row in rows]
+        )
+        return _insert_rows(cursor, rows)
+
+
+def unindex_advertisement(advertisement_id: int, using: str = DEFAULT_DB_ALIAS) -> None:
+    """Удаляет объявление из индекса"""
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [advertisement_id])
+
+
+def rebuild_index(queryset, chunk_size: int = 1000) -> int:
+    """
+    Полностью пересобирает индекс по переданным объявлениям в той же
+    базе, из которой читает queryset (в миграции — база редактора схемы)
+    """
+    if not is_available(queryset.db):
+        return 0
+    total = 0
+    rows: List[list] = []
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        for pk, title, description in queryset.values_list(
+            "pk", "title", "description"
+        ).iterator(chunk_size=chunk_size):
+            rows.append([pk, normalize(title), normalize(description)])
+            if len(rows) >= chunk_size:
+                total += _insert_rows(cursor, rows)
+                rows = []
+        if rows:
+            total += _insert_rows(cursor, rows)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def _insert_rows(cursor, rows: List[list]) -> int:
+    cursor.executemany(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)",
+        rows,
+    )
+    return len(rows)
+
+
+def match_sql() -> str:
+    """Подзапрос с id объявлений, подходящих под MATCH"""
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+
+
+def join_where(column: str) -> List[str]:
+    """
+    Условия присоединения FTS-таблицы к запросу объявлений (column — их
+    id): MATCH выполняется один раз, а bm25 читается из найденных строк
+    """
+    return [f"{FTS_TABLE}.rowid = {column}", f"{FTS_TABLE} MATCH %s"]
+
+
+def rank_sql() -> str:
+    """
+    Релевантность bm25 присоединённой строки индекса (см. join_where).
+    Чем меньше значение, тем выше релевантность.
+    """
+    return f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})"
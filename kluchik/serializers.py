@@ -13,7 +13,17 @@ from djoser.serializers import (
     UserCreateSerializer as BaseUserCreateSerializer,
     UserSerializer as BaseUserSerializer,
 )
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
+from django.db.models import Prefetch
+from rest_framework.fields import is_simple_callable
+from django.urls import reverse
 from .models import *
+from .pagination import AdvertisementCursorPagination
+from .saved_searches import apply_query, clean_query
+from .feed_import import detect_format
+from . import favorites, tasks
+from operator import attrgetter
 import re
 
 
@@ -21,6 +31,204 @@ import re
 User = get_user_model()
 
 
+# Примесь для выборочных полей (?fields=) и раскрытия связей (?expand=)
+class SparseFieldsetMixin:
+    """
+    ?fields=id,title,price — в ответе остаются только перечисленные поля.
+    ?expand=location,agency — строковое представление связи заменяется
+    вложенным объектом (см. get_expandable_fields).
+
+    Meta.field_dependencies описывает, что нужно полю из базы:
+    select_related, prefetch_related и столбцы для only(); для раскрытого
+    поля — expanded_only (по умолчанию вся связанная строка). Поля без
+    описания считаются столбцами модели. По этому описанию
+    optimize_queryset сужает queryset под запрошенный набор полей.
+
+    Параметры читаются из запроса только корневым сериализатором.
+    """
+
+    fields_query_param = "fields"
+    expand_query_param = "expand"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        requested, expand = self.get_requested_fields(request)
+        expandable = self.get_expandable_fields()
+        for name in expand & set(expandable):
+            if name in self.fields:
+                self.fields[name] = expandable[name]
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    def get_expandable_fields(self):
+        """Поле -> вложенный сериализатор, подставляемый при ?expand="""
+        return {}
+
+    @classmethod
+    def parse_field_list(cls, value):
+        return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """(набор полей или None, если ограничения нет; раскрываемые поля)"""
+        params = getattr(request, "query_params", request.GET)
+        requested = cls.parse_field_list(params.get(cls.fields_query_param)) or None
+        expand = cls.parse_field_list(params.get(cls.expand_query_param))
+        return requested, expand
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        """
+        Сбрасывает select_related/prefetch_related исходного queryset и
+        подключает только связи и столбцы, нужные запрошенным полям.
+        """
+        requested, expand = cls.get_requested_fields(request)
+        dependencies = getattr(cls.Meta, "field_dependencies", {})
+        names = [
+            name for name in cls.Meta.fields if requested is None or name in requested
+        ]
+
+        select_related, prefetch_related, columns = set(), {}, {"pk"}
+        for name in names:
+            dependency = dependencies.get(name)
+            if dependency is None:
+                columns.add(name)
+                continue
+            select_related.update(dependency.get("select_related", ()))
+            for lookup in dependency.get("prefetch_related", ()):
+                prefetch_related[getattr(lookup, "prefetch_to", lookup)] = lookup
+            if name in expand:
+                columns.update(
+                    dependency.get("expanded_only", dependency.get("select_related", ()))
+                )
+            else:
+                columns.update(dependency.get("only", ()))
+
+        # Если связь загружается целиком, частичные столбцы её бы обрезали
+        columns = {
+            column
+            for column in columns
+            if "__" not in column or column.split("__", 1)[0] not in columns
+        }
+        # Внешний ключ связи из select_related не должен оказаться отложенным
+        for relation in select_related:
+            root = relation.split("__", 1)[0]
+            if not any(column.split("__", 1)[0] == root for column in columns):
+                columns.add(root)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            # select_related() без аргументов подтянул бы все внешние ключи
+            queryset = queryset.select_related(*sorted(select_related))
+        return queryset.prefetch_related(*prefetch_related.values()).only(
+            *sorted(columns)
+        )
+
+
+# Быстрая сериализация списков только для чтения
+class FastListSerializer(serializers.ListSerializer):
+    """
+    Вместо вызова to_representation дочернего сериализатора для каждой
+    строки один раз компилирует для каждого поля функцию-доступ
+    (attrgetter по source + преобразование значения) и строит словари
+    в одном цикле. Результат совпадает с обычным ListSerializer байт в байт.
+
+    Подключается через Meta.list_serializer_class у сериализаторов,
+    которые используются в списках только на чтение.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        accessors = self.compile_accessors()
+        result = []
+        append = result.append
+        for instance in iterable:
+            item = {}
+            for name, accessor in accessors:
+                value = accessor(instance)
+                if value is not SKIP:
+                    item[name] = value
+            append(item)
+        return result
+
+    def compile_accessors(self):
+        """Пары (имя поля, функция instance -> значение) в порядке полей"""
+        return [
+            (field.field_name, compile_field_accessor(self.child, field))
+            for field in self.child._readable_fields
+        ]
+
+
+# Признак поля, которое нужно пропустить (SkipField в обычной сериализации)
+SKIP = object()
+
+
+def fast_converter(field):
+    """Преобразование значения поля; для простых полей — без лишних проверок"""
+    method = type(field).to_representation
+    if method is serializers.CharField.to_representation:
+        return str
+    if method is serializers.IntegerField.to_representation:
+        return int
+    if method is serializers.ReadOnlyField.to_representation:
+        return None
+    return field.to_representation
+
+
+def compile_field_accessor(serializer, field):
+    """
+    Функция instance -> значение поля с той же семантикой, что у
+    Serializer.to_representation. Необычные случаи (None в цепочке source,
+    связи по pk, source="*") обрабатываются штатным field.get_attribute.
+    """
+    if isinstance(field, serializers.SerializerMethodField):
+        return getattr(serializer, field.method_name)
+
+    convert = fast_converter(field)
+
+    def slow_accessor(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except serializers.SkipField:
+            return SKIP
+        check_for_none = (
+            attribute.pk if isinstance(attribute, serializers.PKOnlyObject) else attribute
+        )
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+
+    if field.source == "*" or isinstance(
+        field, (serializers.RelatedField, serializers.ManyRelatedField)
+    ):
+        return slow_accessor
+
+    getter = attrgetter(".".join(field.source_attrs))
+    # is_simple_callable разбирает сигнатуру через inspect — для одного
+    # поля ответ одинаков, поэтому запоминаем его по типу значения
+    simple_callable = {}
+
+    def accessor(instance):
+        try:
+            attribute = getter(instance)
+        except (AttributeError, KeyError, ObjectDoesNotExist):
+            return slow_accessor(instance)
+        if callable(attribute):
+            kind = type(attribute)
+            if kind not in simple_callable:
+                simple_callable[kind] = is_simple_callable(attribute)
+            if simple_callable[kind]:
+                attribute = attribute()
+        if attribute is None:
+            return None
+        return convert(attribute) if convert is not None else attribute
+
+    return accessor
+
+
 # Сериализатор для создания пользователя (расширяет Djoser)
 class UserCreateSerializer(BaseUserCreateSerializer):
     email = EmailField(required=True)
@@ -59,15 +267,49 @@ class UserSerializer(BaseUserSerializer):
         )
 
 
-# Сериализатор для модели объявлений в ленте
-class AdvertisementListSerializer(serializers.ModelSerializer):
-    location = serializers.StringRelatedField(read_only=True)
-    category = serializers.StringRelatedField(read_only=True)
-    property_type = serializers.StringRelatedField(read_only=True)
+# Примесь поля is_favorite: признак берётся из множества id избранного
+# пользователя, которое загружается один раз на запрос (favorites.py),
+# поэтому списки получают его без запроса на строку
+class FavoriteFlagMixin(serializers.Serializer):
+    is_favorite = serializers.SerializerMethodField()
+
+    # Функция request -> множество id избранного (None для анонимного)
+    favorite_ids = staticmethod(favorites.favorite_advertisement_ids)
+
+    def get_is_favorite(self, obj):
+        # Общий для всех пользователей документ (главная страница)
+        if self.context.get("shared"):
+            return None
+        ids = self.favorite_ids(self.context.get("request"))
+        return None if ids is None else obj.pk in ids
+
+
+# Базовый сериализатор карточки объявления (денормализованная таблица)
+class AdvertisementCardSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="advertisement_id", read_only=True)
+    location = serializers.CharField(read_only=True)
+    category = serializers.CharField(source="category_name", read_only=True)
+    property_type = serializers.CharField(source="property_type_name", read_only=True)
     image = serializers.SerializerMethodField()  # Поле для первой фотки
 
     class Meta:
-        model = Advertisement
+        model = AdvertisementCard
+        fields = ["id", "location", "category", "property_type", "image"]
+        read_only_fields = fields
+        list_serializer_class = FastListSerializer
+
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        request = self.context.get("request")
+        if request:
+            return request.build_absolute_uri(obj.image)
+        return obj.image
+
+
+# Сериализатор для модели объявлений в ленте
+class AdvertisementListSerializer(FavoriteFlagMixin, AdvertisementCardSerializer):
+    class Meta(AdvertisementCardSerializer.Meta):
         fields = [
             "id",
             "title",
@@ -78,27 +320,14 @@ class AdvertisementListSerializer(serializers.ModelSerializer):
             "property_type",
             "external_url",
             "image",
+            "is_favorite",
         ]
-
-    def get_image(self, obj):
-        first_photo = obj.photos.order_by("display_order").first()
-        if first_photo and first_photo.image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(first_photo.image.url)
-            return first_photo.image.url
-        return None
+        read_only_fields = fields
 
 
 # Сериализатор для модели объявлений в профиле пользователя
-class MyAdvertisementListSerializer(serializers.ModelSerializer):
-    location = serializers.StringRelatedField(read_only=True)
-    category = serializers.StringRelatedField(read_only=True)
-    property_type = serializers.StringRelatedField(read_only=True)
-    image = serializers.SerializerMethodField()  # Поле для первой фотки
-
-    class Meta:
-        model = Advertisement
+class MyAdvertisementListSerializer(AdvertisementCardSerializer):
+    class Meta(AdvertisementCardSerializer.Meta):
         fields = [
             "id",
             "title",
@@ -111,42 +340,38 @@ class MyAdvertisementListSerializer(serializers.ModelSerializer):
             "status",
             "image",
         ]
+        read_only_fields = fields
 
-    def get_image(self, obj):
-        first_photo = obj.photos.order_by("display_order").first()
-        if first_photo and first_photo.image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(first_photo.image.url)
-            return first_photo.image.url
-        return None
+
+# Сериализатор изменения объявления в профиле пользователя
+class MyAdvertisementUpdateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Advertisement
+        fields = ["id", "title", "price", "square", "external_url", "status"]
+        read_only_fields = ["id"]
+
+    def to_representation(self, instance):
+        # Ответ в том же виде, что и список: карточка уже после сохранения
+        card = AdvertisementCard.for_advertisements(
+            Advertisement.objects.filter(pk=instance.pk).select_related("card")
+        )[0]
+        return MyAdvertisementListSerializer(card, context=self.context).data
 
 
 # Сериализатор для последнего объявления (используется в главной странице - виджет)
-class LatestAdvertisementSerializer(serializers.ModelSerializer):
-    image = serializers.SerializerMethodField()
+class LatestAdvertisementSerializer(AdvertisementCardSerializer):
+    category = serializers.IntegerField(source="category_id", read_only=True)
 
-    class Meta:
-        model = Advertisement
+    class Meta(AdvertisementCardSerializer.Meta):
         fields = ["id", "title", "price", "image", "category", "external_url"]
-
-    def get_image(self, obj):
-        first_photo = obj.photos.order_by("display_order").first()
-        if first_photo and first_photo.image:
-            request = self.context.get("request")
-            return (
-                request.build_absolute_uri(first_photo.image.url)
-                if request
-                else first_photo.image.url
-            )
-        return None
+        read_only_fields = fields
 
 
 #  Сериализатор для модели популярных агентств (используется в главной странице - виджет)
 class PopularAgencySerializer(serializers.ModelSerializer):
-    subscriber_count = serializers.IntegerField()
-    active_ads_count = serializers.SerializerMethodField()
-    annotated_agent_count = serializers.IntegerField()
+    annotated_agent_count = serializers.IntegerField(
+        source="agent_count", read_only=True
+    )
 
     class Meta:
         model = Agency
@@ -159,17 +384,15 @@ class PopularAgencySerializer(serializers.ModelSerializer):
             "annotated_agent_count",
         ]
 
-    def get_active_ads_count(self, obj):
-        return obj.advertisements.filter(status="active").count()
-
 
 # Сериализатор для отображения популяного объявления (используется в главной странице - виджет)
-class PopularAdvertisementSerializer(serializers.ModelSerializer):
-    favorite_count = serializers.IntegerField()
-    image = serializers.SerializerMethodField()
+class PopularAdvertisementSerializer(AdvertisementCardSerializer):
+    favorite_count = serializers.IntegerField(
+        source="advertisement.favorite_count", read_only=True
+    )
+    category = serializers.IntegerField(source="category_id", read_only=True)
 
-    class Meta:
-        model = Advertisement
+    class Meta(AdvertisementCardSerializer.Meta):
         fields = [
             "id",
             "title",
@@ -179,21 +402,27 @@ class PopularAdvertisementSerializer(serializers.ModelSerializer):
             "image",
             "external_url",
         ]
+        read_only_fields = fields
 
-    def get_image(self, obj):
-        first_photo = obj.photos.order_by("display_order").first()
-        if first_photo and first_photo.image:
-            request = self.context.get("request")
-            return (
-                request.build_absolute_uri(first_photo.image.url)
-                if request
-                else first_photo.image.url
-            )
-        return None
+
+# Сериализатор адреса (раскрытие ?expand=location)
+class LocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = ["id", "city", "district", "street", "house", "latitude", "longitude"]
+
+
+# Краткая информация об агентстве (раскрытие ?expand=agency)
+class AgencyShortSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Agency
+        fields = ["id", "name", "slug", "external_url"]
 
 
 # Сериализатор для детального просмотра объявления
-class AdvertisementDetailSerializer(serializers.ModelSerializer):
+class AdvertisementDetailSerializer(
+    SparseFieldsetMixin, FavoriteFlagMixin, serializers.ModelSerializer
+):
     location = serializers.StringRelatedField(read_only=True)
     category = serializers.StringRelatedField(read_only=True)
     property_type = serializers.StringRelatedField(read_only=True)
@@ -205,7 +434,7 @@ class AdvertisementDetailSerializer(serializers.ModelSerializer):
     surname = serializers.SerializerMethodField()
     patronymic = serializers.SerializerMethodField()
     email = serializers.SerializerMethodField()
-    is_favorite = serializers.SerializerMethodField()
+    similar = serializers.SerializerMethodField()
 
     class Meta:
         model = Advertisement
@@ -230,10 +459,49 @@ class AdvertisementDetailSerializer(serializers.ModelSerializer):
             "patronymic",
             "email",
             "is_favorite",
+            "similar",
         ]
+        field_dependencies = {
+            "location": {"select_related": ["location"], "only": ["location"]},
+            "category": {"select_related": ["category"], "only": ["category"]},
+            "property_type": {
+                "select_related": ["property_type"],
+                "only": ["property_type"],
+            },
+            "agency": {"select_related": ["agency"], "only": ["agency__name"]},
+            "agency_url": {
+                "select_related": ["agency"],
+                "only": ["agency__external_url"],
+            },
+            "photos": {
+                "prefetch_related": [
+                    Prefetch("photos", queryset=Photo.objects.order_by("display_order"))
+                ]
+            },
+            "phone_number": {"select_related": ["user"], "only": ["user__phone_number"]},
+            "name": {"select_related": ["user"], "only": ["user__name"]},
+            "surname": {"select_related": ["user"], "only": ["user__surname"]},
+            "patronymic": {"select_related": ["user"], "only": ["user__patronymic"]},
+            "email": {"select_related": ["user"], "only": ["user__email"]},
+            "is_favorite": {},
+            "similar": {
+                "select_related": ["similar_listings"],
+                "only": ["similar_listings__similar_ids"],
+            },
+        }
+
+    def get_expandable_fields(self):
+        return {
+            "location": LocationSerializer(read_only=True),
+            "category": CategoriesOfAdvertisementSerializer(read_only=True),
+            "property_type": TypesOfAdvertisementSerializer(read_only=True),
+            "agency": AgencyShortSerializer(read_only=True),
+            "photos": PhotoSerializer(many=True, read_only=True),
+        }
 
     def get_photos(self, obj):
-        photos = obj.photos.order_by("display_order")
+        # Сортируем в памяти, чтобы использовать prefetch_related("photos")
+        photos = sorted(obj.photos.all(), key=lambda photo: photo.display_order)
         request = self.context.get("request")
         return [
             request.build_absolute_uri(photo.image.url) if request else photo.image.url
@@ -241,6 +509,17 @@ class AdvertisementDetailSerializer(serializers.ModelSerializer):
             if photo.image
         ]
 
+    def get_similar(self, obj):
+        # Список посчитан заранее задачей refresh_similar_advertisements
+        try:
+            ids = obj.similar_listings.similar_ids
+        except SimilarAdvertisements.DoesNotExist:
+            return []
+        cards = AdvertisementCard.objects.filter(pk__in=ids, status="active").in_bulk()
+        return AdvertisementListSerializer(
+            [cards[pk] for pk in ids if pk in cards], many=True, context=self.context
+        ).data
+
     def get_phone_number(self, obj):
         return obj.user.phone_number if obj.user else None
 
@@ -259,15 +538,6 @@ class AdvertisementDetailSerializer(serializers.ModelSerializer):
     def get_agency_url(self, obj):
         return obj.agency.external_url if obj.agency else None
 
-    def get_is_favorite(self, ad):
-        request = self.context.get("request")
-        user = request.user if request else None
-        if user and user.is_authenticated:
-            return FavoriteAdvertisement.objects.filter(
-                user=user, advertisement=ad
-            ).exists()
-        return None
-
 
 # Сериализатор краткой информации об агенте
 class AgentShortSerializer(serializers.ModelSerializer):
@@ -284,13 +554,14 @@ class AgentShortSerializer(serializers.ModelSerializer):
 
 
 # Сериализатор для детального просмотра агентства
-class AgencyDetailSerializer(serializers.ModelSerializer):
-    subscriber_count = serializers.IntegerField()
-    active_ads_count = serializers.SerializerMethodField()
-    annotated_agent_count = serializers.IntegerField()
+class AgencyDetailSerializer(FavoriteFlagMixin, serializers.ModelSerializer):
+    annotated_agent_count = serializers.IntegerField(
+        source="agent_count", read_only=True
+    )
     agents = AgentShortSerializer(many=True, read_only=True)
-    advertisements = AdvertisementListSerializer(many=True, read_only=True)
-    is_favorite = serializers.SerializerMethodField()
+    advertisements = serializers.SerializerMethodField()
+
+    favorite_ids = staticmethod(favorites.subscribed_agency_ids)
 
     class Meta:
         model = Agency
@@ -308,15 +579,29 @@ class AgencyDetailSerializer(serializers.ModelSerializer):
             "is_favorite",
         ]
 
-    def get_active_ads_count(self, obj):
-        return obj.advertisements.filter(status="active").count()
-
-    def get_is_favorite(self, agency):
+    def get_advertisements(self, obj):
+        """
+        Первая страница активных объявлений; следующие страницы (и фильтры
+        ленты) — по ссылке next на /api/agencies/<slug>/advertisements/
+        """
         request = self.context.get("request")
-        user = request.user if request else None
-        if user and user.is_authenticated:
-            return AgencySubscription.objects.filter(user=user, agency=agency).exists()
-        return None
+        url = reverse("agency-advertisements", kwargs={"slug": obj.slug})
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        queryset = (
+            Advertisement.objects.filter(agency=obj, status="active")
+            .select_related("card")
+            .only("id", "card", "date_posted")
+        )
+        paginator = AdvertisementCursorPagination()
+        page = paginator.paginate_first_page(queryset, request, url)
+        cards = AdvertisementCard.for_advertisements(page)
+        return {
+            "next": paginator.get_next_link(),
+            "results": AdvertisementListSerializer(
+                cards, many=True, context=self.context
+            ).data,
+        }
 
 
 # Сериализатор для уведомлений
@@ -345,6 +630,7 @@ class NotificationSerializer(serializers.ModelSerializer):
             "advertisement_title",
             "advertisement_url",
         ]
+        list_serializer_class = FastListSerializer
 
 
 # Сериализатор для отзывов у объявления
@@ -365,8 +651,87 @@ class ReviewSerializer(serializers.ModelSerializer):
         ]
 
 
+# Параметры массовой смены статуса уведомлений
+class NotificationBulkStatusSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=["read", "archived"])
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=1000
+    )
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs["all"] == ("ids" in attrs):
+            raise serializers.ValidationError("Укажите ids или all, но не оба сразу.")
+        return attrs
+
+
+# Сериализатор сохранённого поиска
+class SavedSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedSearch
+        fields = ["id", "name", "query", "is_active", "created_at"]
+        read_only_fields = ["id", "created_at"]
+
+    def validate_query(self, value):
+        query, _ = clean_query(value)
+        return query
+
+    def create(self, validated_data):
+        saved_search = SavedSearch(**validated_data)
+        apply_query(saved_search, saved_search.query)
+        saved_search.save()
+        return saved_search
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if "query" in validated_data:
+            apply_query(instance, instance.query)
+        instance.save()
+        return instance
+
+
+# Сериализатор загрузки фида объявлений агентства
+class FeedImportSerializer(serializers.ModelSerializer):
+    format = serializers.ChoiceField(choices=FeedImport.FORMAT_CHOICES, required=False)
+
+    class Meta:
+        model = FeedImport
+        fields = [
+            "id",
+            "agency",
+            "file",
+            "format",
+            "status",
+            "report",
+            "created_at",
+            "finished_at",
+        ]
+        read_only_fields = ["id", "status", "report", "created_at", "finished_at"]
+
+    def validate_agency(self, agency):
+        user = self.context["request"].user
+        if not user.is_staff and not Agent.objects.filter(
+            user=user, agency=agency
+        ).exists():
+            raise serializers.ValidationError(
+                "Загружать фид может только агент этого агентства."
+            )
+        return agency
+
+    def validate(self, attrs):
+        if not attrs.get("format"):
+            feed_format = detect_format(attrs["file"].name)
+            if feed_format is None:
+                raise serializers.ValidationError(
+                    {"format": ["Укажите формат: csv, json или xml."]}
+                )
+            attrs["format"] = feed_format
+        return attrs
+
+
 # Сериализатор для модели объявлений
-class AdvertisementSerializer(serializers.ModelSerializer):
+class AdvertisementSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     property_type = serializers.StringRelatedField(read_only=True)
     location = serializers.StringRelatedField(read_only=True)
@@ -390,13 +755,42 @@ class AdvertisementSerializer(serializers.ModelSerializer):
             "external_url",
             "slug",
         ]
+        field_dependencies = {
+            "user": {
+                "select_related": ["user"],
+                "only": ["user__name", "user__surname"],
+                "expanded_only": [
+                    "user__name",
+                    "user__surname",
+                    "user__patronymic",
+                    "user__phone_number",
+                    "user__email",
+                ],
+            },
+            "property_type": {
+                "select_related": ["property_type"],
+                "only": ["property_type"],
+            },
+            "location": {"select_related": ["location"], "only": ["location"]},
+            "category": {"select_related": ["category"], "only": ["category"]},
+        }
+
+    def get_expandable_fields(self):
+        return {
+            "user": UserSerializer(read_only=True),
+            "property_type": TypesOfAdvertisementSerializer(read_only=True),
+            "location": LocationSerializer(read_only=True),
+            "category": CategoriesOfAdvertisementSerializer(read_only=True),
+        }
 
 
 # Сериализатор для списка агентств (используется в ленте)
-class AgencyListSerializer(serializers.ModelSerializer):
-    subscriber_count = serializers.IntegerField()
-    active_ads_count = serializers.SerializerMethodField()
-    annotated_agent_count = serializers.IntegerField()
+class AgencyListSerializer(FavoriteFlagMixin, serializers.ModelSerializer):
+    annotated_agent_count = serializers.IntegerField(
+        source="agent_count", read_only=True
+    )
+
+    favorite_ids = staticmethod(favorites.subscribed_agency_ids)
 
     class Meta:
         model = Agency
@@ -407,10 +801,9 @@ class AgencyListSerializer(serializers.ModelSerializer):
             "subscriber_count",
             "active_ads_count",
             "annotated_agent_count",
+            "is_favorite",
         ]
-
-    def get_active_ads_count(self, obj):
-        return obj.advertisements.filter(status="active").count()
+        list_serializer_class = FastListSerializer
 
 
 # Сериализатор для типа недвижимости
@@ -433,6 +826,12 @@ class LocationInputSerializer(serializers.Serializer):
     district = serializers.CharField(max_length=150)
     street = serializers.CharField(max_length=150)
     house = serializers.CharField(max_length=15)
+    latitude = serializers.FloatField(
+        required=False, allow_null=True, min_value=-90, max_value=90
+    )
+    longitude = serializers.FloatField(
+        required=False, allow_null=True, min_value=-180, max_value=180
+    )
 
 
 # Сериализатор для создания объявления
@@ -455,7 +854,19 @@ class AdvertisementCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         location_data = validated_data.pop("location")
-        location_obj, _ = Location.objects.get_or_create(**location_data)
+        coordinates = {
+            key: location_data.pop(key)
+            for key in ("latitude", "longitude")
+            if location_data.get(key) is not None
+        }
+        location_obj, created = Location.objects.get_or_create(
+            **location_data, defaults=coordinates
+        )
+        if not created and coordinates and location_obj.latitude is None:
+            # Адрес уже был, но без координат — дополняем
+            for key, value in coordinates.items():
+                setattr(location_obj, key, value)
+            location_obj.save(update_fields=list(coordinates))
         advertisement = Advertisement.objects.create(
             location=location_obj, user=self.context["request"].user, **validated_data
         )
@@ -514,21 +925,12 @@ class AdvertisementEditSerializer(serializers.ModelSerializer):
             for idx, photo in enumerate(photos_upload):
                 instance.photos.create(image=photo, display_order=idx)
 
-        # 🔔 Создание уведомлений для избранных пользователей
-        favorite_users = FavoriteAdvertisement.objects.filter(
-            advertisement=instance
-        ).values_list("user", flat=True)
-        notifications = [
-            Notification(
-                user_id=user_id,
-                advertisement=instance,
-                notification_type="ad_update",
-                status="sent",
-                message=f"Объявление было обновлено.",
-            )
-            for user_id in favorite_users
-        ]
-        Notification.objects.bulk_create(notifications)
+        # 🔔 Уведомления для избранных пользователей рассылает фоновая
+        # задача; правки за окно объединяются в одно уведомление
+        advertisement_id = instance.pk
+        transaction.on_commit(
+            lambda: tasks.schedule_ad_update_notifications(advertisement_id)
+        )
 
         return instance
 
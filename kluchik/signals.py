@@ -0,0 +1,316 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import favorites, geo, search, tasks
+from .caching import bump_catalog_version
+from .models import (
+    Advertisement,
+    AdvertisementCard,
+    Agency,
+    AgencySubscription,
+    Agent,
+    Category,
+    FavoriteAdvertisement,
+    Location,
+    Notification,
+    Photo,
+    PropertyType,
+    User,
+)
+
+# Поля объявления, попадающие в полнотекстовый индекс
+SEARCH_FIELDS = {"title", "description"}
+
+# Контактные поля пользователя, которые видны в объявлениях и агентствах
+USER_CONTACT_FIELDS = {"name", "surname", "patronymic", "phone_number", "email"}
+
+
+# Синхронизация полнотекстового индекса с объявлениями
+# Новое объявление индексирует Advertisement.save после заполнения slug
+@receiver(post_save, sender=Advertisement)
+def index_advertisement(
+    sender, instance, created=False, raw=False, update_fields=None, **kwargs
+):
+    if created and not raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.index_advertisement(instance)
+
+
+@receiver(post_delete, sender=Advertisement)
+def unindex_advertisement(sender, instance, using, **kwargs):
+    search.unindex_advertisement(instance.pk, using=using)
+
+
+# Синхронизация пространственного индекса с адресами
+@receiver(post_save, sender=Location)
+def index_location(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {"latitude", "longitude"} & set(update_fields):
+        return
+    geo.index_location(instance)
+
+
+@receiver(post_delete, sender=Location)
+def unindex_location(sender, instance, **kwargs):
+    geo.unindex_location(instance.pk)
+
+
+# Синхронизация карточек объявлений
+# Карточку нового объявления строит Advertisement.save после заполнения slug
+@receiver(post_save, sender=Advertisement)
+def refresh_advertisement_card(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        return
+    AdvertisementCard.refresh([instance.pk])
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def refresh_card_cover(sender, instance, **kwargs):
+    AdvertisementCard.refresh_cover(instance.advertisement_id)
+
+
+@receiver(post_save, sender=Location)
+def refresh_card_location(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    AdvertisementCard.objects.filter(advertisement__location=instance).update(
+        location=str(instance)
+    )
+
+
+@receiver(post_save, sender=Category)
+def refresh_card_category(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    AdvertisementCard.objects.filter(category=instance).update(
+        category_name=instance.name
+    )
+
+
+@receiver(post_save, sender=PropertyType)
+def refresh_card_property_type(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    AdvertisementCard.objects.filter(
+        advertisement__property_type=instance
+    ).update(property_type_name=instance.name)
+
+
+# Любое изменение каталога делает недействительными кэши ленты и фасетов
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=PropertyType)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Дата изменения объявлений и агентств для условных GET-запросов.
+# Обновляется запросом UPDATE, чтобы не вызывать повторно сигналы save.
+def touch_advertisements(**lookup):
+    Advertisement.objects.filter(**lookup).update(updated_at=timezone.now())
+
+
+def touch_agencies(**lookup):
+    Agency.objects.filter(**lookup).update(updated_at=timezone.now())
+
+
+# Счётчики агентства переносятся одним UPDATE с F() вместе с датой
+# изменения, в транзакции сохранения или удаления записи
+def count_agencies(field, counted_before, counted_after, touched=()):
+    """
+    Переносит единицу счётчика field с агентства counted_before на
+    counted_after (None — запись не учитывалась / больше не учитывается).
+    Агентства из touched получают только новую дату изменения.
+    """
+    now = timezone.now()
+    for agency_id in {counted_before, counted_after, *touched} - {None}:
+        changes = {"updated_at": now}
+        if counted_before != counted_after:
+            if agency_id == counted_after:
+                changes[field] = F(field) + 1
+            elif agency_id == counted_before:
+                changes[field] = Greatest(F(field) - 1, 0)
+        Agency.objects.filter(pk=agency_id).update(**changes)
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+def count_agency_advertisements(sender, instance, signal, update_fields=None, **kwargs):
+    old_agency_id = instance._loaded_agency_id
+    was_active = instance._loaded_status == "active"
+    if signal is post_delete:
+        new_agency_id, is_active = old_agency_id, False
+    else:
+        saved = set(update_fields) if update_fields is not None else None
+        new_agency_id = old_agency_id
+        if saved is None or {"agency", "agency_id"} & saved:
+            new_agency_id = instance.agency_id
+        is_active = was_active
+        if saved is None or "status" in saved:
+            is_active = instance.status == "active"
+    count_agencies(
+        "active_ads_count",
+        old_agency_id if was_active else None,
+        new_agency_id if is_active else None,
+        touched={old_agency_id, new_agency_id, instance.agency_id},
+    )
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def touch_photo_advertisement(sender, instance, **kwargs):
+    touch_advertisements(pk=instance.advertisement_id)
+    touch_agencies(advertisements=instance.advertisement_id)
+
+
+@receiver(post_save, sender=Agency)
+def touch_agency_advertisements(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_advertisements(agency=instance)
+
+
+# Счётчик избранного меняется вместе с датой изменения одним UPDATE с F():
+# одновременные добавления не теряются. Срабатывает и для add/remove
+# в API, и при каскадном удалении (например, пользователя)
+@receiver(post_save, sender=FavoriteAdvertisement)
+def count_favorite_added(sender, instance, created=False, **kwargs):
+    changes = {"updated_at": timezone.now()}
+    if created:
+        changes["favorite_count"] = F("favorite_count") + 1
+    Advertisement.objects.filter(pk=instance.advertisement_id).update(**changes)
+
+
+@receiver(post_delete, sender=FavoriteAdvertisement)
+def count_favorite_removed(sender, instance, **kwargs):
+    Advertisement.objects.filter(pk=instance.advertisement_id).update(
+        favorite_count=Greatest(F("favorite_count") - 1, 0),
+        updated_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+@receiver(post_save, sender=AgencySubscription)
+@receiver(post_delete, sender=AgencySubscription)
+def count_agency_members(sender, instance, signal, created=False, **kwargs):
+    field = "agent_count" if sender is Agent else "subscriber_count"
+    # Агентство обязательно: без снимка (объект не из базы) оно не менялось
+    loaded_agency_id = instance._loaded_agency_id or instance.agency_id
+    count_agencies(
+        field,
+        None if created else loaded_agency_id,
+        None if signal is post_delete else instance.agency_id,
+    )
+
+
+# user.subscriptions.add() и agency.subscribers.add() создают подписки
+# через bulk_create без post_save — счётчики пересчитываются запросом.
+# remove() и clear() удаляют подписки с post_delete
+@receiver(m2m_changed, sender=AgencySubscription)
+def count_added_subscriptions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    agency_ids = [instance.pk] if reverse else list(pk_set)
+    Agency.rebuild_counters(agency_ids)
+    touch_agencies(pk__in=agency_ids)
+
+
+# Кэшированные множества избранного пользователя (favorites.py)
+# сбрасываются при любом изменении — из API, админки или каскадом
+@receiver(post_save, sender=FavoriteAdvertisement)
+@receiver(post_delete, sender=FavoriteAdvertisement)
+@receiver(post_save, sender=AgencySubscription)
+@receiver(post_delete, sender=AgencySubscription)
+def invalidate_user_favorites(sender, instance, **kwargs):
+    kind = "advertisements" if sender is FavoriteAdvertisement else "agencies"
+    favorites.invalidate(kind, instance.user_id)
+
+
+@receiver(m2m_changed, sender=AgencySubscription)
+def invalidate_added_subscriptions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    for user_id in pk_set if reverse else [instance.pk]:
+        favorites.invalidate("agencies", user_id)
+
+
+# Счётчик непрочитанных уведомлений меняется UPDATE с F() в транзакции
+# Notification.save; массовые рассылки меняют его сами
+# (notifications.create_notifications)
+@receiver(post_save, sender=Notification)
+def count_unread_notifications(sender, instance, created=False, **kwargs):
+    was_unread = not created and instance._loaded_status == "sent"
+    is_unread = instance.status == "sent"
+    if was_unread == is_unread:
+        return
+    User.objects.filter(pk=instance.user_id).update(
+        unread_notification_count=F("unread_notification_count") + 1
+        if is_unread
+        else Greatest(F("unread_notification_count") - 1, 0)
+    )
+
+
+# Удалённое непрочитанное уведомление уменьшает счётчик получателя.
+# Обработчик срабатывает и при каскадном удалении вместе с объявлением
+# или пользователем: Django удаляет такие строки с отправкой сигналов.
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if instance.status != "sent":
+        return
+    User.objects.filter(pk=instance.user_id).update(
+        unread_notification_count=Greatest(F("unread_notification_count") - 1, 0)
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_user_content(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not USER_CONTACT_FIELDS & set(update_fields):
+        return
+    touch_advertisements(user=instance)
+    touch_agencies(agents__user=instance)
+
+
+@receiver(post_save, sender=Location)
+def touch_location_advertisements(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    touch_advertisements(location=instance)
+    touch_agencies(advertisements__location=instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=PropertyType)
+def touch_dictionary_advertisements(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    field = "category" if sender is Category else "property_type"
+    touch_advertisements(**{field: instance})
+    touch_agencies(**{f"advertisements__{field}": instance})
+
+
+# Уведомления по сохранённым поискам и подписчикам агентства
+# при публикации объявления
+@receiver(post_save, sender=Advertisement)
+def notify_on_publish(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "status" not in update_fields:
+        return
+    # Снимок статуса обновляется в Advertisement.save после сигналов
+    if instance.status != "active" or instance._loaded_status == "active":
+        return
+    advertisement_id = instance.pk
+    # Задача должна увидеть закоммиченное объявление
+    transaction.on_commit(
+        lambda: tasks.notify_about_publish.delay(advertisement_id)
+    )
@@ -0,0 +1,289 @@
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from django.db import transaction
+from django.db.models import BooleanField, F
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Advertisement, SimilarAdvertisements
+
+# Сколько похожих объявлений хранится для каждого
+SIMILAR_COUNT = 8
+
+# Сколько объявлений сравнивается со всеми за одну матричную операцию
+# (память: BATCH_SIZE × число объявлений категории × 8 байт)
+SIMILAR_BATCH_SIZE = 256
+
+# Расстояние в км, эквивалентное одному стандартному отклонению цены/площади
+LOCATION_SCALE_KM = 5.0
+
+# Вес несовпадения типа недвижимости и города (в стандартных отклонениях)
+PROPERTY_TYPE_WEIGHT = 2.0
+CITY_WEIGHT = 2.0
+
+KM_PER_DEGREE = 111.2
+
+FEATURE_FIELDS = [
+    "id",
+    "category_id",
+    "property_type_id",
+    "price",
+    "square",
+    "price_per_sqm",
+    "location__city",
+    "location__latitude",
+    "location__longitude",
+    "location_id",
+]
+
+
+def active_rows(category_ids: Optional[Set[int]] = None) -> List[tuple]:
+    """
+    Поля активных объявлений одним запросом (в порядке id); category_ids
+    ограничивает выборку категориями, где есть что пересчитывать
+    """
+    queryset = Advertisement.objects.filter(status="active")
+    if category_ids is not None:
+        queryset = queryset.filter(category_id__in=category_ids)
+    return list(queryset.order_by("id").values_list(*FEATURE_FIELDS))
+
+
+def one_hot(values: Iterable, weight: float) -> np.ndarray:
+    """
+    Категориальный признак. Вес делится на √2, чтобы несовпадение
+    добавляло к квадрату расстояния ровно weight².
+    """
+    _, codes = np.unique([str(value) for value in values], return_inverse=True)
+    matrix = np.zeros((len(codes), codes.max() + 1 if len(codes) else 0))
+    matrix[np.arange(len(codes)), codes] = weight / math.sqrt(2)
+    return matrix
+
+
+def standardize(column: np.ndarray) -> np.ndarray:
+    std = column.std()
+    return (column - column.mean()) / (std if std > 0 else 1.0)
+
+
+def build_features(rows: List[tuple]) -> np.ndarray:
+    """
+    Векторы признаков объявлений одной категории: логарифмы цены, площади
+    и цены за м² (в стандартных отклонениях), координаты в км, тип
+    недвижимости и город. Адрес без координат получает средние
+    координаты своего города.
+    """
+    _, _, property_types, prices, squares, per_sqm, cities, lats, lons, _ = zip(*rows)
+    prices = np.array(prices, dtype=float)
+    squares = np.array(squares, dtype=float)
+    per_sqm = np.array(
+        [value if value is not None else np.nan for value in per_sqm], dtype=float
+    )
+    per_sqm = np.where(np.isnan(per_sqm), prices / np.maximum(squares, 1.0), per_sqm)
+
+    numeric = np.column_stack(
+        [
+            standardize(np.log1p(np.maximum(prices, 0))),
+            standardize(np.log1p(np.maximum(squares, 0))),
+            standardize(np.log1p(np.maximum(per_sqm, 0))),
+        ]
+    )
+
+    cities = np.array(cities, dtype=object)
+    lats = np.array([value if value is not None else np.nan for value in lats], dtype=float)
+    lons = np.array([value if value is not None else np.nan for value in lons], dtype=float)
+    known = ~np.isnan(lats) & ~np.isnan(lons)
+    if known.any():
+        for city in np.unique(cities[~known]):
+            in_city = cities == city
+            source = in_city & known if (in_city & known).any() else known
+            lats[in_city & ~known] = lats[source].mean()
+            lons[in_city & ~known] = lons[source].mean()
+        coslat = math.cos(math.radians(lats.mean()))
+        coords = np.column_stack(
+            [lats * KM_PER_DEGREE, lons * KM_PER_DEGREE * coslat]
+        ) / LOCATION_SCALE_KM
+    else:
+        coords = np.zeros((len(rows), 2))
+
+    return np.hstack(
+        [
+            numeric,
+            coords,
+            one_hot(property_types, PROPERTY_TYPE_WEIGHT),
+            one_hot(cities, CITY_WEIGHT),
+        ]
+    )
+
+
+def nearest_neighbours(
+    features: np.ndarray,
+    targets: np.ndarray,
+    count: int = SIMILAR_COUNT,
+    batch_size: int = SIMILAR_BATCH_SIZE,
+) -> np.ndarray:
+    """
+    Индексы count ближайших строк features для строк targets (без самой
+    строки). Квадраты расстояний считаются пачками через
+    |a|² + |b|² - 2·a·b, лучшие выбираются argpartition без полной сортировки.
+    """
+    total = len(features)
+    count = min(count, total - 1)
+    if count <= 0 or not len(targets):
+        return np.empty((len(targets), 0), dtype=int)
+
+    squared_norms = np.einsum("ij,ij->i", features, features)
+    result = np.empty((len(targets), count), dtype=int)
+    for start in range(0, len(targets), batch_size):
+        batch = targets[start : start + batch_size]
+        distances = (
+            squared_norms[batch][:, None]
+            + squared_norms[None, :]
+            - 2.0 * features[batch] @ features.T
+        )
+        distances[np.arange(len(batch)), batch] = np.inf
+        nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1, kind="stable")
+        result[start : start + batch_size] = np.take_along_axis(nearest, order, axis=1)
+    return result
+
+
+def compute_similar(
+    rows: List[tuple], target_ids: Optional[Set[int]] = None, count: int = SIMILAR_COUNT
+) -> Dict[int, List[int]]:
+    """
+    Похожие объявления для target_ids (None — для всех). Соседи ищутся
+    только в той же категории (продажу не сравниваем с арендой).
+    """
+    groups: Dict[int, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(row[1], []).append(row)
+
+    similar = {}
+    for group in groups.values():
+        ids = np.array([row[0] for row in group])
+        if target_ids is None:
+            targets = np.arange(len(ids))
+        else:
+            targets = np.flatnonzero(np.isin(ids, list(target_ids)))
+        if not len(targets):
+            continue
+        neighbours = nearest_neighbours(build_features(group), targets, count)
+        for target, row in zip(targets, neighbours):
+            similar[int(ids[target])] = ids[row].tolist()
+    return similar
+
+
+def save_similar(similar: Dict[int, List[int]], rows: List[tuple]) -> None:
+    """Записывает списки и признаки, по которым они посчитаны, одним upsert на пачку"""
+    now = timezone.now()
+    features = {row[0]: row for row in rows}
+    SimilarAdvertisements.objects.bulk_create(
+        [
+            SimilarAdvertisements(
+                advertisement_id=advertisement_id,
+                similar_ids=ids,
+                computed_at=now,
+                category_id=features[advertisement_id][1],
+                property_type_id=features[advertisement_id][2],
+                price=features[advertisement_id][3],
+                square=features[advertisement_id][4],
+                location_id=features[advertisement_id][9],
+            )
+            for advertisement_id, ids in similar.items()
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["advertisement"],
+        update_fields=[
+            "similar_ids",
+            "computed_at",
+            "category_id",
+            "property_type_id",
+            "price",
+            "square",
+            "location_id",
+        ],
+    )
+
+
+def stale_ids() -> Set[int]:
+    """
+    Активные объявления без рассчитанного списка и объявления, чьи
+    признаки изменились после расчёта. Сравниваются сами значения, а не
+    updated_at: избранное и правки текста не требуют пересчёта.
+    """
+    return set(
+        Advertisement.objects.filter(status="active")
+        .exclude(
+            similar_listings__category_id=F("category_id"),
+            similar_listings__property_type_id=F("property_type_id"),
+            similar_listings__price=F("price"),
+            similar_listings__square=F("square"),
+            similar_listings__location_id=F("location_id"),
+        )
+        .order_by()
+        .values_list("id", flat=True)
+    )
+
+
+def referencing_ids(changed: Set[int]) -> Set[int]:
+    """
+    Объявления, в чьих списках есть changed или уже неактивные
+    объявления. Списки разбираются в базе через json_each, таблица
+    целиком в память не читается.
+    """
+    similar_table = SimilarAdvertisements._meta.db_table
+    advertisement_table = Advertisement._meta.db_table
+    references = RawSQL(
+        f"EXISTS (SELECT 1 FROM json_each({similar_table}.similar_ids) item "
+        f'LEFT JOIN "{advertisement_table}" neighbour '
+        f"ON neighbour.id = item.value AND neighbour.status = 'active' "
+        f"WHERE neighbour.id IS NULL "
+        f"OR item.value IN (SELECT value FROM json_each(%s)))",
+        [json.dumps(sorted(changed))],
+        output_field=BooleanField(),
+    )
+    return set(
+        SimilarAdvertisements.objects.filter(references).values_list(
+            "advertisement_id", flat=True
+        )
+    )
+
+
+def refresh_similar(full: bool = False, count: int = SIMILAR_COUNT) -> Dict[str, int]:
+    """
+    Пересчитывает похожие объявления. Без full пересчитываются только
+    объявления с изменёнными признаками и новые, а также те, в чьих
+    списках они были или должны появиться, и списки со снятыми с
+    публикации объявлениями. Читаются только категории этих объявлений.
+    """
+    # Строки снятых с публикации объявлений больше не нужны
+    removed, _ = SimilarAdvertisements.objects.exclude(
+        advertisement__status="active"
+    ).delete()
+
+    if full:
+        rows = active_rows()
+        similar = compute_similar(rows, None, count)
+    else:
+        changed = stale_ids()
+        affected = referencing_ids(changed) - changed
+        # Соседи изменённого объявления — из его же категории
+        category_ids = set(
+            Advertisement.objects.filter(pk__in=changed | affected).values_list(
+                "category_id", flat=True
+            )
+        )
+        rows = active_rows(category_ids) if category_ids else []
+        similar = compute_similar(rows, changed, count)
+        for ids in similar.values():
+            affected.update(ids)
+        affected -= changed
+        if affected:
+            similar.update(compute_similar(rows, affected, count))
+
+    with transaction.atomic():
+        save_similar(similar, rows)
+    return {"loaded": len(rows), "computed": len(similar), "removed": removed}
@@ -0,0 +1,233 @@
+import heapq
+from bisect import bisect_left, insort
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.utils import timezone
+
+from .caching import get_catalog_version
+from .models import Advertisement, custom_slugify
+from .search import WORD_RE
+
+# Слова заголовков короче этого в подсказки не попадают
+MIN_TERM_LENGTH = 3
+
+# Для коротких префиксов (1–2 символа) просматриваются все совпадения,
+# для длинных — не больше MAX_SCAN подсказок
+SHORT_PREFIX_LENGTH = 2
+MAX_SCAN = 2000
+
+# Ответы запоминаются, пока не изменится вес подходящей подсказки:
+# при наборе текста одни и те же префиксы запрашивают многие пользователи
+RESULT_CACHE_SIZE = 10000
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+
+# Объявления, изменённые незадолго до прошлой синхронизации, перечитываются
+SYNC_OVERLAP = timedelta(minutes=1)
+
+ROW_FIELDS = [
+    "id",
+    "status",
+    "title",
+    "location__city",
+    "location__district",
+    "location__street",
+]
+
+# (вид, текст подсказки, текст, по которому ищется)
+Contribution = Tuple[str, str, str]
+
+
+def suggest_key(text: str) -> str:
+    """
+    Ключ поиска: транслитерация custom_slugify, слова через пробел.
+    «Тверская» и «tverskaia» дают один и тот же ключ.
+    """
+    return custom_slugify(text).replace("-", " ")
+
+
+def contributions(row: tuple) -> List[Contribution]:
+    """Подсказки, которые даёт одно активное объявление"""
+    _, status, title, city, district, street = row
+    if status != "active":
+        return []
+    result = [
+        ("city", city, city),
+        ("district", f"{district}, {city}", district),
+        ("street", f"{street}, {city}", street),
+    ]
+    terms = {
+        word.lower()
+        for word in WORD_RE.findall(title or "")
+        if len(word) >= MIN_TERM_LENGTH and not word.isdigit()
+    }
+    result.extend(("title", term, term) for term in sorted(terms))
+    return result
+
+
+# Префиксный индекс подсказок
+class SuggestIndex:
+    """
+    Отсортированный массив (ключ, вид, текст): все ключи с префиксом
+    запроса идут подряд и находятся bisect. Ключи строятся для каждого
+    слова текста, поэтому «lenina» находит «ул. Ленина».
+
+    Вес подсказки — число активных объявлений с этим городом, районом,
+    улицей или словом в заголовке. Вклад каждого объявления хранится,
+    поэтому изменение объявления применяется как разность.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[str, str, str]] = []
+        self.weights: Dict[Tuple[str, str], int] = {}
+        self.keys: Dict[Tuple[str, str], List[str]] = {}
+        self.advertisements: Dict[int, List[Contribution]] = {}
+        self.results: Dict[str, List[Tuple[str, str]]] = {}
+        self.version = None
+        self.synced_at = None
+
+    def add(self, kind: str, label: str, source: str, bulk: bool = False) -> None:
+        item = (kind, label)
+        if item in self.weights:
+            self.weights[item] += 1
+            return
+        words = suggest_key(source).split()
+        keys = sorted({" ".join(words[index:]) for index in range(len(words))})
+        self.weights[item] = 1
+        self.keys[item] = keys
+        for key in keys:
+            if bulk:
+                self.entries.append((key, kind, label))
+            else:
+                insort(self.entries, (key, kind, label))
+
+    def discard(self, kind: str, label: str) -> None:
+        item = (kind, label)
+        self.weights[item] -= 1
+        if self.weights[item] > 0:
+            return
+        del self.weights[item]
+        for key in self.keys.pop(item):
+            position = bisect_left(self.entries, (key, kind, label))
+            del self.entries[position]
+
+    def apply(self, rows: Iterable[tuple]) -> int:
+        """Заменяет вклад объявлений (строки ROW_FIELDS)"""
+        if not self.entries:
+            return self.build(rows)
+        changed = 0
+        for row in rows:
+            new = contributions(row)
+            old = self.advertisements.pop(row[0], [])
+            if old == new:
+                if new:
+                    self.advertisements[row[0]] = new
+                continue
+            for kind, label, _ in old:
+                self.forget_results((kind, label))
+                self.discard(kind, label)
+            for kind, label, source in new:
+                self.add(kind, label, source)
+                self.forget_results((kind, label))
+            if new:
+                self.advertisements[row[0]] = new
+            changed += 1
+        return changed
+
+    def forget_results(self, item: Tuple[str, str]) -> None:
+        """Сбрасывает запомненные ответы префиксов, где вес item мог сыграть роль"""
+        if not self.results:
+            return
+        for key in self.keys.get(item, ()):
+            for length in range(1, len(key) + 1):
+                self.results.pop(key[:length], None)
+
+    def build(self, rows: Iterable[tuple]) -> int:
+        """Первое заполнение: массив сортируется один раз в конце"""
+        count = 0
+        for row in rows:
+            new = contributions(row)
+            if not new:
+                continue
+            for kind, label, source in new:
+                self.add(kind, label, source, bulk=True)
+            self.advertisements[row[0]] = new
+            count += 1
+        self.entries.sort()
+        self.results.clear()
+        return count
+
+    def sync(self) -> None:
+        """
+        Применяет объявления, изменённые с прошлой синхронизации.
+        Удаления не видны по updated_at — их выдаёт расхождение числа
+        активных объявлений, и тогда индекс строится заново.
+        """
+        started = timezone.now()
+        queryset = Advertisement.objects.all()
+        if self.synced_at is None:
+            queryset = queryset.filter(status="active")
+        else:
+            queryset = queryset.filter(updated_at__gte=self.synced_at)
+        self.apply(queryset.values_list(*ROW_FIELDS).iterator())
+        self.synced_at = started - SYNC_OVERLAP
+
+    def top(self, prefix: str, limit: int, scan: Optional[int]) -> List[Tuple[str, str]]:
+        found = set()
+        position = bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and (scan is None or len(found) < scan):
+            key, kind, label = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            found.add((kind, label))
+            position += 1
+        return heapq.nsmallest(
+            limit, found, key=lambda item: (-self.weights[item], item[1], item[0])
+        )
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        prefix = " ".join(suggest_key(query).split())
+        if not prefix:
+            return []
+        items = self.results.get(prefix)
+        if items is None:
+            scan = None if len(prefix) <= SHORT_PREFIX_LENGTH else MAX_SCAN
+            items = self.top(prefix, MAX_LIMIT, scan)
+            if len(self.results) >= RESULT_CACHE_SIZE:
+                self.results.clear()
+            self.results[prefix] = items
+        return [
+            {"kind": kind, "text": label, "count": self.weights[(kind, label)]}
+            for kind, label in items[:limit]
+        ]
+
+
+_index: Optional[SuggestIndex] = None
+
+
+def get_index() -> SuggestIndex:
+    """
+    Индекс процесса. Сигналы каталога увеличивают его версию
+    (bump_catalog_version); пока версия не изменилась, запрос к базе
+    не нужен, иначе догружаются только изменённые объявления.
+    """
+    global _index
+    version = get_catalog_version()
+    if _index is not None and _index.version == version:
+        return _index
+    if _index is None:
+        _index = SuggestIndex()
+    _index.sync()
+    active = Advertisement.objects.filter(status="active").count()
+    if active != len(_index.advertisements):
+        _index = SuggestIndex()
+        _index.sync()
+    _index.version = version
+    return _index
+
+
+def reset_index() -> None:
+    global _index
+    _index = None
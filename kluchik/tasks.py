@@ -1,7 +1,18 @@
 from celery import shared_task
 from datetime import date
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Advertisement, Statistics
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .feed_import import process_feed_import
+from .models import Advertisement, FavoriteAdvertisement, Statistics
+from .notifications import (
+    claim_ad_update,
+    notify_ad_update,
+    notify_agency_subscribers,
+)
+from .saved_searches import notify_saved_searches
+from .similar import refresh_similar
 
 @shared_task
 def collect_daily_statistics():
@@ -14,3 +25,91 @@ def collect_daily_statistics():
         user_count=user_count,
         advertisement_count=advertisement_count,
     )
+
+
+@shared_task
+def refresh_similar_advertisements(full=False):
+    """
+    Пересчитывает блок «похожие объявления». По умолчанию только для
+    объявлений, чьи цена, площадь, категория, тип или адрес изменились
+    с прошлого запуска, full=True — для всех.
+    """
+    return refresh_similar(full=full)
+
+
+@shared_task
+def notify_about_publish(advertisement_id):
+    """
+    Уведомления new_ad для опубликованного объявления: сначала по
+    сохранённым поискам, затем подписчикам агентства. Рассылки идут
+    последовательно в одной задаче, поэтому вторая видит уведомления
+    первой и не дублирует их.
+    """
+    return notify_saved_searches(advertisement_id) + notify_agency_subscribers(
+        advertisement_id
+    )
+
+
+@shared_task
+def notify_advertisement_updated(advertisement_id):
+    """Уведомления ad_update по всем правкам объявления за окно объединения"""
+    return notify_ad_update(advertisement_id)
+
+
+def schedule_ad_update_notifications(advertisement_id):
+    """
+    Ставит рассылку ad_update через AD_UPDATE_NOTIFICATION_WINDOW секунд,
+    если для объявления она ещё не поставлена
+    """
+    if claim_ad_update(advertisement_id):
+        notify_advertisement_updated.apply_async(
+            (advertisement_id,), countdown=settings.AD_UPDATE_NOTIFICATION_WINDOW
+        )
+
+
+@shared_task
+def import_advertisement_feed(feed_import_id):
+    """Импорт загруженного фида агентства; отчёт сохраняется в FeedImport"""
+    return process_feed_import(feed_import_id)
+
+
+@shared_task
+def reconcile_favorite_counts(batch_size=1000):
+    """
+    Исправляет расхождения favorite_count с таблицей избранного.
+    Объявления проверяются пачками по id; расходящиеся пересчитываются
+    одним UPDATE с подзапросом, чтобы не затереть параллельные изменения.
+    """
+    favorites = (
+        FavoriteAdvertisement.objects.filter(advertisement=OuterRef("pk"))
+        .order_by()
+        .values("advertisement")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    repaired = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Advertisement.objects.filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", "favorite_count")[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        actual = dict(
+            FavoriteAdvertisement.objects.filter(
+                advertisement_id__in=[pk for pk, _ in batch]
+            )
+            .order_by()
+            .values("advertisement")
+            .annotate(count=Count("pk"))
+            .values_list("advertisement", "count")
+        )
+        drifted = [pk for pk, stored in batch if actual.get(pk, 0) != stored]
+        if drifted:
+            repaired += Advertisement.objects.filter(pk__in=drifted).update(
+                favorite_count=Coalesce(Subquery(favorites), 0)
+            )
+    return repaired
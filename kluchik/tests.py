@@ -1,4 +1,12 @@
 from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.core.cache import cache
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from .models import (
     Advertisement,
@@ -8,16 +16,100 @@ from .models import (
     User,
     Notification,
     Photo,
+    AdvertisementCard,
+    Agency,
+    Agent,
+    SimilarAdvertisements,
+    SavedSearch,
+    FavoriteAdvertisement,
+    AgencySubscription,
+    FeedImport,
+    custom_slugify,
 )
+from .filters import filter_by_bbox
+from .serializers import (
+    AdvertisementListSerializer,
+    AgencyListSerializer,
+    NotificationSerializer,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.request import Request
+from .renderers import ORJSONRenderer
+from decimal import Decimal
+import base64
+import importlib
+import datetime
+import json
+import csv
+from .export import export_rows
+from .similar import refresh_similar
+from .saved_searches import notify_saved_searches, reset_matcher
+from .suggest import reset_index
+from . import search
+from .feed_import import import_feed, process_feed_import
+from .notifications import notify_ad_update, notify_agency_subscribers
+from django.utils import timezone
+from unittest import mock
+from .tasks import (
+    notify_about_publish,
+    reconcile_favorite_counts,
+    refresh_similar_advertisements,
+)
+from django.db.models import F
+from django.db.models.signals import post_save
+import msgpack
 from django.contrib.auth import get_user_model
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile
 import tempfile
+from types import SimpleNamespace
+import io
 from PIL import Image
 
 User = get_user_model()
 
 
+def app_queries(context):
+    """Запросы к таблицам приложения (без служебных запросов Silk)"""
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if "kluchik_" in query["sql"]
+        and "silk_" not in query["sql"]
+        and not query["sql"].startswith("EXPLAIN")
+    ]
+
+
+# Общие данные тестов объявлений: автор, тип, категория и адрес
+class AdvertisementTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="test@example.com", name="Test")
+        self.property_type = PropertyType.objects.create(name="Квартира")
+        self.category = Category.objects.create(name="Продажа")
+        self.location = Location.objects.create(
+            city="Москва", district="ЦАО", street="Тверская", house="1"
+        )
+
+    def create_ad(self, **fields):
+        """Активное объявление self.user; fields заменяют значения по умолчанию"""
+        data = {
+            "title": "Объявление",
+            "description": "Описание",
+            "price": 1000000,
+            "square": 50,
+            "user": self.user,
+            "property_type": self.property_type,
+            "location": self.location,
+            "category": self.category,
+            "status": "active",
+        }
+        data.update(fields)
+        return Advertisement.objects.create(**data)
+
+
 # Тестирование списка объявлений и фильтра
 class AdvertisementListViewTests(APITestCase):
     def setUp(self):
@@ -43,8 +135,8 @@ class AdvertisementListViewTests(APITestCase):
         url = reverse("advertisements-list")
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["title"], "Тест объявление")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["title"], "Тест объявление")
 
     def test_filter_advertisements_by_price(self):
         Advertisement.objects.create(
@@ -59,8 +151,66 @@ class AdvertisementListViewTests(APITestCase):
         )
         url = reverse("advertisements-list") + "?price_min=2000000"
         response = self.client.get(url)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["price"], "5000000.00")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["price"], "5000000.00")
+
+
+# Тестирование keyset-пагинации ленты
+class AdvertisementPaginationTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ads = [
+            self.create_ad(title=f"Объявление {i}", price=1000000 + i) for i in range(5)
+        ]
+        # Одинаковая дата у всех — порядок должен держаться на id
+        Advertisement.objects.update(date_posted=self.ads[0].date_posted)
+
+    def test_pages_follow_cursor_without_gaps(self):
+        url = reverse("advertisements-list") + "?page_size=2"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, sorted((ad.id for ad in self.ads), reverse=True))
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get(reverse("advertisements-list") + "?page_size=2")
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+        self.assertEqual(
+            [item["id"] for item in back.data["results"]],
+            [item["id"] for item in first.data["results"]],
+        )
+
+    def test_bounded_count(self):
+        url = reverse("advertisements-list") + "?page_size=2&with_count=1"
+        response = self.client.get(url)
+        self.assertEqual(response.data["count"], 5)
+        self.assertTrue(response.data["count_is_exact"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("advertisements-list") + "?cursor=xyz")
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        url = reverse("advertisements-list")
+        payloads = [
+            {"v": ["abc", 1]},
+            {"v": [{"x": 1}, 1]},
+            {"v": [[1], 1]},
+            {"v": ["2024-01-01T00:00:00+00:00", "x"]},
+            {"v": ["2024-01-01T00:00:00+00:00", True]},
+            {"v": [1]},
+            {"v": "abc"},
+            [1, 2],
+        ]
+        for payload in payloads:
+            cursor = base64.b64encode(json.dumps(payload).encode()).decode()
+            for params in [{}, {"ordering": "price"}]:
+                response = self.client.get(url, {"cursor": cursor, **params})
+                self.assertEqual(response.status_code, 404, (payload, params))
 
 
 # Тестирование регистрации пользователя
@@ -370,3 +520,2292 @@ class PhotoModelTests(APITestCase):
 
         expected_str = f"Фото для объявления: {self.advertisement.title} - Порядок: 1"
         self.assertEqual(str(photo), expected_str)
+
+
+# Тестирование полнотекстового поиска по объявлениям
+class AdvertisementSearchTests(AdvertisementTestCase):
+    def create_ad(self, title, description="Описание"):
+        return super().create_ad(title=title, description=description)
+
+    def search(self, term):
+        response = self.client.get(reverse("advertisements-list"), {"search": term})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_search_matches_word_forms(self):
+        ad = self.create_ad("Просторная квартира у метро")
+        self.create_ad("Загородный дом")
+        self.assertEqual(self.search("квартиру"), [ad.id])
+
+    def test_title_ranks_above_description(self):
+        in_description = self.create_ad("Дом", description="Рядом есть парк")
+        in_title = self.create_ad("Квартира у парка")
+        self.assertEqual(self.search("парк"), [in_title.id, in_description.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        ad = self.create_ad("Студия")
+        ad.title = "Пентхаус"
+        ad.save()
+        self.assertEqual(self.search("студия"), [])
+        self.assertEqual(self.search("пентхаус"), [ad.id])
+        ad.delete()
+        self.assertEqual(self.search("пентхаус"), [])
+
+    def test_rebuild_command(self):
+        ad = self.create_ad("Лофт")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM kluchik_advertisement_fts")
+        self.assertEqual(self.search("лофт"), [])
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.search("лофт"), [ad.id])
+
+    def test_migration_fills_index(self):
+        ad = self.create_ad("Таунхаус")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM kluchik_advertisement_fts")
+        migration = importlib.import_module(
+            "kluchik.migrations.0030_fill_advertisement_fts"
+        )
+        executor = MigrationExecutor(connection)
+        state = executor.loader.project_state(("kluchik", "0030_fill_advertisement_fts"))
+        # Миграции нужно только соединение редактора схемы
+        migration.fill_fts_table(state.apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.search("таунхаус"), [ad.id])
+
+    def test_rebuild_uses_queryset_database(self):
+        replica = SimpleNamespace(vendor="postgresql")
+        with mock.patch.object(
+            search, "connections", {"default": connection, "replica": replica}
+        ):
+            self.assertTrue(search.is_available())
+            self.assertFalse(search.is_available("replica"))
+            # Индекс пересобирается в базе queryset, а не в базе по умолчанию
+            self.assertEqual(
+                search.rebuild_index(Advertisement.objects.using("replica")), 0
+            )
+
+    def test_ranked_search_matches_once(self):
+        ads = [self.create_ad(f"Квартира {i}") for i in range(3)]
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(
+                sorted(self.search("квартира")), [ad.id for ad in ads]
+            )
+        for sql in app_queries(context):
+            self.assertLessEqual(sql.count(" MATCH "), 1, sql)
+
+
+# Тестирование денормализованных карточек объявлений
+class AdvertisementCardTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ads = [self.create_ad(title=f"Объявление {i}") for i in range(3)]
+        self.image = SimpleUploadedFile(
+            name="cover.gif",
+            content=(
+                b"GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00"
+                b"\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+            ),
+            content_type="image/gif",
+        )
+
+    def test_my_advertisement_patch(self):
+        self.client.force_authenticate(self.user)
+        url = reverse("my-advertisements-detail", args=[self.ads[0].pk])
+        response = self.client.patch(
+            url, {"title": "Новый заголовок", "price": 2000000}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], "Новый заголовок")
+        self.assertEqual(response.data["location"], str(self.location))
+        ad = Advertisement.objects.get(pk=self.ads[0].pk)
+        self.assertEqual((ad.title, ad.price), ("Новый заголовок", 2000000))
+        self.assertEqual(AdvertisementCard.objects.get(pk=ad.pk).title, "Новый заголовок")
+
+        # Список избранного объявления не изменяет
+        url = reverse("advertisements-favorite-detail", args=[self.ads[0].pk])
+        self.assertEqual(self.client.patch(url, {"title": "x"}).status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+
+    def test_card_follows_advertisement(self):
+        card = AdvertisementCard.objects.get(pk=self.ads[0].pk)
+        self.assertEqual(card.location, str(self.location))
+        self.assertEqual(card.category_name, "Продажа")
+        self.assertEqual(card.external_url, self.ads[0].external_url)
+        self.assertIsNotNone(card.external_url)
+
+    def test_create_sends_post_save_once(self):
+        handler = mock.Mock()
+        post_save.connect(handler, sender=Advertisement)
+        self.addCleanup(post_save.disconnect, handler, sender=Advertisement)
+        ad = self.create_ad(title="Новое объявление")
+        self.assertEqual(handler.call_count, 1)
+        card = AdvertisementCard.objects.get(pk=ad.pk)
+        self.assertEqual(card.external_url, ad.external_url)
+        self.assertTrue(card.external_url.endswith(f"/{ad.slug}/"))
+        self.assertEqual(
+            Advertisement.objects.values_list("slug", flat=True).get(pk=ad.pk), ad.slug
+        )
+
+    def test_create_is_atomic(self):
+        with mock.patch(
+            "kluchik.models.search.index_advertisement", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.create_ad(title="Не сохранится")
+        self.assertFalse(Advertisement.objects.filter(title="Не сохранится").exists())
+        self.assertEqual(AdvertisementCard.objects.count(), 3)
+
+    def test_card_follows_dictionaries(self):
+        self.category.name = "Аренда"
+        self.category.save()
+        self.location.house = "2"
+        self.location.save()
+        card = AdvertisementCard.objects.get(pk=self.ads[0].pk)
+        self.assertEqual(card.category_name, "Аренда")
+        self.assertTrue(card.location.endswith(", 2"))
+
+    def test_cover_photo(self):
+        photo = Photo.objects.create(
+            advertisement=self.ads[0], image=self.image, display_order=1
+        )
+        response = self.client.get(reverse("advertisements-list"))
+        item = next(i for i in response.data["results"] if i["id"] == self.ads[0].pk)
+        self.assertTrue(item["image"].endswith(photo.image.url))
+        photo.delete()
+        self.assertIsNone(AdvertisementCard.objects.get(pk=self.ads[0].pk).image)
+
+    def test_list_uses_single_query(self):
+        url = reverse("advertisements-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(len(app_queries(context)), 1)
+
+    def test_missing_card_is_rebuilt(self):
+        AdvertisementCard.objects.all().delete()
+        response = self.client.get(reverse("advertisements-list"))
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(AdvertisementCard.objects.count(), 3)
+
+
+# Регрессионные тесты планов запросов (EXPLAIN QUERY PLAN) для объявлений
+class AdvertisementQueryPlanTests(AdvertisementTestCase):
+    """
+    Выполняет запросы эндпоинтов, прогоняет каждый SQL-запрос к таблице
+    объявлений через EXPLAIN QUERY PLAN и падает, если план превратился
+    в полный просмотр таблицы.
+    """
+
+    table = "kluchik_advertisement"
+
+    def setUp(self):
+        super().setUp()
+        self.ad = self.create_ad(title="Тест объявление")
+        self.client.force_authenticate(user=self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, url, params=None, sorted_by_index=False):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        queries = [
+            sql
+            for sql in app_queries(context)
+            if sql.startswith("SELECT") and f'"{self.table}"' in sql
+        ]
+        self.assertTrue(queries, f"{url}: нет запросов к {self.table}")
+        for sql in queries:
+            for line in self.explain(sql):
+                if line == f"SCAN {self.table}" or line.startswith(
+                    f"SCAN {self.table} "
+                ) and "USING" not in line:
+                    self.fail(f"{url}: полный просмотр таблицы\n{sql}\n{line}")
+                if sorted_by_index and "TEMP B-TREE FOR" in line:
+                    self.fail(f"{url}: сортировка не по индексу\n{sql}\n{line}")
+
+    def test_feed(self):
+        self.assertNoFullScan(reverse("advertisements-list"), sorted_by_index=True)
+
+    def test_agency_advertisements(self):
+        agency = Agency.objects.create(name="Агентство")
+        Advertisement.objects.filter(pk=self.ad.pk).update(agency=agency)
+        agency.refresh_from_db()
+        url = reverse("agency-advertisements", kwargs={"slug": agency.slug})
+        self.assertNoFullScan(url, sorted_by_index=True)
+        self.assertNoFullScan(reverse("agency-detail", kwargs={"slug": agency.slug}))
+
+    def test_feed_deep_page(self):
+        Advertisement.objects.create(
+            title="Второе объявление",
+            description="Описание",
+            price=2000000,
+            square=60,
+            user=self.user,
+            property_type=self.property_type,
+            location=self.location,
+            category=self.category,
+            status="active",
+        )
+        first = self.client.get(reverse("advertisements-list"), {"page_size": 1})
+        self.assertNoFullScan(first.data["next"], sorted_by_index=True)
+
+    def test_feed_price_range(self):
+        self.assertNoFullScan(
+            reverse("advertisements-list"), {"price_min": 500000, "price_max": 2000000}
+        )
+
+    def test_feed_category_and_type(self):
+        self.assertNoFullScan(
+            reverse("advertisements-list"),
+            {"category": self.category.pk, "property_type": self.property_type.pk},
+        )
+
+    def test_feed_search(self):
+        self.assertNoFullScan(reverse("advertisements-list"), {"search": "тест"})
+
+    def test_feed_orderings(self):
+        for ordering in ["price", "-price", "price_per_sqm", "-price_per_sqm", "date_posted"]:
+            with self.subTest(ordering=ordering):
+                first = self.client.get(
+                    reverse("advertisements-list"), {"ordering": ordering, "page_size": 1}
+                )
+                self.assertNoFullScan(
+                    reverse("advertisements-list"),
+                    {"ordering": ordering},
+                    sorted_by_index=True,
+                )
+                self.assertNoFullScan(
+                    first.data["previous"] or reverse("advertisements-list"),
+                    {"ordering": ordering},
+                    sorted_by_index=True,
+                )
+
+    def test_feed_price_per_sqm_range(self):
+        self.assertNoFullScan(
+            reverse("advertisements-list"),
+            {"price_per_sqm_min": 10000, "price_per_sqm_max": 50000},
+        )
+
+    def test_latest(self):
+        self.assertNoFullScan(reverse("advertisements-latest-list"))
+
+    def test_popular(self):
+        self.assertNoFullScan(
+            reverse("advertisements-popular-list"), sorted_by_index=True
+        )
+
+    def test_my_advertisements(self):
+        self.assertNoFullScan(reverse("my-advertisements-list"))
+
+    def test_detail(self):
+        self.assertNoFullScan(
+            reverse("advertisement-detail", kwargs={"slug": self.ad.slug})
+        )
+
+
+# Тестирование фасетов для панели фильтров
+class AdvertisementFacetsTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.flat = self.property_type
+        self.house = PropertyType.objects.create(name="Дом")
+        self.sale = self.category
+        self.rent = Category.objects.create(name="Аренда")
+        self.moscow = self.location
+        self.kazan = Location.objects.create(
+            city="Казань", district="Вахитовский", street="Баумана", house="2"
+        )
+        self.create_ad("Квартира в Москве", 500000, self.flat, self.sale, self.moscow)
+        self.create_ad("Дом в Москве", 4000000, self.house, self.sale, self.moscow)
+        self.create_ad("Квартира в Казани", 40000, self.flat, self.rent, self.kazan)
+        self.create_ad("Черновик", 40000, self.flat, self.rent, self.kazan, "draft")
+
+    def create_ad(self, title, price, property_type, category, location, status="active"):
+        return super().create_ad(
+            title=title,
+            price=price,
+            property_type=property_type,
+            location=location,
+            category=category,
+            status=status,
+        )
+
+    def get_facets(self, params=None):
+        response = self.client.get(reverse("advertisements-facets"), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts_without_filters(self):
+        data = self.get_facets()
+        self.assertEqual(
+            {item["name"]: item["count"] for item in data["category"]},
+            {"Продажа": 2, "Аренда": 1},
+        )
+        self.assertEqual(
+            {item["name"]: item["count"] for item in data["city"]},
+            {"Москва": 2, "Казань": 1},
+        )
+        self.assertEqual(
+            [(item["min"], item["count"]) for item in data["price"]],
+            [(0, 2), (3000000, 1)],
+        )
+
+    def test_facet_ignores_its_own_filter(self):
+        data = self.get_facets({"category": self.sale.pk})
+        # Категории считаются без фильтра по категории
+        self.assertEqual(len(data["category"]), 2)
+        # Остальные фасеты — только по продаже
+        self.assertEqual(
+            {item["name"]: item["count"] for item in data["property_type"]},
+            {"Квартира": 1, "Дом": 1},
+        )
+        self.assertEqual(
+            {item["name"]: item["count"] for item in data["city"]}, {"Москва": 2}
+        )
+
+    def test_single_query_and_cache(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_facets({"city": "Москва"})
+        self.assertEqual(len(app_queries(context)), 1)
+        with CaptureQueriesContext(connection) as context:
+            self.get_facets({"city": "Москва", "unused": "1"})
+        self.assertEqual(len(app_queries(context)), 0)
+
+    def test_invalid_filter(self):
+        response = self.client.get(reverse("advertisements-facets"), {"category": 999})
+        self.assertEqual(response.status_code, 400)
+
+
+# Тестирование кэша ответов ленты для анонимных пользователей
+class AdvertisementListCacheTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.ad = self.create_ad(title="Тест объявление")
+        self.url = reverse("advertisements-list")
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.client.get(self.url, {"price_min": 1, "category": self.category.pk})
+        with CaptureQueriesContext(connection) as context:
+            # Тот же запрос с другим порядком параметров
+            second = self.client.get(
+                self.url, {"category": self.category.pk, "price_min": 1}
+            )
+        self.assertEqual(app_queries(context), [])
+        self.assertEqual(first.data, second.data)
+
+    def test_catalog_change_invalidates_cache(self):
+        self.client.get(self.url)
+        self.ad.title = "Новый заголовок"
+        self.ad.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["title"], "Новый заголовок")
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertTrue(app_queries(context))
+
+
+# Тесты условных GET-запросов (ETag / Last-Modified) к детальным страницам
+class ConditionalDetailTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.agent_user = User.objects.create(email="agent@example.com", name="Agent")
+        self.agency = Agency.objects.create(name="Агентство")
+        self.ad = self.create_ad(title="Тест объявление", agency=self.agency)
+        self.ad.refresh_from_db()
+        self.agency.refresh_from_db()
+        self.ad_url = reverse("advertisement-detail", kwargs={"slug": self.ad.slug})
+        self.agency_url = reverse("agency-detail", kwargs={"slug": self.agency.slug})
+
+    def test_matching_etag_returns_304_from_single_query(self):
+        response = self.client.get(self.ad_url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(len(app_queries(context)), 1)
+
+    def test_if_modified_since_returns_304(self):
+        response = self.client.get(self.agency_url)
+        response = self.client.get(
+            self.agency_url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_photo_change_updates_advertisement_etag(self):
+        etag = self.client.get(self.ad_url)["ETag"]
+        Photo.objects.create(advertisement=self.ad, display_order=1)
+        response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_agent_change_updates_agency_etag(self):
+        etag = self.client.get(self.agency_url)["ETag"]
+        Agent.objects.create(agency=self.agency, user=self.agent_user)
+        response = self.client.get(self.agency_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["annotated_agent_count"], 1)
+
+    def test_etag_depends_on_user(self):
+        anonymous_etag = self.client.get(self.ad_url)["ETag"]
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Authorization", response["Vary"])
+
+    def test_favorites_update_agency_etag(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.agency_url)
+        self.assertFalse(response.data["advertisements"]["results"][0]["is_favorite"])
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteAdvertisement.objects.create(user=self.user, advertisement=self.ad)
+        response = self.client.get(self.agency_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["advertisements"]["results"][0]["is_favorite"])
+
+    def test_similar_advertisements_update_etag(self):
+        neighbour = self.create_ad(title="Соседнее объявление")
+        SimilarAdvertisements.objects.create(
+            advertisement=self.ad, similar_ids=[neighbour.pk], computed_at=timezone.now()
+        )
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(self.ad_url)["ETag"]
+
+        # Цена похожего объявления изменилась
+        neighbour.price = 2000000
+        neighbour.save()
+        response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["similar"][0]["price"], "2000000.00")
+
+        # Похожее объявление добавлено в избранное
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteAdvertisement.objects.create(user=self.user, advertisement=neighbour)
+        response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["similar"][0]["is_favorite"])
+        etag = response["ETag"]
+        self.assertEqual(
+            self.client.get(self.ad_url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+    def test_inactive_advertisement_is_not_found(self):
+        Advertisement.objects.filter(pk=self.ad.pk).update(status="draft")
+        response = self.client.get(self.ad_url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+
+
+# Тесты поиска по карте: прямоугольник, радиус и кластеры
+class AdvertisementGeoTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        # Две точки в центре Москвы (~1 км друг от друга) и одна в Петербурге
+        self.kremlin = self.create_ad("Кремль", 55.7520, 37.6175, 10_000_000)
+        self.arbat = self.create_ad("Арбат", 55.7494, 37.5916, 20_000_000)
+        self.piter = self.create_ad("Невский", 59.9343, 30.3351, 5_000_000)
+        self.url = reverse("advertisements-list")
+
+    def create_ad(self, title, latitude, longitude, price):
+        location = Location.objects.create(
+            city=title,
+            district="Центр",
+            street="Улица",
+            house="1",
+            latitude=latitude,
+            longitude=longitude,
+        )
+        return super().create_ad(title=title, price=price, location=location)
+
+    def result_ids(self, response):
+        return {item["id"] for item in response.data["results"]}
+
+    def test_location_gets_geohash(self):
+        self.assertTrue(self.kremlin.location.geohash.startswith("ucfv"))
+
+    def test_bbox_filter(self):
+        response = self.client.get(self.url, {"bbox": "37.0,55.0,38.0,56.0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.result_ids(response), {self.kremlin.pk, self.arbat.pk})
+
+    def test_invalid_bbox(self):
+        response = self.client.get(self.url, {"bbox": "38,56,37,55"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_radius_filter(self):
+        params = {"lat": 55.7520, "lon": 37.6175}
+        response = self.client.get(self.url, {**params, "radius": 1})
+        self.assertEqual(self.result_ids(response), {self.kremlin.pk})
+        response = self.client.get(self.url, {**params, "radius": 3})
+        self.assertEqual(self.result_ids(response), {self.kremlin.pk, self.arbat.pk})
+        response = self.client.get(self.url, {**params, "radius": 1000})
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_radius_requires_center(self):
+        response = self.client.get(self.url, {"radius": 5})
+        self.assertEqual(response.status_code, 400)
+
+    def test_moved_location_is_reindexed(self):
+        location = self.piter.location
+        location.latitude, location.longitude = 55.75, 37.60
+        location.save()
+        response = self.client.get(self.url, {"bbox": "37.0,55.0,38.0,56.0"})
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_bbox_uses_rtree(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, {"bbox": "37.0,55.0,38.0,56.0"})
+        self.assertTrue(
+            any("kluchik_location_rtree" in sql for sql in app_queries(context))
+        )
+
+    def test_viewport_query_plan(self):
+        queryset = filter_by_bbox(
+            Advertisement.objects.filter(status="active"), (55.0, 37.0, 56.0, 38.0)
+        )
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("adv_status_location_idx", plan)
+        self.assertIn("kluchik_location_rtree", plan)
+
+    def test_map_clusters(self):
+        url = reverse("advertisements-map-clusters")
+        response = self.client.get(url, {"bbox": "20,50,40,60", "zoom": 4})
+        self.assertEqual(response.status_code, 200)
+        clusters = response.data["clusters"]
+        self.assertEqual(sum(cluster["count"] for cluster in clusters), 3)
+        moscow = clusters[0]
+        self.assertEqual(moscow["count"], 2)
+        self.assertEqual(moscow["price_min"], 10_000_000)
+        self.assertEqual(moscow["price_max"], 20_000_000)
+
+        # На крупном масштабе точки Москвы расходятся по разным ячейкам
+        response = self.client.get(url, {"bbox": "37,55,38,56", "zoom": 15})
+        self.assertEqual(len(response.data["clusters"]), 2)
+
+    def test_map_requires_bbox(self):
+        url = reverse("advertisements-map-clusters")
+        self.assertEqual(self.client.get(url).status_code, 400)
+        response = self.client.get(url, {"bbox": "37,55,38,56", "zoom": 50})
+        self.assertEqual(response.status_code, 400)
+
+
+# Тесты выборочных полей (?fields=) и раскрытия связей (?expand=)
+class AdvertisementSparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email="test@example.com", name="Иван", surname="Иванов", phone_number="123"
+        )
+        self.agency = Agency.objects.create(name="Агентство")
+        self.location = Location.objects.create(
+            city="Москва", district="ЦАО", street="Тверская", house="1"
+        )
+        self.ad = Advertisement.objects.create(
+            title="Тест объявление",
+            description="Длинное описание",
+            price=1000000,
+            square=50,
+            user=self.user,
+            property_type=PropertyType.objects.create(name="Квартира"),
+            location=self.location,
+            category=Category.objects.create(name="Продажа"),
+            agency=self.agency,
+            status="active",
+        )
+        self.ad.refresh_from_db()
+        Photo.objects.create(advertisement=self.ad, display_order=2, image="photos/b.jpg")
+        Photo.objects.create(advertisement=self.ad, display_order=1, image="photos/a.jpg")
+        self.url = reverse("advertisement-detail", kwargs={"slug": self.ad.slug})
+
+    def test_default_output_is_unchanged(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["location"], str(self.location))
+        self.assertEqual(response.data["agency"], "Агентство")
+        self.assertEqual(response.data["phone_number"], "123")
+        self.assertEqual(response.data["description"], "Длинное описание")
+        self.assertTrue(response.data["photos"][0].endswith("a.jpg"))
+
+    def test_fields_trims_output_and_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {"fields": "id,title,price"})
+        self.assertEqual(set(response.data), {"id", "title", "price"})
+        queries = app_queries(context)
+        main_query = [sql for sql in queries if "kluchik_advertisement" in sql][-1]
+        self.assertNotIn("description", main_query)
+        self.assertNotIn("JOIN", main_query)
+        self.assertFalse(any("kluchik_photo" in sql for sql in queries))
+
+    def test_user_fields_load_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {"fields": "title,phone_number"})
+        self.assertEqual(response.data, {"title": "Тест объявление", "phone_number": "123"})
+        main_query = [sql for sql in app_queries(context) if "kluchik_user" in sql][-1]
+        self.assertNotIn("password", main_query)
+        self.assertNotIn("kluchik_location", main_query)
+
+    def test_expand_related_objects(self):
+        response = self.client.get(
+            self.url,
+            {
+                "fields": "title,location,agency,photos",
+                "expand": "location,agency,photos",
+            },
+        )
+        self.assertEqual(response.data["location"]["city"], "Москва")
+        self.assertEqual(response.data["agency"]["slug"], self.agency.slug)
+        self.assertEqual(
+            [photo["display_order"] for photo in response.data["photos"]], [1, 2]
+        )
+
+
+# Тесты быстрой сериализации списков (FastListSerializer)
+class FastListSerializerTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="test@example.com", name="Test")
+        self.agency = Agency.objects.create(name="Агентство")
+        self.location = Location.objects.create(
+            city="Москва", district="ЦАО", street="Тверская", house="1"
+        )
+        for index in range(3):
+            ad = Advertisement.objects.create(
+                title=f"Объявление {index}",
+                description="Описание",
+                price=1000000 + index,
+                square=50,
+                user=self.user,
+                property_type=PropertyType.objects.create(name=f"Тип {index}"),
+                location=self.location,
+                category=Category.objects.create(name=f"Категория {index}"),
+                agency=self.agency if index else None,
+                status="active" if index else "draft",
+            )
+            if index == 1:
+                Photo.objects.create(
+                    advertisement=ad, display_order=1, image="photos/cover.jpg"
+                )
+            Notification.objects.create(
+                user=self.user,
+                advertisement=ad,
+                notification_type="new_ad",
+                status="sent",
+                message="Новое объявление",
+            )
+        self.context = {"request": Request(APIRequestFactory().get("/api/"))}
+
+    def assertSameJson(self, serializer_class, instances):
+        instances = list(instances)
+        regular = ListSerializer(
+            instances, child=serializer_class(), context=self.context
+        ).data
+        fast = serializer_class(instances, many=True, context=self.context).data
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(regular))
+
+    def test_advertisement_cards(self):
+        self.assertSameJson(AdvertisementListSerializer, AdvertisementCard.objects.all())
+
+    def test_agencies(self):
+        Agency.objects.create(name="Пустое агентство")
+        self.assertSameJson(AgencyListSerializer, Agency.objects.all())
+
+    def test_notifications(self):
+        self.assertSameJson(
+            NotificationSerializer, Notification.objects.select_related("advertisement")
+        )
+
+    def test_agency_list_has_no_per_row_queries(self):
+        Agency.objects.create(name="Второе агентство")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("agencies-list"))
+        self.assertEqual(len(app_queries(context)), 1)
+        counts = {item["name"]: item["active_ads_count"] for item in response.data}
+        self.assertEqual(counts, {"Агентство": 2, "Второе агентство": 0})
+
+
+# Тесты рендереров ответа (orjson и MessagePack)
+class RendererTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.ad = self.create_ad(title="Квартира\u2028у парка")
+        self.ad.refresh_from_db()
+        self.url = reverse("advertisements-list")
+
+    def test_orjson_output_matches_drf(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertIn(b"\\u2028", response.content)
+
+    def test_orjson_handles_decimal_and_datetime_like_drf(self):
+        data = {
+            "price": Decimal("1000.50"),
+            "created_at": datetime.datetime(
+                2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc
+            ),
+            "date": datetime.date(2024, 5, 1),
+            "nested": [{"1": None, "ok": True}],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_float_formatting_differs_from_drf(self):
+        data = {"small": 1.5e-7, "large": 1e16, "coordinate": 55.76}
+        rendered = ORJSONRenderer().render(data)
+        self.assertEqual(rendered, b'{"small":1.5e-7,"large":1e16,"coordinate":55.76}')
+        self.assertEqual(
+            JSONRenderer().render(data),
+            b'{"small":1.5e-07,"large":1e+16,"coordinate":55.76}',
+        )
+        self.assertEqual(json.loads(rendered), data)
+
+    def test_nan_renders_as_null(self):
+        data = {"value": float("nan"), "inf": float("inf")}
+        self.assertEqual(ORJSONRenderer().render(data), b'{"value":null,"inf":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+
+    def test_indent_falls_back_to_drf(self):
+        data = {"a": [1, 2]}
+        rendered = ORJSONRenderer().render(data, "application/json; indent=4")
+        self.assertEqual(rendered, JSONRenderer().render(data, "application/json; indent=4"))
+
+    def test_msgpack_negotiation(self):
+        json_data = json.loads(self.client.get(self.url).content)
+        response = self.client.get(self.url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), json_data)
+
+    def test_detail_etag_depends_on_format(self):
+        url = reverse("advertisement-detail", kwargs={"slug": self.ad.slug})
+        json_etag = self.client.get(url)["ETag"]
+        response = self.client.get(
+            url, HTTP_ACCEPT="application/msgpack", HTTP_IF_NONE_MATCH=json_etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Accept", response["Vary"])
+
+
+# Тесты потоковой выгрузки каталога (NDJSON / CSV)
+class AdvertisementExportTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.staff = User.objects.create(
+            email="staff@example.com", name="Staff", is_staff=True
+        )
+        self.client.force_authenticate(self.staff)
+        self.agency = Agency.objects.create(name="Агентство")
+        self.ads = [
+            self.create_ad(
+                title=f"Объявление {index}",
+                description="Описание, с запятой",
+                price=1000000 + index,
+                agency=self.agency if index % 2 else None,
+                status="draft" if index == 4 else "active",
+            )
+            for index in range(5)
+        ]
+        Photo.objects.create(
+            advertisement=self.ads[0], display_order=2, image="photos/second.jpg"
+        )
+        Photo.objects.create(
+            advertisement=self.ads[0], display_order=1, image="photos/first.jpg"
+        )
+
+    def export(self, export_format, **params):
+        url = reverse("advertisements-export", kwargs={"export_format": export_format})
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+
+    def test_ndjson_export(self):
+        response, content = self.export("ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [ad.pk for ad in self.ads[:4]])
+        first = rows[0]
+        self.assertEqual(first["city"], "Москва")
+        self.assertEqual(first["category"], "Продажа")
+        self.assertEqual(first["price"], "1000000.00")
+        self.assertEqual(len(first["photos"]), 2)
+        self.assertTrue(first["photos"][0].startswith("http://testserver/"))
+        self.assertTrue(first["photos"][0].endswith("first.jpg"))
+        self.assertEqual(rows[1]["agency"], "Агентство")
+
+    def test_resume_after_id(self):
+        _, content = self.export("ndjson", after=self.ads[1].pk)
+        ids = [json.loads(line)["id"] for line in content.splitlines()]
+        self.assertEqual(ids, [self.ads[2].pk, self.ads[3].pk])
+
+    def test_invalid_cursor(self):
+        url = reverse("advertisements-export", kwargs={"export_format": "csv"})
+        self.assertEqual(self.client.get(url, {"after": "x"}).status_code, 400)
+
+    def test_partners_and_staff_only(self):
+        url = reverse("advertisements-export", kwargs={"export_format": "csv"})
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        partner = User.objects.create(email="partner@example.com", name="Partner")
+        group = Group.objects.create(name=settings.EXPORT_PARTNER_GROUP)
+        partner.groups.add(group)
+        self.client.force_authenticate(partner)
+        response, content = self.export("csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(content)))), 4)
+
+    @mock.patch.object(ScopedRateThrottle, "THROTTLE_RATES", {"export": "1/hour"})
+    def test_throttled(self):
+        self.export("csv")
+        url = reverse("advertisements-export", kwargs={"export_format": "csv"})
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_csv_export(self):
+        response, content = self.export("csv")
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]["description"], "Описание, с запятой")
+        self.assertEqual(len(rows[0]["photos"].split(" ")), 2)
+        self.assertEqual(rows[0]["agency"], "")
+
+    def test_photos_are_prefetched_per_chunk(self):
+        with CaptureQueriesContext(connection) as context:
+            rows = list(export_rows(chunk_size=2))
+        self.assertEqual(len(rows), 4)
+        photo_queries = [sql for sql in app_queries(context) if "kluchik_photo" in sql]
+        self.assertEqual(len(photo_queries), 2)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".ndjson") as output:
+            call_command(
+                "export_advertisements",
+                "--output",
+                output.name,
+                "--base-url",
+                "https://kluchik.ru/",
+                stderr=io.StringIO(),
+            )
+            lines = open(output.name, encoding="utf-8").read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(json.loads(lines[0])["photos"][0].startswith("https://kluchik.ru/"))
+
+
+# Тесты цены за м²: хранимая колонка, фильтры и сортировка с курсором
+class PricePerSqmTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.url = reverse("advertisements-list")
+
+    def create_ad(self, price, square, **kwargs):
+        return super().create_ad(price=price, square=square, **kwargs)
+
+    def stored(self, ad):
+        return Advertisement.objects.values_list("price_per_sqm", flat=True).get(pk=ad.pk)
+
+    def test_save_computes_price_per_sqm(self):
+        ad = self.create_ad(1000000, 30)
+        self.assertEqual(self.stored(ad), Decimal("33333.33"))
+        ad.square = 0
+        ad.save(update_fields=["square"])
+        self.assertIsNone(self.stored(ad))
+
+    def test_queryset_update(self):
+        ad = self.create_ad(1000000, 50)
+        Advertisement.objects.filter(pk=ad.pk).update(price=3000000)
+        self.assertEqual(self.stored(ad), Decimal("60000.00"))
+        Advertisement.objects.filter(pk=ad.pk).update(square=F("square") * 2)
+        self.assertEqual(self.stored(ad), Decimal("30000.00"))
+
+    def test_bulk_operations(self):
+        ad = self.create_ad(1000000, 50)
+        ad.price = 2000000
+        Advertisement.objects.bulk_update([ad], ["price"])
+        self.assertEqual(self.stored(ad), Decimal("40000.00"))
+
+        created = Advertisement.objects.bulk_create(
+            [
+                Advertisement(
+                    title="Пакет",
+                    description="Описание",
+                    price=900000,
+                    square=30,
+                    user=self.user,
+                    property_type=self.property_type,
+                    location=self.location,
+                    category=self.category,
+                    status="active",
+                    slug="paket",
+                )
+            ]
+        )
+        self.assertEqual(self.stored(created[0]), Decimal("30000.00"))
+
+    def test_range_filter(self):
+        cheap = self.create_ad(1000000, 100)
+        self.create_ad(1000000, 10)
+        response = self.client.get(self.url, {"price_per_sqm_max": 20000})
+        self.assertEqual([item["id"] for item in response.data["results"]], [cheap.pk])
+
+    def walk(self, ordering):
+        """Проходит все страницы по курсору и возвращает id по порядку"""
+        ids = []
+        response = self.client.get(self.url, {"ordering": ordering, "page_size": 2})
+        while True:
+            ids.extend(item["id"] for item in response.data["results"])
+            if not response.data["next"]:
+                return ids, response
+            response = self.client.get(response.data["next"])
+
+    def test_every_ordering_paginates(self):
+        ads = [
+            self.create_ad(3000000, 60),  # 50000
+            self.create_ad(1000000, 50),  # 20000
+            self.create_ad(2000000, 0),  # NULL
+            self.create_ad(2000000, 40),  # 50000
+            self.create_ad(5000000, 0),  # NULL
+        ]
+        expected = {
+            "price": sorted(ads, key=lambda ad: (ad.price, ad.pk)),
+            "-price": sorted(ads, key=lambda ad: (-ad.price, -ad.pk)),
+            "date_posted": sorted(ads, key=lambda ad: (ad.date_posted, ad.pk)),
+            # NULL — наименьшее значение
+            "price_per_sqm": [ads[2], ads[4], ads[1], ads[0], ads[3]],
+            "-price_per_sqm": [ads[3], ads[0], ads[1], ads[4], ads[2]],
+        }
+        for ordering, ordered in expected.items():
+            with self.subTest(ordering=ordering):
+                ids, last = self.walk(ordering)
+                self.assertEqual(ids, [ad.pk for ad in ordered])
+
+                # Обратный проход по ссылкам previous
+                back = []
+                response = self.client.get(last.data["previous"])
+                while True:
+                    back[:0] = [item["id"] for item in response.data["results"]]
+                    if not response.data["previous"]:
+                        break
+                    response = self.client.get(response.data["previous"])
+                self.assertEqual(back, ids[: len(back)])
+                self.assertEqual(len(back), len(ids) - len(last.data["results"]))
+
+
+# Тесты блока «похожие объявления»
+class SimilarAdvertisementsTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flat = self.property_type
+        self.house = PropertyType.objects.create(name="Дом")
+        self.sale = self.category
+        self.rent = Category.objects.create(name="Аренда")
+        self.center = self.location
+        self.center.latitude, self.center.longitude = 55.76, 37.61
+        self.center.save()
+        self.suburb = Location.objects.create(
+            city="Москва", district="НАО", street="Лесная", house="2",
+            latitude=55.55, longitude=37.20,
+        )
+
+    def create_ad(self, price, square, location=None, category=None, property_type=None):
+        return super().create_ad(
+            price=price,
+            square=square,
+            property_type=property_type or self.flat,
+            location=location or self.center,
+            category=category or self.sale,
+        )
+
+    def similar_ids(self, ad):
+        return SimilarAdvertisements.objects.get(pk=ad.pk).similar_ids
+
+    def test_neighbours_ordered_and_same_category(self):
+        base = self.create_ad(10000000, 50)
+        close = self.create_ad(10200000, 51)
+        other_type = self.create_ad(10000000, 50, property_type=self.house)
+        farther = self.create_ad(10000000, 50, location=self.suburb)
+        # Разброс цен и площадей задаёт масштаб признаков
+        self.create_ad(5000000, 30)
+        self.create_ad(20000000, 90)
+        rent = self.create_ad(10000000, 50, category=self.rent)
+
+        self.assertEqual(refresh_similar_advertisements(full=True)["computed"], 7)
+        similar = self.similar_ids(base)
+        self.assertEqual(len(similar), 5)
+        self.assertEqual(similar[:2], [close.pk, other_type.pk])
+        self.assertEqual(similar[-1], farther.pk)
+        self.assertNotIn(rent.pk, similar)
+        self.assertEqual(self.similar_ids(rent), [])
+
+    def test_incremental_refresh(self):
+        first = self.create_ad(10000000, 50)
+        second = self.create_ad(10000000, 51)
+        refresh_similar(full=True)
+        self.assertEqual(refresh_similar()["computed"], 0)
+
+        # Новое объявление попадает в списки соседей
+        third = self.create_ad(10000000, 50)
+        self.assertEqual(refresh_similar()["computed"], 3)
+        self.assertEqual(self.similar_ids(first), [third.pk, second.pk])
+
+        # Снятое с публикации исчезает из списков
+        third.status = "sold"
+        third.save()
+        result = refresh_similar()
+        self.assertEqual(result["removed"], 1)
+        self.assertEqual(self.similar_ids(first), [second.pk])
+        self.assertEqual(self.similar_ids(second), [first.pk])
+
+    def test_favorites_do_not_trigger_recompute(self):
+        ad = self.create_ad(10000000, 50)
+        self.create_ad(10000000, 51)
+        refresh_similar(full=True)
+
+        FavoriteAdvertisement.objects.create(user=self.user, advertisement=ad)
+        self.assertEqual(refresh_similar()["computed"], 0)
+
+        ad.price = 12000000
+        ad.save()
+        self.assertEqual(refresh_similar()["computed"], 2)
+
+    def test_incremental_refresh_reads_changed_categories(self):
+        sale = [self.create_ad(10000000, 50 + index) for index in range(3)]
+        self.create_ad(10000000, 50, category=self.rent)
+        refresh_similar(full=True)
+
+        Advertisement.objects.filter(pk=sale[0].pk).update(square=45)
+        result = refresh_similar()
+        self.assertEqual(result["loaded"], 3)
+        self.assertEqual(result["computed"], 3)
+
+    def test_detail_reads_precomputed_list(self):
+        ad = self.create_ad(10000000, 50)
+        other = self.create_ad(10000000, 50)
+        url = reverse("advertisement-detail", kwargs={"slug": ad.slug})
+        self.assertEqual(self.client.get(url).data["similar"], [])
+        etag = self.client.get(url)["ETag"]
+
+        refresh_similar(full=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["similar"]], [other.pk])
+        self.assertEqual(response.data["similar"][0]["price"], "10000000.00")
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {"fields": "id,similar"})
+        # версия + объявление со списком + карточки
+        self.assertEqual(len(app_queries(context)), 3)
+
+
+# Тесты сохранённых поисков и уведомлений о новых объявлениях
+class SavedSearchTests(AdvertisementTestCase):
+    def setUp(self):
+        reset_matcher()
+        super().setUp()
+        self.owner = User.objects.create(email="owner@example.com", name="Owner")
+        self.other = User.objects.create(email="other@example.com", name="Other")
+        self.flat = self.property_type
+        self.house = PropertyType.objects.create(name="Дом")
+        self.sale = self.category
+        self.rent = Category.objects.create(name="Аренда")
+        self.url = reverse("saved-searches-list")
+
+    def save_search(self, user, **query):
+        self.client.force_authenticate(user)
+        response = self.client.post(self.url, {"query": query}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return SavedSearch.objects.get(pk=response.data["id"])
+
+    def create_ad(self, status="active", **kwargs):
+        data = {
+            "title": "Светлая квартира",
+            "price": 10000000,
+            "user": self.owner,
+            "status": status,
+        }
+        data.update(kwargs)
+        return super().create_ad(**data)
+
+    def notified_users(self, ad):
+        return sorted(
+            Notification.objects.filter(
+                advertisement=ad, notification_type="new_ad"
+            ).values_list("user__email", flat=True)
+        )
+
+    def test_create_stores_criteria(self):
+        search = self.save_search(
+            self.user,
+            category=self.sale.pk,
+            price_max="12000000",
+            city="Москва",
+            ordering="price",
+            unknown="x",
+        )
+        self.assertEqual(
+            search.query,
+            {"category": str(self.sale.pk), "price_max": "12000000", "city": "Москва"},
+        )
+        self.assertEqual(search.category, self.sale)
+        self.assertEqual(search.price_max, Decimal("12000000"))
+        self.assertFalse(search.has_extra_filters)
+        self.assertTrue(self.save_search(self.user, search="светлая").has_extra_filters)
+
+        response = self.client.post(
+            self.url, {"query": {"price_min": "дорого"}}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("price_min", response.data["query"])
+        response = self.client.post(self.url, {"query": {"bbox": "1,2"}}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_matching_searches_get_notifications(self):
+        self.save_search(self.user, category=self.sale.pk, price_min=9000000)
+        self.save_search(self.user, city="Москва")  # тот же пользователь — одно уведомление
+        self.save_search(self.other, square_min=60)
+        self.save_search(self.other, category=self.rent.pk)
+        self.save_search(self.other, property_type=self.house.pk)
+        self.save_search(self.owner, city="Москва")  # владелец объявления
+        ad = self.create_ad()
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(notify_saved_searches(ad.pk), 1)
+        self.assertLessEqual(len(app_queries(context)), 6)
+        self.assertEqual(self.notified_users(ad), ["test@example.com"])
+
+        # Повторный запуск не дублирует уведомления
+        self.assertEqual(notify_saved_searches(ad.pk), 0)
+
+    def test_extra_filters_checked_in_database(self):
+        self.save_search(self.user, search="светлая")
+        self.save_search(self.other, search="дом у моря")
+        ad = self.create_ad()
+        notify_saved_searches(ad.pk)
+        self.assertEqual(self.notified_users(ad), ["test@example.com"])
+
+    def test_changed_and_deleted_searches(self):
+        search = self.save_search(self.user, price_max=5000000)
+        disabled = self.save_search(self.other, price_max=20000000)
+        first = self.create_ad()
+        notify_saved_searches(first.pk)
+        self.assertEqual(self.notified_users(first), ["other@example.com"])
+
+        # Изменения догружаются в индекс: выключенный поиск не срабатывает,
+        # изменённый — срабатывает по новым условиям
+        self.client.force_authenticate(self.other)
+        response = self.client.patch(
+            reverse("saved-searches-detail", kwargs={"pk": disabled.pk}),
+            {"is_active": False},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(self.user)
+        self.client.patch(
+            reverse("saved-searches-detail", kwargs={"pk": search.pk}),
+            {"query": {"price_max": "20000000"}},
+            format="json",
+        )
+        second = self.create_ad()
+        notify_saved_searches(second.pk)
+        self.assertEqual(self.notified_users(second), ["test@example.com"])
+
+        search.delete()
+        third = self.create_ad()
+        self.assertEqual(notify_saved_searches(third.pk), 0)
+
+    def test_user_sees_only_own_searches(self):
+        self.save_search(self.other, city="Москва")
+        own = self.save_search(self.user, city="Казань")
+        response = self.client.get(self.url)
+        self.assertEqual([item["id"] for item in response.data], [own.pk])
+
+    @mock.patch("kluchik.tasks.notify_about_publish.delay")
+    def test_publication_schedules_task_after_commit(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            ad = self.create_ad()
+        delay.assert_called_once_with(ad.pk)
+
+        delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = self.create_ad(status="draft")
+            ad = Advertisement.objects.get(pk=ad.pk)
+            ad.price = 9000000
+            ad.save()
+        delay.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = Advertisement.objects.get(pk=draft.pk)
+            draft.status = "active"
+            draft.save(update_fields=["status"])
+        delay.assert_called_once_with(draft.pk)
+
+
+# Тесты подсказок строки поиска
+class SuggestTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        super().setUp()
+        self.tverskaya = self.location
+        self.lenina = Location.objects.create(
+            city="Тверь", district="Центральный", street="ул. Ленина", house="2"
+        )
+        self.url = reverse("suggest")
+
+    def create_ad(self, title, location, status="active"):
+        return super().create_ad(title=title, location=location, status=status)
+
+    def suggest(self, query, **params):
+        response = self.client.get(self.url, {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item["kind"], item["text"], item["count"]) for item in response.data["results"]]
+
+    def test_cyrillic_and_transliterated_input(self):
+        self.create_ad("Просторная квартира", self.tverskaya)
+        self.create_ad("Уютная студия", self.tverskaya)
+        self.create_ad("Тверская квартира", self.lenina)
+
+        expected = [
+            ("street", "Тверская, Москва", 2),
+            ("city", "Тверь", 1),
+            ("title", "тверская", 1),
+        ]
+        self.assertEqual(self.suggest("твер"), expected)
+        self.assertEqual(self.suggest("tver"), expected)
+        self.assertEqual(self.suggest("Тверская"), [expected[0], expected[2]])
+        # Поиск по любому слову, а не только по началу строки
+        self.assertEqual(self.suggest("lenin"), [("street", "ул. Ленина, Тверь", 1)])
+        self.assertEqual(self.suggest("к"), [("title", "квартира", 2)])
+        response = self.client.get(self.url, {"q": "к", "limit": "x"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.suggest("   "), [])
+
+    def test_index_follows_catalog_changes(self):
+        ad = self.create_ad("Квартира у парка", self.tverskaya)
+        self.assertEqual(self.suggest("парк"), [("title", "парка", 1)])
+
+        with CaptureQueriesContext(connection) as context:
+            self.suggest("мос")
+        self.assertEqual(app_queries(context), [])
+
+        ad.title = "Квартира у сквера"
+        ad.save()
+        self.assertEqual(self.suggest("парк"), [])
+        self.assertEqual(self.suggest("сквер"), [("title", "сквера", 1)])
+
+        self.tverskaya.district = "Тверской"
+        self.tverskaya.save()
+        self.assertEqual(self.suggest("tverskoi"), [("district", "Тверской, Москва", 1)])
+
+        draft = self.create_ad("Дом у реки", self.lenina, status="draft")
+        self.assertEqual(self.suggest("реки"), [])
+        draft.status = "active"
+        draft.save()
+        self.assertEqual(self.suggest("реки"), [("title", "реки", 1)])
+
+        draft.delete()
+        self.assertEqual(self.suggest("реки"), [])
+        self.assertEqual(self.suggest("сквер"), [("title", "сквера", 1)])
+
+
+# Тесты хранимого счётчика избранного
+class FavoriteCountTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create(email="owner@example.com", name="Owner")
+        self.users = [
+            User.objects.create(email=f"user{index}@example.com", name="User")
+            for index in range(3)
+        ]
+        self.ads = [
+            self.create_ad(title=f"Объявление {index}", user=self.owner)
+            for index in range(4)
+        ]
+
+    def count(self, ad):
+        return Advertisement.objects.values_list("favorite_count", flat=True).get(pk=ad.pk)
+
+    def favorite(self, user, ad):
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            reverse("advertisements-favorite-add"),
+            {"advertisement_id": ad.pk},
+            format="json",
+        )
+        self.assertIn(response.status_code, (200, 201))
+
+    def test_add_remove_and_cascade(self):
+        ad = self.ads[0]
+        stale = Advertisement.objects.get(pk=ad.pk)
+        for user in self.users:
+            self.favorite(user, ad)
+        self.favorite(self.users[0], ad)  # повторное добавление не считается
+        self.assertEqual(self.count(ad), 3)
+
+        # Сохранение объекта, прочитанного раньше, не затирает счётчик
+        stale.title = "Новый заголовок"
+        stale.save()
+        self.assertEqual(self.count(ad), 3)
+
+        response = self.client.delete(
+            reverse("advertisements-favorite-remove"),
+            {"advertisement_id": ad.pk},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.count(ad), 2)
+
+        self.users[1].delete()
+        self.assertEqual(self.count(ad), 1)
+
+    def test_popular_uses_counter(self):
+        for user, ad in [
+            (self.users[0], self.ads[2]),
+            (self.users[1], self.ads[2]),
+            (self.users[0], self.ads[1]),
+        ]:
+            self.favorite(user, ad)
+        response = self.client.get(reverse("advertisements-popular-list"))
+        self.assertEqual(
+            [(item["id"], item["favorite_count"]) for item in response.data],
+            [(self.ads[2].pk, 2), (self.ads[1].pk, 1), (self.ads[3].pk, 0)],
+        )
+
+    def test_reconcile_repairs_drift(self):
+        for user in self.users:
+            self.favorite(user, self.ads[0])
+        self.favorite(self.users[0], self.ads[3])
+        Advertisement.objects.filter(pk=self.ads[0].pk).update(favorite_count=7)
+        Advertisement.objects.filter(pk=self.ads[1].pk).update(favorite_count=2)
+        FavoriteAdvertisement.objects.bulk_create(
+            [FavoriteAdvertisement(user=self.users[1], advertisement=self.ads[3])]
+        )
+
+        self.assertEqual(reconcile_favorite_counts(batch_size=3), 3)
+        self.assertEqual([self.count(ad) for ad in self.ads], [3, 0, 0, 2])
+        self.assertEqual(reconcile_favorite_counts(), 0)
+
+
+# Тесты агрегированного ответа главной страницы
+class HomeTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.agencies = [Agency.objects.create(name=f"Агентство {index}") for index in range(4)]
+        self.ads = []
+        for index, city in enumerate(["Москва", "Москва", "Тверь", "Казань"]):
+            location = Location.objects.create(
+                city=city, district="Центр", street="Ленина", house=str(index)
+            )
+            self.ads.append(
+                self.create_ad(
+                    title=f"Объявление {index}",
+                    location=location,
+                    agency=self.agencies[index % 2],
+                )
+            )
+        FavoriteAdvertisement.objects.create(user=self.user, advertisement=self.ads[0])
+        AgencySubscription.objects.create(user=self.user, agency=self.agencies[1])
+        self.url = reverse("home")
+
+    def test_document_matches_widgets_with_fixed_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(app_queries(context)), 5)
+
+        data = response.data
+        self.assertEqual(
+            data["totals"], {"advertisements": 4, "cities": 3, "agencies": 4}
+        )
+        self.assertEqual(
+            json.loads(json.dumps(data["latest"])),
+            self.client.get(reverse("advertisements-latest-list")).json(),
+        )
+        self.assertEqual(
+            json.loads(json.dumps(data["popular"])),
+            self.client.get(reverse("advertisements-popular-list")).json(),
+        )
+        self.assertEqual(data["popular"][0]["id"], self.ads[0].pk)
+        self.assertEqual(
+            json.loads(json.dumps(data["popular_agencies"])),
+            self.client.get(reverse("agency-popular-list")).json(),
+        )
+        self.assertEqual(data["popular_agencies"][0]["id"], self.agencies[1].pk)
+        self.assertEqual(data["popular_agencies"][0]["active_ads_count"], 2)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).data, data)
+        self.assertEqual(app_queries(context), [])
+
+    def test_catalog_change_and_stampede_protection(self):
+        first = self.client.get(self.url).data
+
+        self.ads[3].status = "sold"
+        self.ads[3].save()
+        second = self.client.get(self.url).data
+        self.assertEqual(second["totals"]["advertisements"], 3)
+
+        # Пока другой процесс пересобирает документ, отдаётся прежняя копия
+        self.ads[2].status = "sold"
+        self.ads[2].save()
+        cache.add("home:testserver:lock", 1)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).data, second)
+        self.assertEqual(app_queries(context), [])
+        cache.delete("home:testserver:lock")
+        self.assertEqual(self.client.get(self.url).data["totals"]["advertisements"], 2)
+        self.assertNotEqual(first, second)
+
+
+# Тесты хранимых счётчиков агентства
+class AgencyCounterTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create(email="owner@example.com", name="Owner")
+        self.users = [
+            User.objects.create(email=f"user{index}@example.com", name="User")
+            for index in range(3)
+        ]
+        self.first = Agency.objects.create(name="Первое агентство")
+        self.second = Agency.objects.create(name="Второе агентство")
+
+    def create_ad(self, agency, status="active"):
+        return super().create_ad(user=self.owner, agency=agency, status=status)
+
+    def counters(self, agency):
+        return Agency.objects.values_list(
+            "active_ads_count", "subscriber_count", "agent_count"
+        ).get(pk=agency.pk)
+
+    def test_advertisement_status_and_agency_changes(self):
+        ad = self.create_ad(self.first)
+        self.create_ad(self.first, status="draft")
+        self.assertEqual(self.counters(self.first)[0], 1)
+
+        ad = Advertisement.objects.get(pk=ad.pk)
+        ad.agency = self.second
+        ad.save()
+        self.assertEqual(self.counters(self.first)[0], 0)
+        self.assertEqual(self.counters(self.second)[0], 1)
+
+        # Статус не входит в update_fields — счётчик не меняется
+        ad.status = "draft"
+        ad.save(update_fields=["title"])
+        self.assertEqual(self.counters(self.second)[0], 1)
+        ad.save(update_fields=["status"])
+        self.assertEqual(self.counters(self.second)[0], 0)
+        ad.status = "active"
+        ad.save()
+        self.assertEqual(self.counters(self.second)[0], 1)
+
+        ad.delete()
+        self.assertEqual(self.counters(self.second)[0], 0)
+
+    def test_subscriptions_and_agents(self):
+        self.client.force_authenticate(self.users[0])
+        url = reverse("agencies-favorite-add")
+        self.client.post(url, {"agency_id": self.first.pk}, format="json")
+        self.client.post(url, {"agency_id": self.first.pk}, format="json")
+        self.users[1].subscriptions.add(self.first, self.second)
+        self.second.subscribers.add(self.users[2])
+        Agent.objects.create(agency=self.first, user=self.users[0])
+        self.assertEqual(self.counters(self.first), (0, 2, 1))
+        self.assertEqual(self.counters(self.second), (0, 2, 0))
+
+        # Сохранение объекта, прочитанного раньше, не затирает счётчики
+        stale = Agency.objects.get(pk=self.second.pk)
+        self.users[1].subscriptions.clear()
+        stale.name = "Новое название"
+        stale.save()
+        self.assertEqual(self.counters(self.second), (0, 1, 0))
+
+        agent = Agent.objects.get(user=self.users[0])
+        agent.agency = self.second
+        agent.save()
+        self.users[2].delete()
+        self.assertEqual(self.counters(self.first), (0, 1, 0))
+        self.assertEqual(self.counters(self.second), (0, 0, 1))
+
+    def test_endpoints_read_columns(self):
+        self.create_ad(self.first)
+        AgencySubscription.objects.create(user=self.users[0], agency=self.first)
+        Agent.objects.create(agency=self.first, user=self.users[1])
+        Agency.objects.filter(pk=self.first.pk).update(subscriber_count=5)
+
+        self.client.force_authenticate(self.users[0])
+        for url in [
+            reverse("agencies-list"),
+            reverse("agencies-favorite-list"),
+            reverse("agency-popular-list"),
+        ]:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertFalse(
+                [sql for sql in app_queries(context) if "COUNT(" in sql], url
+            )
+            item = next(item for item in response.data if item["id"] == self.first.pk)
+            self.assertEqual(
+                (
+                    item["active_ads_count"],
+                    item["subscriber_count"],
+                    item["annotated_agent_count"],
+                ),
+                (1, 5, 1),
+            )
+
+        response = self.client.get(
+            reverse("agency-detail", kwargs={"slug": self.first.slug})
+        )
+        self.assertEqual(response.data["subscriber_count"], 5)
+
+    def test_rebuild_command(self):
+        self.create_ad(self.first)
+        AgencySubscription.objects.create(user=self.users[0], agency=self.second)
+        Agency.objects.filter(pk=self.first.pk).update(
+            active_ads_count=9, agent_count=3
+        )
+        Advertisement.objects.update(agency=self.second)
+
+        out = io.StringIO()
+        call_command("rebuild_agency_counters", stdout=out)
+        self.assertIn("Исправлено агентств: 2", out.getvalue())
+        self.assertEqual(self.counters(self.first), (0, 0, 0))
+        self.assertEqual(self.counters(self.second), (1, 1, 0))
+
+
+# Тесты объявлений агентства: первая страница в детальном ответе и вложенный ресурс
+class AgencyAdvertisementsTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.agency = Agency.objects.create(name="Агентство")
+        self.other = Agency.objects.create(name="Другое агентство")
+        self.ads = [self.create_ad(1000000 + index) for index in range(25)]
+        self.create_ad(500000, status="draft")
+        self.create_ad(500000, agency=self.other)
+        self.agency.refresh_from_db()
+        self.detail_url = reverse("agency-detail", kwargs={"slug": self.agency.slug})
+        self.url = reverse("agency-advertisements", kwargs={"slug": self.agency.slug})
+
+    def create_ad(self, price, status="active", agency=None):
+        return super().create_ad(
+            price=price, status=status, agency=agency or self.agency
+        )
+
+    def ids(self, results):
+        return [item["id"] for item in results]
+
+    def test_detail_contains_first_page(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        page = response.data["advertisements"]
+        newest = sorted(self.ads, key=lambda ad: (ad.date_posted, ad.pk), reverse=True)
+        self.assertEqual(self.ids(page["results"]), [ad.pk for ad in newest[:20]])
+        self.assertTrue(page["next"].startswith(f"http://testserver{self.url}?cursor="))
+
+        # Продолжение по ссылке next — вложенный ресурс
+        rest = self.client.get(page["next"]).data
+        self.assertEqual(self.ids(rest["results"]), [ad.pk for ad in newest[20:]])
+        self.assertIsNone(rest["next"])
+
+    def test_detail_queries_do_not_grow_with_agency(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.detail_url)
+        before = len(app_queries(context))
+        for index in range(10):
+            self.create_ad(2000000 + index)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.detail_url)
+        self.assertEqual(len(app_queries(context)), before)
+
+    def test_anonymous_cache_is_per_list(self):
+        cache.clear()
+        other_url = reverse("agency-advertisements", kwargs={"slug": self.other.slug})
+        feed_url = reverse("advertisements-list")
+        for _ in range(2):
+            own = self.ids(self.client.get(self.url, {"page_size": 50}).data["results"])
+            other = self.ids(self.client.get(other_url).data["results"])
+            feed = self.ids(self.client.get(feed_url, {"page_size": 50}).data["results"])
+            self.assertEqual(sorted(own), sorted(ad.pk for ad in self.ads))
+            self.assertEqual(len(other), 1)
+            self.assertNotIn(other[0], own)
+            self.assertEqual(sorted(feed), sorted(own + other))
+
+    def test_subresource_filters_and_ordering(self):
+        response = self.client.get(
+            self.url, {"price_max": 1000004, "ordering": "price", "with_count": 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.ids(response.data["results"]), [ad.pk for ad in self.ads[:5]]
+        )
+        self.assertEqual(response.data["count"], 5)
+
+        response = self.client.get(self.url, {"price_min": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_agency(self):
+        url = reverse("agency-advertisements", kwargs={"slug": "net-takogo"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+# Тесты импорта фида объявлений агентства
+class FeedImportTests(APITestCase):
+    CSV_FEED = (
+        "external_id;title;description;price;square;category;property_type;"
+        "city;district;street;house;latitude;longitude\n"
+        "a-1;Квартира у парка;Светлая квартира;5000000;50;Продажа;квартира;"
+        "Москва;ЦАО;Тверская;1;55.76;37.61\n"
+        "a-2;Дом у моря;Дом с садом;9000000;120;продажа;Квартира;"
+        "Москва;ЦАО;Тверская;1;55.76;37.61\n"
+        "a-3;Без цены;Описание;;40;Продажа;Квартира;Москва;ЦАО;Тверская;2;;\n"
+        "a-4;Неизвестная категория;Описание;100;40;Аренда;Квартира;"
+        "Москва;ЦАО;Тверская;2;;\n"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create(email="agent@example.com", name="Agent")
+        self.agency = Agency.objects.create(name="Агентство")
+        Agent.objects.create(agency=self.agency, user=self.user)
+        self.category = Category.objects.create(name="Продажа")
+        self.property_type = PropertyType.objects.create(name="Квартира")
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_import(self, content, feed_format="csv"):
+        if isinstance(content, str):
+            content = content.encode()
+        return import_feed(io.BytesIO(content), feed_format, self.agency, self.user)
+
+    def search_ids(self, query):
+        response = self.client.get(reverse("advertisements-list"), {"search": query})
+        return [item["id"] for item in response.data["results"]]
+
+    def test_csv_import_creates_advertisements(self):
+        report = self.run_import(self.CSV_FEED)
+        self.assertEqual(
+            (report["total"], report["created"], report["updated"]), (4, 2, 0)
+        )
+        self.assertEqual(report["error_count"], 2)
+        self.assertEqual(
+            [(error["row"], sorted(error["errors"])) for error in report["errors"]],
+            [(3, ["price"]), (4, ["category"])],
+        )
+
+        ads = Advertisement.objects.filter(agency=self.agency).order_by("external_id")
+        self.assertEqual([ad.external_id for ad in ads], ["a-1", "a-2"])
+        # Один адрес на обе строки, slug и карточки заполнены
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertTrue(all(ad.slug and ad.external_url for ad in ads))
+        self.assertEqual(ads[0].price_per_sqm, Decimal("100000.00"))
+        self.assertEqual(AdvertisementCard.objects.filter(advertisement__in=ads).count(), 2)
+        self.assertEqual(self.search_ids("моря"), [ads[1].pk])
+
+        self.agency.refresh_from_db()
+        self.assertEqual(self.agency.active_ads_count, 2)
+
+    def test_slugs_assigned_with_single_update(self):
+        with CaptureQueriesContext(connection) as context:
+            self.run_import(self.CSV_FEED)
+        slug_updates = [
+            sql
+            for sql in app_queries(context)
+            if sql.startswith('UPDATE "kluchik_advertisement"') and '"slug"' in sql
+        ]
+        self.assertEqual(len(slug_updates), 1)
+        for ad in Advertisement.objects.filter(agency=self.agency):
+            self.assertEqual(ad.slug, f"{custom_slugify(ad.title)}-{ad.pk}")
+            self.assertTrue(ad.external_url.endswith(f"/advertisement/{ad.slug}/"))
+
+        # Повторный импорт slug не меняет
+        slugs = set(Advertisement.objects.values_list("slug", flat=True))
+        self.run_import(self.CSV_FEED)
+        self.assertEqual(set(Advertisement.objects.values_list("slug", flat=True)), slugs)
+
+    def test_subscribers_notified_of_published_rows(self):
+        subscriber = User.objects.create(email="sub@example.com", name="Sub")
+        searcher = User.objects.create(email="search@example.com", name="Search")
+        for user in [subscriber, searcher, self.user]:
+            AgencySubscription.objects.create(user=user, agency=self.agency)
+        reset_matcher()
+        self.client.force_authenticate(searcher)
+        response = self.client.post(
+            reverse("saved-searches-list"),
+            {"name": "Парк", "query": {"search": "парк"}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.CSV_FEED)
+        notified = Notification.objects.filter(notification_type="new_ad")
+        self.assertEqual(
+            sorted(notified.values_list("user_id", "advertisement__external_id")),
+            sorted(
+                [
+                    (subscriber.pk, "a-1"),
+                    (subscriber.pk, "a-2"),
+                    (searcher.pk, "a-1"),
+                    (searcher.pk, "a-2"),
+                ]
+            ),
+        )
+        # Совпавший сохранённый поиск уведомляет первым, подписка не дублирует
+        message = notified.get(user=searcher, advertisement__external_id="a-1").message
+        self.assertTrue(message.startswith("Новое объявление по поиску «Парк»"))
+
+        # Повторный импорт активных объявлений рассылку не повторяет,
+        # снятое и снова опубликованное — рассылает
+        Advertisement.objects.filter(external_id="a-1").update(status="draft")
+        Notification.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.CSV_FEED)
+        self.assertEqual(
+            sorted(notified.values_list("user_id", "advertisement__external_id")),
+            sorted([(subscriber.pk, "a-1"), (searcher.pk, "a-1")]),
+        )
+
+    def test_reimport_updates_by_external_id(self):
+        self.run_import(self.CSV_FEED)
+        ad = Advertisement.objects.get(external_id="a-1")
+        feed = [
+            {
+                "external_id": "a-1",
+                "title": "Квартира у сквера",
+                "description": "Обновлено",
+                "price": 6000000,
+                "square": 60,
+                "category": self.category.pk,
+                "property_type": "квартира",
+                "city": "Москва",
+                "district": "ЦАО",
+                "street": "Тверская",
+                "house": "1",
+                "status": "sold",
+            },
+        ]
+        report = self.run_import(json.dumps({"advertisements": feed}), "json")
+        self.assertEqual((report["created"], report["updated"]), (0, 1))
+
+        updated = Advertisement.objects.get(external_id="a-1")
+        self.assertEqual(updated.pk, ad.pk)
+        self.assertEqual(updated.slug, ad.slug)
+        self.assertEqual(updated.date_posted, ad.date_posted)
+        self.assertEqual(
+            (updated.title, updated.price_per_sqm, updated.status),
+            ("Квартира у сквера", Decimal("100000.00"), "sold"),
+        )
+        self.assertEqual(AdvertisementCard.objects.get(advertisement=ad).title, "Квартира у сквера")
+        self.assertEqual(self.search_ids("сквера"), [])
+        self.assertEqual(Advertisement.objects.filter(agency=self.agency).count(), 2)
+        self.agency.refresh_from_db()
+        self.assertEqual(self.agency.active_ads_count, 1)
+
+    def test_duplicate_external_id_in_feed(self):
+        lines = self.CSV_FEED.splitlines()
+        report = self.run_import("\n".join(lines[:2] + lines[1:2]))
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["errors"][0]["errors"], {"external_id": ["Повторяется в фиде."]})
+
+    def test_xml_import(self):
+        feed = (
+            "<advertisements>"
+            '<advertisement external_id="x-1">'
+            "<title>Квартира</title><description>Описание</description>"
+            "<price>3000000</price><square>30</square>"
+            "<category>Продажа</category><property_type>Квартира</property_type>"
+            "<city>Казань</city><district>Вахитовский</district>"
+            "<street>Баумана</street><house>5</house>"
+            "</advertisement>"
+            "</advertisements>"
+        )
+        report = self.run_import(feed, "xml")
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(Advertisement.objects.get(external_id="x-1").location.city, "Казань")
+
+    def test_xml_entities_are_rejected(self):
+        feed = (
+            '<?xml version="1.0"?><!DOCTYPE a [<!ENTITY e "x">]>'
+            "<advertisements><advertisement><title>&e;</title></advertisement>"
+            "</advertisements>"
+        )
+        report = self.run_import(feed, "xml")
+        self.assertIn("error", report)
+        self.assertEqual(report["created"], 0)
+
+    def feed_rows(self, prefix, count):
+        header = self.CSV_FEED.splitlines()[0]
+        return "\n".join(
+            [header]
+            + [
+                f"{prefix}-{index};Квартира {index};Описание;{1000000 + index};40;"
+                f"Продажа;Квартира;Москва;ЦАО;Улица {prefix}{index};1;;"
+                for index in range(count)
+            ]
+        ).encode()
+
+    def test_batch_queries_do_not_grow_with_rows(self):
+        counts = []
+        for prefix, count in [("b", 10), ("c", 40)]:
+            with CaptureQueriesContext(connection) as context:
+                import_feed(
+                    io.BytesIO(self.feed_rows(prefix, count)), "csv",
+                    self.agency, self.user, batch_size=count,
+                )
+            counts.append(len(app_queries(context)))
+        # Одна пачка — одинаковое число запросов независимо от её размера
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Advertisement.objects.count(), 50)
+
+    @mock.patch("kluchik.tasks.import_advertisement_feed.delay")
+    def test_upload_endpoint(self, delay):
+        self.client.force_authenticate(self.user)
+        url = reverse("feed-imports-list")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url,
+                {
+                    "agency": self.agency.pk,
+                    "file": SimpleUploadedFile("feed.csv", self.CSV_FEED.encode()),
+                },
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["format"], "csv")
+        self.assertEqual(response.data["status"], "pending")
+        delay.assert_called_once_with(response.data["id"])
+
+        process_feed_import(response.data["id"])
+        # Повторная доставка задачи не запускает импорт ещё раз
+        self.assertIsNone(process_feed_import(response.data["id"]))
+        response = self.client.get(reverse("feed-imports-detail", args=[response.data["id"]]))
+        self.assertEqual(response.data["status"], "done")
+        self.assertEqual(response.data["report"]["created"], 2)
+        self.assertEqual(response.data["report"]["error_count"], 2)
+
+    def test_upload_requires_agent(self):
+        other = User.objects.create(email="other@example.com", name="Other")
+        self.client.force_authenticate(other)
+        response = self.client.post(
+            reverse("feed-imports-list"),
+            {"agency": self.agency.pk, "file": SimpleUploadedFile("feed.txt", b"x")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"agency"})
+        self.assertFalse(FeedImport.objects.exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".csv") as feed:
+            feed.write(self.CSV_FEED.encode())
+            feed.flush()
+            output, errors = io.StringIO(), io.StringIO()
+            call_command(
+                "import_feed",
+                feed.name,
+                agency=self.agency.slug,
+                user=self.user.email,
+                stdout=output,
+                stderr=errors,
+            )
+        self.assertIn("создано: 2", output.getvalue())
+        self.assertIn("Строка 3: price", errors.getvalue())
+
+
+# Тесты признака is_favorite из кэшированных множеств избранного
+class FavoriteFlagTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.agencies = [Agency.objects.create(name=f"Агентство {i}") for i in range(3)]
+        self.ads = [self.create_ad(index) for index in range(5)]
+        FavoriteAdvertisement.objects.create(user=self.user, advertisement=self.ads[1])
+        AgencySubscription.objects.create(user=self.user, agency=self.agencies[0])
+        self.client.force_authenticate(self.user)
+
+    def create_ad(self, index):
+        return super().create_ad(
+            title=f"Объявление {index}",
+            price=1000000 + index,
+            agency=self.agencies[0],
+        )
+
+    def flags(self, url):
+        return {item["id"]: item["is_favorite"] for item in self.client.get(url).data["results"]}
+
+    def test_list_flags(self):
+        flags = self.flags(reverse("advertisements-list"))
+        self.assertEqual({pk for pk, flag in flags.items() if flag}, {self.ads[1].pk})
+        self.assertEqual(len(flags), 5)
+
+        agencies = {
+            item["id"]: item["is_favorite"]
+            for item in self.client.get(reverse("agencies-list")).data
+        }
+        self.assertEqual(
+            agencies, {agency.pk: agency == self.agencies[0] for agency in self.agencies}
+        )
+
+    def test_favorites_loaded_once_and_cached(self):
+        url = reverse("advertisements-list")
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        favorite_queries = [
+            sql for sql in app_queries(context) if "kluchik_favoriteadvertisement" in sql
+        ]
+        self.assertEqual(len(favorite_queries), 1)
+        before = len(app_queries(context))
+
+        for index in range(5, 10):
+            self.create_ad(index)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        # Множество уже в кэше, а число запросов не зависит от строк
+        self.assertEqual(len(app_queries(context)), before - 1)
+        self.assertFalse(
+            any("kluchik_favoriteadvertisement" in sql for sql in app_queries(context))
+        )
+
+    def test_add_and_remove_invalidate(self):
+        url = reverse("advertisements-list")
+        self.assertFalse(self.flags(url)[self.ads[2].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("advertisements-favorite-add"),
+                {"advertisement_id": self.ads[2].pk},
+            )
+        self.assertTrue(self.flags(url)[self.ads[2].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse("advertisements-favorite-remove"),
+                {"advertisement_id": self.ads[2].pk},
+            )
+        self.assertFalse(self.flags(url)[self.ads[2].pk])
+
+        detail = reverse("agency-detail", kwargs={"slug": self.agencies[1].slug})
+        self.assertFalse(self.client.get(detail).data["is_favorite"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("agencies-favorite-add"), {"agency_id": self.agencies[1].pk}
+            )
+        self.assertTrue(self.client.get(detail).data["is_favorite"])
+        # Подписки через m2m тоже сбрасывают множество
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.subscriptions.add(self.agencies[2])
+        detail = reverse("agency-detail", kwargs={"slug": self.agencies[2].slug})
+        self.assertTrue(self.client.get(detail).data["is_favorite"])
+
+    def test_detail_flag(self):
+        url = reverse("advertisement-detail", kwargs={"slug": self.ads[1].slug})
+        self.assertTrue(self.client.get(url).data["is_favorite"])
+        url = reverse("advertisement-detail", kwargs={"slug": self.ads[0].slug})
+        self.assertFalse(self.client.get(url).data["is_favorite"])
+
+    def test_anonymous_and_shared_documents(self):
+        # Главная страница собирается для всех пользователей одна
+        self.assertIsNone(self.client.get(reverse("home")).data["latest"][0]["is_favorite"])
+        self.client.force_authenticate(None)
+        flags = self.flags(reverse("advertisements-list"))
+        self.assertEqual(set(flags.values()), {None})
+
+
+# Тесты фоновой рассылки ad_update с объединением правок
+class AdUpdateNotificationTests(AdvertisementTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.owner = User.objects.create(email="owner@example.com", name="Owner")
+        self.users = [
+            User.objects.create(email=f"user{index}@example.com", name="User")
+            for index in range(5)
+        ]
+        self.ad = self.create_ad(user=self.owner)
+        for user in self.users:
+            FavoriteAdvertisement.objects.create(user=user, advertisement=self.ad)
+        self.url = reverse("advertisement-edit-detail", args=[self.ad.pk])
+
+    def notifications(self):
+        return Notification.objects.filter(
+            advertisement=self.ad, notification_type="ad_update"
+        )
+
+    @mock.patch("kluchik.tasks.notify_advertisement_updated.apply_async")
+    def test_edits_are_coalesced(self, apply_async):
+        self.client.force_authenticate(self.owner)
+        for price in [1100000, 1200000, 1300000]:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    self.url, {"price": price}, format="multipart"
+                )
+            self.assertEqual(response.status_code, 200)
+        # Запрос правки уведомлений не создаёт, рассылка поставлена один раз
+        self.assertFalse(self.notifications().exists())
+        apply_async.assert_called_once_with((self.ad.pk,), countdown=300)
+
+        self.assertEqual(notify_ad_update(self.ad.pk), 5)
+        self.assertEqual(
+            sorted(self.notifications().values_list("user_id", flat=True)),
+            [user.pk for user in self.users],
+        )
+        # Следующая правка ставит новую рассылку
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {"price": 1400000}, format="multipart")
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_fan_out_in_chunks(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(notify_ad_update(self.ad.pk, chunk_size=2), 5)
+        inserts = [sql for sql in app_queries(context) if sql.startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(self.notifications().count(), 5)
+
+    def test_repeated_task_within_window(self):
+        notify_ad_update(self.ad.pk)
+        FavoriteAdvertisement.objects.create(
+            user=User.objects.create(email="late@example.com", name="Late"),
+            advertisement=self.ad,
+        )
+        # Повторная доставка (или задача другого процесса) не дублирует
+        self.assertEqual(notify_ad_update(self.ad.pk), 1)
+        self.assertEqual(self.notifications().count(), 6)
+
+        self.notifications().update(
+            created_at=timezone.now() - datetime.timedelta(seconds=301)
+        )
+        self.assertEqual(notify_ad_update(self.ad.pk), 6)
+
+    def test_deleted_advertisement(self):
+        ad_id = self.ad.pk
+        self.ad.delete()
+        self.assertEqual(notify_ad_update(ad_id), 0)
+
+
+# Тесты уведомлений подписчикам агентства о новых объявлениях
+class AgencySubscriberNotificationTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create(email="owner@example.com", name="Owner")
+        self.agency = Agency.objects.create(name="Агентство")
+        self.users = [
+            User.objects.create(email=f"user{index}@example.com", name="User")
+            for index in range(5)
+        ]
+        for user in self.users + [self.owner]:
+            AgencySubscription.objects.create(user=user, agency=self.agency)
+
+    def create_ad(self, status="active", agency=None):
+        return super().create_ad(
+            title="Квартира у парка", user=self.owner, agency=agency, status=status
+        )
+
+    def notified(self, ad):
+        return sorted(
+            Notification.objects.filter(
+                advertisement=ad, notification_type="new_ad"
+            ).values_list("user_id", flat=True)
+        )
+
+    @mock.patch("kluchik.tasks.notify_about_publish.delay")
+    def test_task_queued_on_publish(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            ad = self.create_ad(status="draft", agency=self.agency)
+        delay.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ad.status = "active"
+            ad.save()
+        delay.assert_called_once_with(ad.pk)
+
+        # Правка опубликованного объявления рассылку не повторяет
+        with self.captureOnCommitCallbacks(execute=True):
+            ad.price = 900000
+            ad.save()
+        self.assertEqual(delay.call_count, 1)
+
+    def test_fan_out_in_chunks(self):
+        ad = self.create_ad(agency=self.agency)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(notify_agency_subscribers(ad.pk, chunk_size=2), 5)
+        inserts = [sql for sql in app_queries(context) if sql.startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+        # Автор объявления не уведомляется
+        self.assertEqual(self.notified(ad), [user.pk for user in self.users])
+        notification = Notification.objects.filter(advertisement=ad).first()
+        self.assertEqual(
+            notification.message, "Новое объявление агентства «Агентство»: Квартира у парка"
+        )
+
+    def test_already_notified_are_skipped(self):
+        ad = self.create_ad(agency=self.agency)
+        Notification.objects.create(
+            user=self.users[0],
+            advertisement=ad,
+            notification_type="new_ad",
+            status="sent",
+            message="Новое объявление по сохранённому поиску",
+        )
+        self.assertEqual(notify_agency_subscribers(ad.pk, chunk_size=2), 4)
+        self.assertEqual(notify_agency_subscribers(ad.pk), 0)
+        self.assertEqual(self.notified(ad), [user.pk for user in self.users])
+
+    def test_saved_search_and_subscription_notify_once(self):
+        reset_matcher()
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post(
+            reverse("saved-searches-list"), {"query": {"city": "Москва"}}, format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        with mock.patch("kluchik.tasks.notify_about_publish.delay"):
+            ad = self.create_ad(agency=self.agency)
+        self.assertEqual(notify_about_publish(ad.pk), 5)
+        self.assertEqual(self.notified(ad), [user.pk for user in self.users])
+
+    def test_unpublished_or_without_agency(self):
+        self.assertEqual(notify_agency_subscribers(self.create_ad().pk), 0)
+        draft = self.create_ad(status="draft", agency=self.agency)
+        self.assertEqual(notify_agency_subscribers(draft.pk), 0)
+        self.assertFalse(Notification.objects.exists())
+
+
+# Тесты счётчика непрочитанных и массовой смены статуса уведомлений
+class UnreadNotificationTests(AdvertisementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create(email="other@example.com", name="Other")
+        self.agency = Agency.objects.create(name="Агентство")
+        self.ad = self.create_ad(user=self.other, agency=self.agency)
+        self.notifications = [self.notify(self.user) for _ in range(4)]
+        self.notify(self.other)
+        self.client.force_authenticate(self.user)
+
+    def notify(self, user, status="sent"):
+        return Notification.objects.create(
+            user=user,
+            advertisement=self.ad,
+            notification_type="ad_update",
+            status=status,
+            message="Объявление было обновлено.",
+        )
+
+    def unread(self, user=None):
+        user = user or self.user
+        user.refresh_from_db()
+        return user.unread_notification_count
+
+    def bulk_status(self, data):
+        return self.client.post(
+            reverse("notifications-bulk-status"), data, format="json"
+        )
+
+    def test_unread_count_endpoint(self):
+        # Аутентификация загружает пользователя из базы на каждый запрос
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("notifications-unread-count"))
+        self.assertEqual(response.data, {"unread_count": 4})
+        self.assertFalse(
+            any("kluchik_notification" in sql for sql in app_queries(context))
+        )
+
+    def test_single_status_change(self):
+        url = reverse("notification-status-update", args=[self.notifications[0].pk])
+        self.client.patch(url, {"status": "read"}, format="json")
+        self.assertEqual(self.unread(), 3)
+        self.client.patch(url, {"status": "sent"}, format="json")
+        self.assertEqual(self.unread(), 4)
+        self.notifications[1].status = "archived"
+        self.notifications[1].save()
+        self.assertEqual(self.unread(), 3)
+
+    def test_bulk_by_ids(self):
+        ids = [self.notifications[0].pk, self.notifications[1].pk]
+        other_id = Notification.objects.get(user=self.other).pk
+        with CaptureQueriesContext(connection) as context:
+            response = self.bulk_status({"status": "read", "ids": ids + [other_id]})
+        self.assertEqual(response.data, {"updated": 2, "unread_count": 2})
+        updates = [
+            sql
+            for sql in app_queries(context)
+            if sql.startswith('UPDATE "kluchik_notification"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.unread(self.other), 1)
+        self.assertEqual(Notification.objects.get(pk=other_id).status, "sent")
+
+        # «Прочитано» не возвращает уведомления из архива
+        response = self.bulk_status({"status": "archived", "ids": ids[:1]})
+        self.assertEqual(response.data["updated"], 1)
+        response = self.bulk_status({"status": "read", "ids": ids})
+        self.assertEqual(response.data, {"updated": 0, "unread_count": 2})
+        self.assertEqual(Notification.objects.get(pk=ids[0]).status, "archived")
+
+    def test_bulk_all(self):
+        response = self.bulk_status({"status": "archived", "all": True})
+        self.assertEqual(response.data, {"updated": 4, "unread_count": 0})
+        self.assertEqual(self.client.get(reverse("notifications-list")).data, [])
+        self.assertEqual(self.unread(self.other), 1)
+
+    def test_bulk_validation(self):
+        self.assertEqual(self.bulk_status({"status": "read"}).status_code, 400)
+        self.assertEqual(
+            self.bulk_status({"status": "read", "all": True, "ids": [1]}).status_code, 400
+        )
+        self.assertEqual(self.bulk_status({"status": "sent", "all": True}).status_code, 400)
+        self.assertEqual(self.unread(), 4)
+
+    def test_fan_out_and_cascade(self):
+        subscriber = User.objects.create(email="sub@example.com", name="Sub")
+        AgencySubscription.objects.create(user=subscriber, agency=self.agency)
+        notify_agency_subscribers(self.ad.pk)
+        self.assertEqual(self.unread(subscriber), 1)
+
+        self.ad.delete()
+        self.assertEqual(
+            (self.unread(), self.unread(self.other), self.unread(subscriber)), (0, 0, 0)
+        )
+
+    def test_delete_decrements_counter(self):
+        self.notifications[0].delete()
+        self.assertEqual(self.unread(), 3)
+        read = self.notify(self.user, status="read")
+        read.delete()
+        self.assertEqual(self.unread(), 3)
+        ids = [self.notifications[1].pk, self.notifications[2].pk]
+        Notification.objects.filter(pk__in=ids).delete()
+        self.assertEqual((self.unread(), self.unread(self.other)), (1, 1))
+
+    def test_profile_save_keeps_counter(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.notify(self.user)
+        user.name = "Новое имя"
+        user.save()
+        self.assertEqual(self.unread(), 5)
+
+    def test_rebuild_command(self):
+        User.objects.filter(pk=self.user.pk).update(unread_notification_count=10)
+        output = io.StringIO()
+        call_command("rebuild_unread_counts", stdout=output)
+        self.assertIn("Исправлено пользователей: 1", output.getvalue())
+        self.assertEqual(self.unread(), 4)
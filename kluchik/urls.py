@@ -35,6 +35,8 @@ router.register(
     basename="notifications-archived",
 )
 router.register("reviews", ReviewViewSet, basename="reviews")
+router.register("saved-searches", SavedSearchViewSet, basename="saved-searches")
+router.register("feed-imports", FeedImportViewSet, basename="feed-imports")
 router.register("types-of-advertisement", TypesOfAdvertisementViewSet)
 router.register("categories-of-advertisement", CategoriesOfAdvertisementViewSet)
 router.register(
@@ -2,39 +2,196 @@ from django.utils import timezone
 from rest_framework.viewsets import ModelViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated, SAFE_METHODS
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.filters import SearchFilter
-from django.db.models import Case, When, IntegerField
+from django.db.models import Case, DateTimeField, When, IntegerField
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import DjangoFilterBackend
-from .filters import AdvertisementFilter
+from .filters import AdvertisementFilter, AdvertisementFullTextSearchFilter
+from .pagination import AdvertisementCursorPagination
+from .facets import FacetFilterError, compute_facets
+from .caching import cached_document, catalog_cache_key, get_catalog_version
+from .export import CONTENT_TYPES, export_lines, export_rows
+from . import favorites, geo, suggest, tasks
+from django.conf import settings
+from django.db import transaction
+from django.core.cache import cache
 from rest_framework.decorators import action
 from rest_framework import status
 from datetime import timedelta
 from silk.profiling.profiler import silk_profile
 from rest_framework.exceptions import PermissionDenied
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import (
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBase
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from kluchik.serializers import CustomTokenObtainPairSerializer
 from typing import Any, Dict, List
 from django.db.models import QuerySet
 from urllib.parse import urlencode
+import hashlib
 from decouple import config
 from .serializers import *
 from .models import *
 
 FRONTEND_URL = config("FRONTEND_URL")
 
+
+# Примесь для списков объявлений, читающих денормализованные карточки
+class AdvertisementCardMixin:
+    """
+    Queryset представления выбирает объявления (фильтры, сортировка,
+    пагинация работают по таблице объявлений), а сериализатор получает
+    присоединённые по первичному ключу карточки.
+    """
+
+    # Поля объявления, которые нужны сериализатору помимо карточки
+    advertisement_fields: tuple = ()
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        """
+        Из таблицы объявлений читаются только id и поля сортировки
+        (их использует keyset-пагинация), остальное берётся из карточки.
+        """
+        queryset = super().filter_queryset(queryset)
+        # Изменение объявления работает с полной строкой и обычным сериализатором
+        if queryset.query.is_sliced or self.request.method not in SAFE_METHODS:
+            return queryset
+        local_fields = {field.name for field in Advertisement._meta.concrete_fields}
+        ordering = queryset.query.order_by or Advertisement._meta.ordering
+        fields = {
+            name.lstrip("-")
+            for name in ordering
+            if isinstance(name, str) and name.lstrip("-") in local_fields
+        }
+        fields.update(self.advertisement_fields)
+        return queryset.select_related("card").only("id", "card", *sorted(fields))
+
+    def get_serializer(self, *args: Any, **kwargs: Any) -> Any:
+        if args and self.request.method in SAFE_METHODS:
+            instance, *rest = args
+            if kwargs.get("many"):
+                instance = AdvertisementCard.for_advertisements(instance)
+            else:
+                instance = AdvertisementCard.for_advertisements([instance])[0]
+            args = (instance, *rest)
+        return super().get_serializer(*args, **kwargs)
+
+# Примесь для представлений с сериализаторами SparseFieldsetMixin
+class SparseFieldsetViewMixin:
+    """
+    Для безопасных запросов сужает queryset под ?fields= и ?expand=:
+    в запрос попадают только нужные столбцы и связи.
+    """
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if self.request.method in SAFE_METHODS and hasattr(
+            serializer_class, "optimize_queryset"
+        ):
+            queryset = serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
+
+
+# Примесь для условных GET-запросов к детальной странице
+class ConditionalRetrieveMixin:
+    """
+    Отвечает 304 Not Modified на If-None-Match / If-Modified-Since,
+    проверяя одну строку (pk, updated_at) по индексированному slug —
+    без основного запроса, prefetch и сериализации.
+
+    ETag зависит от пользователя, так как ответ содержит is_favorite,
+    от параметров запроса и от формата ответа (JSON / MessagePack).
+    """
+
+    # Даты изменения связанных данных, которые тоже входят в ответ
+    # и меняются без изменения updated_at самого объекта
+    related_version_fields: List[str] = []
+
+    # Виды избранного (favorites.SOURCES), по которым в ответе есть
+    # признаки is_favorite вложенных объектов: версия множества
+    # пользователя входит в ETag
+    favorite_kinds: List[str] = []
+
+    def get_conditional_queryset(self) -> QuerySet:
+        """Лёгкий queryset для проверки версии объекта (без аннотаций)"""
+        return self.get_queryset().model.objects.all()
+
+    def get_object_version(self) -> Any:
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        version = (
+            self.get_conditional_queryset()
+            .filter(**lookup)
+            .order_by()
+            .values("pk", "updated_at", *self.related_version_fields)
+            .first()
+        )
+        if version is not None:
+            version["updated_at"] = max(
+                version[name]
+                for name in ["updated_at", *self.related_version_fields]
+                if version[name] is not None
+            )
+        return version
+
+    def get_etag(self, version: Dict[str, Any]) -> str:
+        user = self.request.user
+        user_id = user.pk if user and user.is_authenticated else 0
+        query = sorted(self.request.query_params.items())
+        query_hash = hashlib.sha1(urlencode(query).encode("utf-8")).hexdigest()[:8]
+        stamp = int(version["updated_at"].timestamp() * 1_000_000)
+        # JSON и MessagePack — разные представления с разными ETag
+        renderer = getattr(self.request, "accepted_renderer", None)
+        fmt = getattr(renderer, "format", "json")
+        etag = f"{version['pk']}-{stamp}-{user_id}-{query_hash}-{fmt}"
+        if user_id and self.favorite_kinds:
+            versions = ".".join(
+                str(favorites.version(kind, user_id)) for kind in self.favorite_kinds
+            )
+            etag = f"{etag}-f{versions}"
+        return quote_etag(etag)
+
+    def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        version = self.get_object_version()
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)  # отдаст 404
+
+        etag = self.get_etag(version)
+        last_modified = int(version["updated_at"].timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ("Accept", "Authorization"))
+        return response
+
+
 # Представление для управления объектами недвижимости
-class AdvertisementListViewSet(ReadOnlyModelViewSet):
+class AdvertisementListViewSet(AdvertisementCardMixin, ReadOnlyModelViewSet):
     """
     Представление только для чтения списка активных объектов недвижимости.
     Позволяет выполнять фильтрацию и поиск по объявлениям.
+    Лента отдаётся постранично с keyset-курсором.
     """
 
     serializer_class = AdvertisementListSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    pagination_class = AdvertisementCursorPagination
+    filter_backends = [DjangoFilterBackend, AdvertisementFullTextSearchFilter]
     filterset_class = AdvertisementFilter
     search_fields = ["title", "description"]
 
@@ -43,23 +200,144 @@ class AdvertisementListViewSet(ReadOnlyModelViewSet):
         Возвращает queryset активных объявлений с предварительной выборкой
         связанных объектов для оптимизации запросов.
         """
-        return (
-            Advertisement.objects.filter(status="active")
-            .select_related("location", "category", "property_type")
-            .prefetch_related("photos")
+        return Advertisement.objects.filter(status="active").select_related("card")
+
+    # Время жизни кэша фасетов (секунды)
+    facets_cache_timeout = 60
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request: Request) -> Response:
+        """
+        Счётчики для панели фильтров: категории, типы, города и ценовые
+        диапазоны с учётом тех же параметров, что и у ленты.
+        """
+        allowed = [*AdvertisementFilter.base_filters, "search"]
+        cache_key = catalog_cache_key("advertisements:facets", request.query_params, allowed)
+        data = cache.get(cache_key)
+        if data is None:
+            queryset = AdvertisementFullTextSearchFilter().filter_queryset(
+                request, Advertisement.objects.filter(status="active"), self
+            )
+            try:
+                data = compute_facets(queryset, request.query_params)
+            except FacetFilterError as error:
+                return Response(error.errors, status=status.HTTP_400_BAD_REQUEST)
+            cache.set(cache_key, data, self.facets_cache_timeout)
+        return Response(data)
+
+    # Время жизни кэша кластеров карты (секунды)
+    map_cache_timeout = 60
+
+    @action(detail=False, methods=["get"], url_path="map")
+    def map_clusters(self, request: Request) -> Response:
+        """
+        Кластеры объявлений в области карты (bbox) для масштаба zoom:
+        количество, центр и диапазон цен в каждой ячейке geohash.
+        Учитываются те же фильтры, что и у ленты.
+        """
+        if not request.query_params.get("bbox"):
+            return Response(
+                {"bbox": ["Обязательный параметр."]}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            zoom = int(request.query_params.get("zoom", 10))
+        except ValueError:
+            zoom = -1
+        if not 0 <= zoom <= geo.MAX_ZOOM:
+            return Response(
+                {"zoom": [f"Ожидается целое число от 0 до {geo.MAX_ZOOM}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        allowed = [*AdvertisementFilter.base_filters, "search", "zoom"]
+        cache_key = catalog_cache_key("advertisements:map", request.query_params, allowed)
+        data = cache.get(cache_key)
+        if data is None:
+            filterset = AdvertisementFilter(
+                request.query_params,
+                queryset=Advertisement.objects.filter(status="active"),
+            )
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+            queryset = AdvertisementFullTextSearchFilter().filter_queryset(
+                request, filterset.qs, self
+            )
+            data = geo.compute_clusters(queryset, zoom)
+            cache.set(cache_key, data, self.map_cache_timeout)
+        return Response(data)
+
+    # Время жизни кэша ответов ленты для анонимных пользователей (секунды)
+    list_cache_timeout = 300
+
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Анонимные запросы обслуживаются из кэша. Ключ — путь (у вложенных
+        списков, например объявлений агентства, он свой), нормализованная
+        строка запроса и версия каталога, поэтому при попадании не
+        выполняются ни фильтры, ни сериализация.
+        """
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        cache_key = catalog_cache_key(
+            f"advertisements:list:{request.get_host()}{request.path}",
+            request.query_params,
         )
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, self.list_cache_timeout)
+        return response
+
     def get_renderer_context(self):
         context = super().get_renderer_context()
-        queryset = self.filter_queryset(self.get_queryset())
-        filterset = self.filterset_class(self.request.GET, queryset=queryset)
+        # Форма фильтров нужна только Browsable API
+        renderer = getattr(self.request, "accepted_renderer", None)
+        if self.action != "list" or getattr(renderer, "format", None) != "api":
+            return context
+        filterset = self.filterset_class(self.request.GET, queryset=self.get_queryset())
         context["filter"] = filterset
         context["form"] = filterset.form
-        print("Filter form fields:", list(filterset.form.fields.keys()))
         return context
 
 
+# Виджеты главной страницы: отдельные представления и /api/home/
+# используют одни и те же выборки
+HOME_WIDGET_SIZE = 3
+
+
+def latest_advertisements() -> QuerySet:
+    """Последние активные объявления (по дате публикации)"""
+    return (
+        Advertisement.objects.filter(status="active")
+        .select_related("card")
+        .order_by("-date_posted")[:HOME_WIDGET_SIZE]
+    )
+
+
+def popular_advertisements() -> QuerySet:
+    """Активные объявления с наибольшим числом добавлений в избранное"""
+    return (
+        Advertisement.objects.filter(status="active")  # только активные объявления
+        .select_related("card")
+        .only("id", "card", "favorite_count", "date_posted")
+        .order_by(
+            "-favorite_count",  # хранимый счётчик, индекс adv_status_fav_date_idx
+            "-date_posted",  # сортируем по количеству избранных и дате
+        )[:HOME_WIDGET_SIZE]
+    )
+
+
+def popular_agencies() -> QuerySet:
+    """Агентства с наибольшим числом подписчиков (хранимые счётчики)"""
+    return Agency.objects.order_by("-subscriber_count")[:HOME_WIDGET_SIZE]
+
+
 # Представление для получения последних 3 объявлений
-class LatestAdvertisementsViewSet(ReadOnlyModelViewSet):
+class LatestAdvertisementsViewSet(AdvertisementCardMixin, ReadOnlyModelViewSet):
     """
     Представление для получения последних 3 активных объявлений.
     """
@@ -70,9 +348,7 @@ class LatestAdvertisementsViewSet(ReadOnlyModelViewSet):
         """
         Возвращает последние 3 активных объявления, отсортированных по дате публикации.
         """
-        return Advertisement.objects.filter(status="active").order_by("-date_posted")[
-            :3
-        ]
+        return latest_advertisements()
 
 
 # Представление для получения 3 самых популярных агентств
@@ -87,11 +363,11 @@ class PopularAgenciesViewSet(ReadOnlyModelViewSet):
         """
         Возвращает 3 агентства с наибольшим количеством подписчиков.
         """
-        return Agency.with_count().order_by("-subscriber_count")[:3]
+        return popular_agencies()
 
 
 # Представление для получения 3 самых популярных объявления
-class PopularAdvertisementViewSet(ReadOnlyModelViewSet):
+class PopularAdvertisementViewSet(AdvertisementCardMixin, ReadOnlyModelViewSet):
     """
     Представление для получения 3 самых популярных объявлений по количеству добавлений в избранное.
     """
@@ -103,38 +379,99 @@ class PopularAdvertisementViewSet(ReadOnlyModelViewSet):
         Возвращает 3 самых популярных активных объявления,
         отсортированных по количеству добавлений в избранное и дате публикации.
         """
-        return (
-            Advertisement.objects.filter(status="active")  # только активные объявления
-            .annotate(
-                favorite_count=Count(
-                    "favoriteadvertisement"
-                )  # считаем количество избранных
-            )
-            .order_by(
-                "-favorite_count",
-                "-date_posted",  # сортируем по количеству избранных и дате
-            )[:3]
+        return popular_advertisements()
+
+
+# Главная страница одним запросом
+class HomeView(APIView):
+    """
+    Все виджеты главной страницы (последние и популярные объявления,
+    популярные агентства) и итоги каталога одним ответом. Документ
+    собирается фиксированным числом запросов и хранится в кэше целиком:
+    изменения каталога делают его устаревшим сразу, избранное и подписки —
+    через home_cache_timeout секунд.
+    """
+
+    permission_classes = []
+    home_cache_timeout = 60
+
+    def get(self, request: Request) -> Response:
+        document = cached_document(
+            f"home:{request.get_host()}",
+            lambda: self.build_document(request),
+            self.home_cache_timeout,
+            version=get_catalog_version(),
+        )
+        return Response(document)
+
+    @staticmethod
+    def build_document(request: Request) -> Dict[str, Any]:
+        # Без признаков избранного: документ один на всех пользователей
+        context = {"request": request, "shared": True}
+        totals = Advertisement.objects.filter(status="active").aggregate(
+            advertisements=Count("id"),
+            cities=Count("location__city", distinct=True),
         )
+        totals["agencies"] = Agency.objects.count()
+        return {
+            "latest": AdvertisementListSerializer(
+                AdvertisementCard.for_advertisements(latest_advertisements()),
+                many=True,
+                context=context,
+            ).data,
+            "popular": PopularAdvertisementSerializer(
+                AdvertisementCard.for_advertisements(popular_advertisements()),
+                many=True,
+                context=context,
+            ).data,
+            "popular_agencies": PopularAgencySerializer(
+                popular_agencies(), many=True, context=context
+            ).data,
+            "totals": totals,
+        }
 
 
 # Представление для получения детальной информации об объявлении
-class AdvertisementDetailViewSet(ReadOnlyModelViewSet):
+class AdvertisementDetailViewSet(
+    ConditionalRetrieveMixin, SparseFieldsetViewMixin, ReadOnlyModelViewSet
+):
     """
     Представление для получения детальной информации об активном объявлении по slug.
+    Поддерживает условные запросы (ETag / Last-Modified) и выборочные поля
+    (?fields=, ?expand=).
     """
 
     serializer_class = AdvertisementDetailSerializer
     lookup_field = "slug"
+    # Блок похожих объявлений пересчитывается фоновой задачей, а карточки
+    # в нём меняются вместе с самими похожими объявлениями
+    related_version_fields = ["similar_listings__computed_at", "similar_updated_at"]
+    # is_favorite у похожих объявлений
+    favorite_kinds = ["advertisements"]
 
     def get_queryset(self) -> QuerySet:
         """
-        Возвращает queryset активных объявлений с предварительной выборкой
-        связанных объектов для повышения производительности.
+        Возвращает queryset активных объявлений. Связанные объекты
+        подключает SparseFieldsetViewMixin — только нужные запрошенным полям.
         """
-        return (
-            Advertisement.objects.filter(status="active")
-            .select_related("location", "category", "property_type", "user")
-            .prefetch_related("photos")
+        return Advertisement.objects.filter(status="active")
+
+    def get_conditional_queryset(self) -> QuerySet:
+        """
+        Проверка версии только среди активных объявлений. Последнее
+        изменение похожих объявлений читается тем же запросом.
+        """
+        similar_table = SimilarAdvertisements._meta.db_table
+        return Advertisement.objects.filter(status="active").annotate(
+            similar_updated_at=RawSQL(
+                f"SELECT MAX(similar.updated_at) FROM {similar_table} listing "
+                f"JOIN json_each(listing.similar_ids) item "
+                f'JOIN "{Advertisement._meta.db_table}" similar '
+                f"ON similar.id = item.value "
+                f'WHERE listing.advertisement_id = "{Advertisement._meta.db_table}"."id"',
+                [],
+                output_field=DateTimeField(),
+            )
         )
 
     def get_serializer_context(self) -> Dict[str, Any]:
@@ -147,9 +484,11 @@ class AdvertisementDetailViewSet(ReadOnlyModelViewSet):
 
 
 # Представление для получения избранных объявлений пользователя
-class FavoriteAdvertisementsListView(ModelViewSet):
+class FavoriteAdvertisementsListView(AdvertisementCardMixin, ReadOnlyModelViewSet):
     """
     Представление для управления избранными объявлениями пользователя.
+    Список только для чтения: избранное меняется действиями add и remove,
+    сами объявления здесь не создаются, не изменяются и не удаляются.
     """
 
     serializer_class = AdvertisementListSerializer
@@ -161,8 +500,10 @@ class FavoriteAdvertisementsListView(ModelViewSet):
         """
         user = self.request.user
         # Получаем избранные объявления пользователя через связь FavoriteAdvertisement
-        return Advertisement.objects.filter(favoriteadvertisement__user=user).order_by(
-            "-favoriteadvertisement__created_at"
+        return (
+            Advertisement.objects.filter(favoriteadvertisement__user=user)
+            .select_related("card")
+            .order_by("-favoriteadvertisement__created_at")
         )
 
     @action(detail=False, methods=["post"])
@@ -207,7 +548,7 @@ class FavoriteAdvertisementsListView(ModelViewSet):
 
 
 # Представление для получения объявлений пользователя
-class MyAdvertisementListView(ModelViewSet):
+class MyAdvertisementListView(AdvertisementCardMixin, ModelViewSet):
     """
     Представление для получения объявлений текущего пользователя.
     """
@@ -215,6 +556,14 @@ class MyAdvertisementListView(ModelViewSet):
     serializer_class = MyAdvertisementListSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_serializer_class(self) -> Any:
+        """
+        Чтение — карточки, изменение — сериализатор модели объявления.
+        """
+        if self.request.method in SAFE_METHODS:
+            return MyAdvertisementListSerializer
+        return MyAdvertisementUpdateSerializer
+
     def get_queryset(self) -> QuerySet:
         """
         Возвращает queryset объявлений, принадлежащих текущему пользователю,
@@ -222,6 +571,7 @@ class MyAdvertisementListView(ModelViewSet):
         """
         return (
             Advertisement.objects.filter(user=self.request.user)
+            .select_related("card")
             .annotate(
                 status_order=Case(
                     When(status="draft", then=0),
@@ -253,9 +603,49 @@ class UserNotificationListView(ReadOnlyModelViewSet):
         return (
             Notification.objects.filter(user=self.request.user)
             .exclude(status="archived")
+            .select_related("advertisement")
             .order_by("-created_at")
         )
 
+    @action(detail=False, methods=["get"], url_path="unread-count")
+    def unread_count(self, request: Request) -> Response:
+        """
+        Число непрочитанных уведомлений для значка: хранимый счётчик
+        пользователя, без запроса к уведомлениям.
+        """
+        return Response({"unread_count": request.user.unread_notification_count})
+
+    @action(detail=False, methods=["post"], url_path="bulk-status")
+    def bulk_status(self, request: Request) -> Response:
+        """
+        Отмечает уведомления (ids или all) прочитанными или архивными
+        одним UPDATE. «Прочитано» меняет только непрочитанные уведомления,
+        поэтому архив не возвращается в список. Счётчик непрочитанных
+        пересчитывается в той же транзакции.
+        """
+        serializer = NotificationBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = serializer.validated_data["status"]
+
+        queryset = Notification.objects.filter(user=request.user)
+        if "ids" in serializer.validated_data:
+            queryset = queryset.filter(pk__in=serializer.validated_data["ids"])
+        if new_status == "read":
+            queryset = queryset.filter(status="sent")
+        else:
+            queryset = queryset.exclude(status="archived")
+
+        with transaction.atomic():
+            updated = queryset.update(status=new_status)
+            if updated:
+                User.rebuild_unread_counts([request.user.pk])
+        unread_count = (
+            User.objects.filter(pk=request.user.pk)
+            .values_list("unread_notification_count", flat=True)
+            .get()
+        )
+        return Response({"updated": updated, "unread_count": unread_count})
+
 
 # Представление для получения архивированных уведомлений пользователя
 class ArchivedNotificationListView(ReadOnlyModelViewSet):
@@ -270,9 +660,11 @@ class ArchivedNotificationListView(ReadOnlyModelViewSet):
         """
         Возвращает queryset архивированных уведомлений пользователя.
         """
-        return Notification.objects.filter(
-            user=self.request.user, status="archived"
-        ).order_by("-created_at")
+        return (
+            Notification.objects.filter(user=self.request.user, status="archived")
+            .select_related("advertisement")
+            .order_by("-created_at")
+        )
 
 
 # Представление для обновления статуса уведомления
@@ -309,12 +701,63 @@ class NotificationStatusUpdateView(ModelViewSet):
             )
 
         notification.status = new_status
-        notification.save()
+        # Счётчик непрочитанных меняет сигнал в той же транзакции
+        notification.save(update_fields=["status"])
 
         serializer = self.get_serializer(notification)
         return Response(serializer.data)
 
 
+# Представление для сохранённых поисков пользователя
+class SavedSearchViewSet(ModelViewSet):
+    """
+    Сохранённые поиски текущего пользователя. По ним приходят уведомления
+    о новых подходящих объявлениях.
+    """
+
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Возвращает поиски текущего пользователя.
+        """
+        return SavedSearch.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer: Any) -> None:
+        """
+        При создании поиска автоматически назначает пользователя.
+        """
+        serializer.save(user=self.request.user)
+
+
+# Представление для загрузки фидов объявлений агентства
+class FeedImportViewSet(ModelViewSet):
+    """
+    Агент загружает фид агентства (CSV / JSON / XML), файл обрабатывает
+    фоновая задача. Статус и отчёт по строкам — в GET.
+    """
+
+    serializer_class = FeedImportSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ["get", "post", "head", "options"]
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Возвращает загрузки текущего пользователя.
+        """
+        return FeedImport.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer: Any) -> None:
+        """
+        Сохраняет файл и ставит импорт в очередь после коммита.
+        """
+        feed_import = serializer.save(user=self.request.user)
+        transaction.on_commit(
+            lambda: tasks.import_advertisement_feed.delay(feed_import.pk)
+        )
+
+
 # Представление для управления отзывами к объявлениям
 class ReviewViewSet(ModelViewSet):
     """
@@ -371,28 +814,24 @@ class ReviewViewSet(ModelViewSet):
 
 
 # Представление для получения детальной информации об агентстве
-class AgencyDetailViewSet(ReadOnlyModelViewSet):
+class AgencyDetailViewSet(ConditionalRetrieveMixin, ReadOnlyModelViewSet):
     """
     Представление для получения детальной информации об агентстве.
+    Поддерживает условные запросы (ETag / Last-Modified).
     """
 
     serializer_class = AgencyDetailSerializer
     lookup_field = "slug"
+    # is_favorite агентства и объявлений первой страницы
+    favorite_kinds = ["agencies", "advertisements"]
 
     def get_queryset(self) -> QuerySet:
         """
-        Возвращает queryset агентств с аннотациями и предварительной загрузкой связанных объектов.
-        """
-        return Agency.objects.annotate(
-            subscriber_count=Count("subscribers", distinct=True),
-            annotated_agent_count=Count("agents", distinct=True),
-        ).prefetch_related(
-            "agents__user",
-            "advertisements__location",
-            "advertisements__category",
-            "advertisements__property_type",
-            "advertisements__photos",
-        )
+        Возвращает queryset агентств с предварительной загрузкой агентов.
+        Счётчики хранятся в строке агентства, объявления сериализатор
+        выбирает одной страницей.
+        """
+        return Agency.objects.prefetch_related("agents__user")
 
     def get_serializer_context(self) -> Dict[str, Any]:
         """
@@ -403,6 +842,24 @@ class AgencyDetailViewSet(ReadOnlyModelViewSet):
         return context
 
 
+# Представление для объявлений агентства
+class AgencyAdvertisementsViewSet(AdvertisementListViewSet):
+    """
+    Активные объявления агентства (/api/agencies/<slug>/advertisements/):
+    тот же keyset-курсор, фильтры и сортировки, что и у ленты.
+    """
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Возвращает queryset активных объявлений агентства; 404, если
+        агентства нет.
+        """
+        agency = get_object_or_404(Agency.objects.only("pk"), slug=self.kwargs["slug"])
+        return Advertisement.objects.filter(
+            agency=agency, status="active"
+        ).select_related("card")
+
+
 # Представление для получения списка агентств
 class AgencyListViewSet(ReadOnlyModelViewSet):
     """
@@ -413,11 +870,8 @@ class AgencyListViewSet(ReadOnlyModelViewSet):
     filter_backends = [SearchFilter]
     search_fields = ["name"]
 
-    queryset = Agency.objects.annotate(
-        subscriber_count=Count("subscribers", distinct=True),
-        annotated_agent_count=Count("agents", distinct=True),
-        # active_ads_count мы считаем через метод get_active_ads_count в сериализаторе
-    ).order_by("name")
+    # Счётчики — столбцы агентства, без агрегации по строкам
+    queryset = Agency.objects.order_by("name")
 
 
 # Представление для получения избранных агентств пользователя
@@ -431,14 +885,11 @@ class FavoriteAgenciesListView(ModelViewSet):
 
     def get_queryset(self) -> QuerySet:
         """
-        Возвращает queryset избранных агентств текущего пользователя с аннотациями.
+        Возвращает queryset избранных агентств текущего пользователя.
         """
         user = self.request.user
         # Получаем избранные агентства пользователя через связь AgencySubscription
-        return Agency.objects.filter(subscribers=user).annotate(
-            subscriber_count=Count("subscribers", distinct=True),
-            annotated_agent_count=Count("agents", distinct=True),
-        )
+        return Agency.objects.filter(subscribers=user)
 
     @action(detail=False, methods=["post"])
     def add(self, request: Any) -> Response:
@@ -572,6 +1023,81 @@ def social_jwt_redirect(request):
     return HttpResponseRedirect(frontend_url)
 
 
+# Доступ к выгрузке: сотрудники и партнёры из группы EXPORT_PARTNER_GROUP
+class IsExportPartner(BasePermission):
+    """
+    Партнёры — обычные (не staff) пользователи в группе
+    settings.EXPORT_PARTNER_GROUP; группа назначается в админке.
+    """
+
+    def has_permission(self, request: Request, view: APIView) -> bool:
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        return user.is_staff or user.groups.filter(
+            name=settings.EXPORT_PARTNER_GROUP
+        ).exists()
+
+
+# Потоковая выгрузка активного каталога для партнёров (NDJSON / CSV)
+class AdvertisementExportView(APIView):
+    """
+    Отдаёт все активные объявления по возрастанию id потоком: строки
+    формируются по мере чтения из базы, память не зависит от размера
+    каталога. ?after=<id> продолжает прерванную выгрузку.
+    Доступна партнёрам и сотрудникам (IsExportPartner); число выгрузок
+    ограничено (EXPORT_THROTTLE_RATE), так как каждая читает весь каталог.
+    """
+
+    permission_classes = [IsExportPartner]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "export"
+
+    def get(self, request: Request, export_format: str) -> HttpResponseBase:
+        after = request.query_params.get("after")
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                return Response(
+                    {"after": ["Ожидается id объявления."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        rows = export_rows(after=after, build_url=request.build_absolute_uri)
+        response = StreamingHttpResponse(
+            export_lines(export_format, rows), content_type=CONTENT_TYPES[export_format]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="advertisements.{export_format}"'
+        )
+        return response
+
+
+# Подсказки для строки поиска (города, районы, улицы, слова заголовков)
+class SuggestView(APIView):
+    """
+    ?q=<начало слова> — подсказки из префиксного индекса в памяти процесса,
+    без запроса к базе, пока каталог не менялся. Кириллица и латиница
+    (транслит) дают одинаковый результат. ?limit= — до 20 подсказок.
+    """
+
+    permission_classes = []
+
+    def get(self, request: Request) -> Response:
+        query = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", suggest.DEFAULT_LIMIT))
+        except ValueError:
+            return Response(
+                {"limit": ["Ожидается целое число."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), suggest.MAX_LIMIT)
+        results = suggest.get_index().suggest(query, limit) if query.strip() else []
+        return Response({"query": query, "results": results})
+
+
 #! DJANGO 1-4
 # Представление категорий недвижимости
 class PropertyTypeViewSet(ModelViewSet):
@@ -587,7 +1113,7 @@ class CustomTokenObtainPairViewSet(TokenObtainPairView):
 
 
 # Представление только для активных объявлений
-class AdvertisementViewSetActive(ModelViewSet):
+class AdvertisementViewSetActive(SparseFieldsetViewMixin, ModelViewSet):
     serializer_class = AdvertisementSerializer
     queryset = (
         Advertisement.objects.filter(status="active")
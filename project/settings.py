@@ -73,6 +73,18 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
+    # JSON кодируется через orjson; мобильные клиенты могут запросить
+    # MessagePack заголовком Accept: application/msgpack
+    "DEFAULT_RENDERER_CLASSES": [
+        "kluchik.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "kluchik.renderers.MessagePackRenderer",
+    ],
+    # Выгрузка каталога читает все объявления: не чаще EXPORT_THROTTLE_RATE
+    # на партнёра
+    "DEFAULT_THROTTLE_RATES": {
+        "export": config("EXPORT_THROTTLE_RATE", default="30/hour"),
+    },
     # При необходимости можно включить авторизацию по умолчанию:
     # "DEFAULT_PERMISSION_CLASSES": [
     #     "rest_framework.permissions.IsAuthenticated",
@@ -184,6 +196,28 @@ DATABASES = {
 }
 
 
+# === Кэш ===
+
+# На продакшене указывайте CACHE_URL (например, redis://localhost:6379/1),
+# чтобы кэш и версии каталога были общими для всех воркеров gunicorn.
+CACHE_URL = config("CACHE_URL", default="")
+
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "kluchik",
+        }
+    }
+
+
 # === Валидаторы паролей ===
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -248,6 +282,31 @@ CELERY_BROKER_URL = config("REDIS_URL")  # или другой URL Redis
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 
+# Периодические задачи: beat берёт их отсюда (DatabaseScheduler
+# django_celery_beat тоже заносит их в базу при запуске)
+CELERY_BEAT_SCHEDULE = {
+    # Блок «похожие объявления» для изменённых объявлений
+    "refresh-similar-advertisements": {
+        "task": "kluchik.tasks.refresh_similar_advertisements",
+        "schedule": 15 * 60,
+    },
+    # Исправление расхождений favorite_count с таблицей избранного
+    "reconcile-favorite-counts": {
+        "task": "kluchik.tasks.reconcile_favorite_counts",
+        "schedule": 60 * 60,
+    },
+}
+
+# Правки объявления в течение окна (секунды) объединяются в одно
+# уведомление ad_update каждому пользователю, добавившему его в избранное
+AD_UPDATE_NOTIFICATION_WINDOW = config(
+    "AD_UPDATE_NOTIFICATION_WINDOW", default=300, cast=int
+)
+
+# Члены этой группы (партнёрские площадки) получают выгрузку каталога
+# /api/export/ наравне с сотрудниками
+EXPORT_PARTNER_GROUP = config("EXPORT_PARTNER_GROUP", default="export-partners")
+
 # === OAUTH2 ===
 
 AUTHENTICATION_BACKENDS = (
@@ -6,8 +6,13 @@ from kluchik.views import (
     CustomTokenObtainPairViewSet,
     SetPhoneNumberView,
     AdvertisementDetailViewSet,
+    AdvertisementListViewSet,
+    AgencyAdvertisementsViewSet,
     AgencyDetailViewSet,
+    HomeView,
     NotificationStatusUpdateView,
+    AdvertisementExportView,
+    SuggestView,
     social_jwt_redirect
 )
 
@@ -27,6 +32,21 @@ urlpatterns = [
     ),  # Django Silk для профилирования
     path("sentry-debug/", trigger_error),  # Мониторинг ошибок
     path("admin/", admin.site.urls),  # Панель администратора Django
+    # Действия ленты объявлений должны стоять раньше маршрута по slug
+    path(
+        "api/advertisements/facets/",
+        AdvertisementListViewSet.as_view({"get": "facets"}),
+    ),
+    path(
+        "api/advertisements/map/",
+        AdvertisementListViewSet.as_view({"get": "map_clusters"}),
+    ),
+    # Потоковая выгрузка каталога: advertisements.ndjson / advertisements.csv
+    re_path(
+        r"^api/export/advertisements\.(?P<export_format>ndjson|csv)$",
+        AdvertisementExportView.as_view(),
+        name="advertisements-export",
+    ),
     path(
         "api/advertisements/<slug:slug>/",
         AdvertisementDetailViewSet.as_view({"get": "retrieve"}),
@@ -37,6 +57,13 @@ urlpatterns = [
         AgencyDetailViewSet.as_view({"get": "retrieve"}),
         name="agency-detail",
     ),
+    path(
+        "api/agencies/<slug:slug>/advertisements/",
+        AgencyAdvertisementsViewSet.as_view({"get": "list"}),
+        name="agency-advertisements",
+    ),
+    path("api/suggest/", SuggestView.as_view(), name="suggest"),
+    path("api/home/", HomeView.as_view(), name="home"),
     path(
         "api/notifications/<int:pk>/status",
         NotificationStatusUpdateView.as_view({"get": "retrieve"}),